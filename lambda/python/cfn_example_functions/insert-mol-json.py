@@ -9,6 +9,7 @@ import os
 import boto3
 from logger import logger
 import cfnresponse
+from utils import file_data_sql
 
 
 CFN_RESOURCE_PROPERTIES = "ResourceProperties"
@@ -70,7 +71,7 @@ def handler(event, context):
     index = 0                    
     for record in records :
         
-        mol_object = record
+        mol_object = dict(record, file_data=file_data_sql(record.get('file_data')))
         
         ## add, before the row
         index += 1
@@ -82,7 +83,7 @@ def handler(event, context):
                         '{atoms}', '{abonds}', '{bonds}', '{formula}', '{HBA1}',
                         '{HBA2}', '{HBD}', '{InChI}', '{InChIKey}' ,'{L5}',
                         '{logP}','{MP}','{MR}','{MW}','{TPSA}','{charge}',
-                        '{dim}', '{energy}','{exactmass}','{file_data}' )
+                        '{dim}', '{energy}','{exactmass}',{file_data} )
                         '''
                         
         sql_statement = sql_statement.format(**mol_object)
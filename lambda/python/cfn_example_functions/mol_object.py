@@ -9,6 +9,7 @@ import math
 import os
 import boto3
 from logger import logger
+from utils import file_data_sql
 
 CFN_REQUEST_TYPE = "RequestType"
 CFN_REQUEST_DELETE = "Delete"
@@ -89,6 +90,7 @@ def do_insert(records : list):
     for record in records :
         
         mol_object = make_defaults(record)
+        mol_object['file_data'] = file_data_sql(mol_object['file_data'])
         
         ## add, before the row
         index += 1
@@ -100,7 +102,7 @@ def do_insert(records : list):
                         {atoms}, {abonds}, {bonds}, '{formula}', {HBA1},
                         {HBA2}, {HBD}, '{InChI}', '{InChIKey}' ,{L5},
                         {logP},{MP},{MR},{MW},{TPSA},{charge},
-                        '{dim}', {energy},{exactmass},'{file_data}' )
+                        '{dim}', {energy},{exactmass},{file_data} )
                         '''
                         
         sql_statement = sql_statement.format(**mol_object)
@@ -1,3 +1,8 @@
+import binascii
+
+# Format byte of the versioned file_data of molecular_data, see sample_docking/ligand_format.py.
+LIGAND_FORMAT_ZLIB_HEX = '01'
+
 ### utils
 def isnan(x):
     return x != x
@@ -10,3 +15,14 @@ def has_value(as_dict,key):
     if isnan(tmp):
         return False
     return True
+
+
+def file_data_sql(file_data):
+    '''
+        SQL expression that stores the hex of a compressed ligand in the versioned format: the format byte followed by
+        the compressed bytes.
+    '''
+    if not file_data:
+        return "''"
+    binascii.unhexlify(file_data)  # Raises for anything but hex, which is inlined in the statement.
+    return "from_hex('" + LIGAND_FORMAT_ZLIB_HEX + file_data + "')"
@@ -9,7 +9,7 @@ import os
 from logger import logger
 import binascii
 
-import psycopg2
+import redshift_connection
 
   
 def handler(event, context):
@@ -61,23 +61,17 @@ def handler(event, context):
 def execute_sql(sql_stm, parameters = None):
     
     
-    conn_string = "dbname='dev' port='5439' user='rsadmin' password='ABCDefg1234!!' host='10.0.0.41'"
-    conn = psycopg2.connect(conn_string)
-    conn.autocommit = True
     try: 
         logger.info("execute_sql:" + sql_stm[0:200])
         
-        cursor = conn.cursor()
-        result = cursor.execute(sql_stm);
-        
-        cursor.close()
+        with redshift_connection.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql_stm, parameters)
         
     except Exception as ve:
         fail_reason = f"Encountered issue in executing sql:   {ve}"
         logger.error(fail_reason)
         raise ve
-    finally:
-        conn.close()
         
     logger.info("SQL Done!")
     
@@ -0,0 +1,174 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Pooled connections to the Redshift cluster, shared by the docking and the docking result functions through a Lambda
+# layer. It uses the psycopg2 and the logger module that are packaged with each function.
+#
+#  - Connections stay open across warm invocations, a connection that was idle for a while is checked with a
+#    `select 1` before it is handed out again.
+#  - Connections authenticate with temporary credentials from GetClusterCredentials, which are cached until shortly
+#    before they expire.
+#  - Statements that are executed for every record are prepared once per connection.
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import boto3
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+from logger import logger
+
+# Connections that are kept open when they are not used and the maximum number of connections of the container.
+IDLE_CONNECTIONS = int(os.getenv('REDSHIFT_IDLE_CONNECTIONS', '1'))
+MAX_CONNECTIONS = int(os.getenv('REDSHIFT_MAX_CONNECTIONS', '4'))
+# A connection that was used more recently than this is handed out without a round trip to the cluster.
+HEALTH_CHECK_IDLE_SECONDS = 5
+# Credentials are requested for this long and renewed this long before they expire.
+CREDENTIALS_DURATION_SECONDS = 3600
+CREDENTIALS_RENEW_SECONDS = 300
+CONNECT_TIMEOUT_SECONDS = 10
+
+redshift = boto3.client('redshift')
+
+_credentials = None
+_credentials_lock = threading.Lock()
+
+
+def get_credentials():
+    '''
+        Temporary user and password of the dbUser, cached until CREDENTIALS_RENEW_SECONDS before they expire.
+    '''
+    global _credentials
+    with _credentials_lock:
+        now = datetime.now(timezone.utc)
+        if _credentials is None or (_credentials['Expiration'] - now).total_seconds() < CREDENTIALS_RENEW_SECONDS:
+            logger.info("get cluster credentials for " + os.environ['dbUser'])
+            _credentials = redshift.get_cluster_credentials(
+                DbUser=os.environ['dbUser'],
+                DbName=os.environ['dbName'],
+                ClusterIdentifier=os.environ['clusterIdentifier'],
+                DurationSeconds=CREDENTIALS_DURATION_SECONDS,
+                AutoCreate=False,
+            )
+        return _credentials
+
+
+class RedshiftConnectionPool(ThreadedConnectionPool):
+    '''
+        ThreadedConnectionPool that connects with the cached cluster credentials, checks connections before they are
+        reused and remembers the statements that were prepared on each connection.
+    '''
+
+    def __init__(self, idle_connections, max_connections):
+        # Connections are opened on first use, up to idle_connections of them are kept open when they are put back.
+        ThreadedConnectionPool.__init__(self, 0, max_connections)
+        self.minconn = idle_connections
+        self._last_used = {}  # id(conn) -> time.monotonic() it was put back
+        self._prepared = {}  # id(conn) -> names of the prepared statements
+
+    def _connect(self, key=None):
+        credentials = get_credentials()
+        self._kwargs = {
+            'host': os.environ['endpoint_hostname'],
+            'port': os.environ['endpoint_port'],
+            'dbname': os.environ['dbName'],
+            'user': credentials['DbUser'],
+            'password': credentials['DbPassword'],
+            'sslmode': 'require',
+            'connect_timeout': CONNECT_TIMEOUT_SECONDS,
+            'keepalives': 1,
+            'keepalives_idle': 60,
+        }
+        conn = ThreadedConnectionPool._connect(self, key)
+        conn.autocommit = True
+        self._prepared[id(conn)] = set()
+        return conn
+
+    def getconn(self, key=None):
+        # Every pooled connection may be checked and discarded, after that a new connection is opened.
+        for _ in range(self.minconn + 1):
+            conn = ThreadedConnectionPool.getconn(self, key)
+            if self.is_healthy(conn):
+                return conn
+            logger.info("discard unhealthy connection")
+            self.putconn(conn, key, close=True)
+        return ThreadedConnectionPool.getconn(self, key)
+
+    def putconn(self, conn=None, key=None, close=False):
+        ThreadedConnectionPool.putconn(self, conn, key, close)
+        if conn.closed:
+            self._last_used.pop(id(conn), None)
+            self._prepared.pop(id(conn), None)
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+
+    def is_healthy(self, conn):
+        if conn.closed or conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < HEALTH_CHECK_IDLE_SECONDS:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('select 1')
+                cursor.fetchone()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"health check failed: {e}")
+            return False
+
+    def prepared_statements(self, conn):
+        return self._prepared.setdefault(id(conn), set())
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RedshiftConnectionPool(IDLE_CONNECTIONS, MAX_CONNECTIONS)
+        return _pool
+
+
+@contextmanager
+def connection():
+    '''
+        A pooled autocommit connection. It is closed instead of put back when the connection to the cluster failed.
+    '''
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        pool.putconn(conn, close=True)
+        raise
+    except Exception:
+        pool.putconn(conn)
+        raise
+    else:
+        pool.putconn(conn)
+
+
+def execute_prepared(cursor, name, statement, parameter_types, parameters):
+    '''
+        Execute a statement that is prepared once on the connection of the cursor.
+
+        Args:
+            name: Name of the prepared statement, unique per statement.
+            statement: The statement with the parameters as $1, $2, ...
+            parameter_types: The Redshift data types of the parameters, e.g. ['bigint'].
+            parameters: The values of the parameters.
+    '''
+    prepared = get_pool().prepared_statements(cursor.connection)
+    if name not in prepared:
+        cursor.execute(f"PREPARE {name} ({', '.join(parameter_types)}) AS {statement}")
+        prepared.add(name)
+    cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(parameters))})", parameters)
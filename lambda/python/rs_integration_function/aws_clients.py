@@ -0,0 +1,106 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+
+import threading
+
+import boto3
+from botocore.config import Config
+
+from rate_limiter import is_adaptive_rate_limiting_enabled, register_rate_limiting
+
+# botocore defaults to 10 connections per client, raise it when more requests are sent concurrently with one client.
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+
+_clients = {}
+_resources = {}
+_lock = threading.Lock()
+# Creates clients and resources instead of boto3 when set, see `set_client_factory`.
+_client_factory = None
+
+
+def set_client_factory(client_factory) -> None:
+    """
+    Create clients and resources with client_factory instead of boto3, e.g. to run the function against an emulator.
+    client_factory must have methods client(service_name) and resource(service_name). Clients that were already created
+    are dropped so they are created again by the new factory, None restores boto3.
+    """
+    global _client_factory
+    with _lock:
+        _client_factory = client_factory
+        _clients.clear()
+        _resources.clear()
+
+
+def _make_config(max_pool_connections: int, tcp_keepalive: bool, adaptive: bool) -> Config:
+    config_args = {'max_pool_connections': max_pool_connections}
+    if tcp_keepalive:
+        # Only pass when enabled so older botocore versions without the option keep working with the defaults.
+        config_args['tcp_keepalive'] = True
+    if adaptive:
+        # The rate limiter retries instead, see rate_limiter.
+        config_args['retries'] = {'max_attempts': 0}
+    return Config(**config_args)
+
+
+def _register_rate_limiting(client, service_name: str, adaptive: bool):
+    events = getattr(client.meta, 'events', None)
+    if events is not None:
+        register_rate_limiting(events, service_name, adaptive)
+
+
+def get_client(service_name: str, max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+               tcp_keepalive: bool = False):
+    """
+    Get a boto3 client for service_name. Clients are created on first use rather than at import time such that a cold
+    start only pays for the clients the invocation needs. They are kept for the lifetime of the container so warm
+    invocations re-use the client and its open connections. Clients are thread safe so they are shared between threads.
+
+    Args:
+        service_name: The boto3 service name e.g. 'redshift-data'.
+        max_pool_connections: Size of the connection pool of the client.
+        tcp_keepalive: Whether to enable TCP keep-alive on the connections of the client.
+    """
+    key = (service_name, max_pool_connections, tcp_keepalive)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                adaptive = is_adaptive_rate_limiting_enabled()
+                if _client_factory is not None:
+                    client = _client_factory.client(service_name)
+                else:
+                    client = boto3.client(service_name,
+                                          config=_make_config(max_pool_connections, tcp_keepalive, adaptive))
+                _register_rate_limiting(client, service_name, adaptive)
+                _clients[key] = client
+    return client
+
+
+def get_resource(service_name: str, max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+                 tcp_keepalive: bool = False):
+    """
+    Get a boto3 resource for service_name, see `get_client`. Unlike clients, resources are not thread safe so they
+    should only be used from the thread that handles the invocation.
+    """
+    key = (service_name, max_pool_connections, tcp_keepalive)
+    resource = _resources.get(key)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(key)
+            if resource is None:
+                adaptive = is_adaptive_rate_limiting_enabled()
+                if _client_factory is not None:
+                    resource = _client_factory.resource(service_name)
+                else:
+                    resource = boto3.resource(service_name,
+                                              config=_make_config(max_pool_connections, tcp_keepalive, adaptive))
+                _register_rate_limiting(resource.meta.client, service_name, adaptive)
+                _resources[key] = resource
+    return resource
+
+
+def created_clients() -> list:
+    """The service names of all clients and resources that have been created, e.g. to verify lazy creation."""
+    return [key[0] for key in list(_clients) + list(_resources)]
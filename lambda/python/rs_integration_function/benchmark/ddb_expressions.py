@@ -0,0 +1,377 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Evaluation of DynamoDB condition, key condition, projection and update expressions against items held as Python values
+(as the boto3 resource layer uses them). This covers the expression syntax used by this project:
+ - conditions: comparisons, BETWEEN, IN, AND/OR/NOT, parentheses, attribute_exists, attribute_not_exists, begins_with,
+   contains and size
+ - updates: SET (with +, -, if_not_exists and list_append), REMOVE, ADD and DELETE
+"""
+
+
+import re
+from decimal import Decimal
+from typing import Callable, List, Optional
+
+TOKEN = re.compile(r"\s*(?:(#\w+)|(:\w+)|(<>|<=|>=|[=<>(),+\-.])|([A-Za-z_]\w*))")
+COMPARATORS = ('=', '<>', '<', '<=', '>', '>=')
+MISSING = object()
+
+
+class ExpressionError(ValueError):
+    """Raised for expressions that are invalid or use syntax that is not supported."""
+
+
+def tokenize(expression: str) -> List[str]:
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN.match(expression, position)
+        if match is None:
+            raise ExpressionError(f"Unexpected input at {position} in {expression!r}")
+        tokens.append(match.group(match.lastindex))
+        position = match.end()
+    return tokens
+
+
+def to_number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return Decimal(str(value))
+    return value
+
+
+class ExpressionParser(object):
+    def __init__(self, expression: str, names: Optional[dict] = None, values: Optional[dict] = None):
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.position = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    # Token helpers
+
+    def peek(self, offset=0) -> Optional[str]:
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def next(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise ExpressionError(f"Unexpected end of {self.expression!r}")
+        self.position += 1
+        return token
+
+    def expect(self, expected: str):
+        token = self.next()
+        if token.upper() != expected.upper():
+            raise ExpressionError(f"Expected {expected} but got {token} in {self.expression!r}")
+
+    def is_keyword(self, keyword: str, offset=0) -> bool:
+        token = self.peek(offset)
+        return token is not None and token.upper() == keyword
+
+    def at_end(self) -> bool:
+        return self.position >= len(self.tokens)
+
+    # Paths and operands
+
+    def parse_path(self) -> List[str]:
+        path = [self.resolve_name(self.next())]
+        while self.peek() == '.':
+            self.next()
+            path.append(self.resolve_name(self.next()))
+        return path
+
+    def resolve_name(self, token: str) -> str:
+        if token.startswith('#'):
+            try:
+                return self.names[token]
+            except KeyError:
+                raise ExpressionError(f"Missing ExpressionAttributeNames entry for {token}")
+        if token.startswith(':') or not re.match(r'[A-Za-z_]', token):
+            raise ExpressionError(f"Expected attribute name but got {token} in {self.expression!r}")
+        return token
+
+    def parse_operand(self) -> Callable[[dict], object]:
+        token = self.peek()
+        if token is not None and token.startswith(':'):
+            self.next()
+            try:
+                value = self.values[token]
+            except KeyError:
+                raise ExpressionError(f"Missing ExpressionAttributeValues entry for {token}")
+            return lambda item: value
+        if self.is_keyword('SIZE') and self.peek(1) == '(':
+            self.next()
+            self.expect('(')
+            path = self.parse_path()
+            self.expect(')')
+
+            def size(item):
+                value = get_path(item, path)
+                return MISSING if value is MISSING else Decimal(len(value))
+            return size
+        path = self.parse_path()
+        return lambda item: get_path(item, path)
+
+    # Conditions
+
+    def parse_condition(self) -> Callable[[dict], bool]:
+        condition = self.parse_or()
+        if not self.at_end():
+            raise ExpressionError(f"Unexpected {self.peek()} in {self.expression!r}")
+        return condition
+
+    def parse_or(self):
+        left = self.parse_and()
+        while self.is_keyword('OR'):
+            self.next()
+            right = self.parse_and()
+            left = (lambda l, r: lambda item: l(item) or r(item))(left, right)
+        return left
+
+    def parse_and(self):
+        left = self.parse_not()
+        while self.is_keyword('AND'):
+            self.next()
+            right = self.parse_not()
+            left = (lambda l, r: lambda item: l(item) and r(item))(left, right)
+        return left
+
+    def parse_not(self):
+        if self.is_keyword('NOT'):
+            self.next()
+            inner = self.parse_not()
+            return lambda item: not inner(item)
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        if self.peek() == '(':
+            self.next()
+            condition = self.parse_or()
+            self.expect(')')
+            return condition
+        function = (self.peek() or '').lower()
+        if self.peek(1) == '(' and function in ('attribute_exists', 'attribute_not_exists', 'begins_with', 'contains'):
+            return self.parse_function(function)
+        left = self.parse_operand()
+        if self.peek() in COMPARATORS:
+            operator = self.next()
+            right = self.parse_operand()
+            return lambda item: compare(operator, left(item), right(item))
+        if self.is_keyword('BETWEEN'):
+            self.next()
+            low = self.parse_operand()
+            self.expect('AND')
+            high = self.parse_operand()
+            return lambda item: compare('>=', left(item), low(item)) and compare('<=', left(item), high(item))
+        if self.is_keyword('IN'):
+            self.next()
+            self.expect('(')
+            candidates = [self.parse_operand()]
+            while self.peek() == ',':
+                self.next()
+                candidates.append(self.parse_operand())
+            self.expect(')')
+            return lambda item: any(compare('=', left(item), candidate(item)) for candidate in candidates)
+        raise ExpressionError(f"Expected comparison but got {self.peek()} in {self.expression!r}")
+
+    def parse_function(self, function: str):
+        self.next()
+        self.expect('(')
+        path = self.parse_path()
+        operand = None
+        if self.peek() == ',':
+            self.next()
+            operand = self.parse_operand()
+        self.expect(')')
+        if function == 'attribute_exists':
+            return lambda item: get_path(item, path) is not MISSING
+        if function == 'attribute_not_exists':
+            return lambda item: get_path(item, path) is MISSING
+        if function == 'begins_with':
+            return lambda item: _begins_with(get_path(item, path), operand(item))
+        return lambda item: _contains(get_path(item, path), operand(item))
+
+    # Updates
+
+    def parse_update(self) -> Callable[[dict], dict]:
+        """Returns a function that gets the updated copy of an item, all values are taken from the item as it was."""
+        assignments, removals, additions, deletions = [], [], [], []
+        while not self.at_end():
+            clause = self.next().upper()
+            while True:
+                if clause == 'SET':
+                    path = self.parse_path()
+                    self.expect('=')
+                    assignments.append((path, self.parse_set_value()))
+                elif clause == 'REMOVE':
+                    removals.append(self.parse_path())
+                elif clause in ('ADD', 'DELETE'):
+                    path = self.parse_path()
+                    (additions if clause == 'ADD' else deletions).append((path, self.parse_operand()))
+                else:
+                    raise ExpressionError(f"Unsupported update clause {clause} in {self.expression!r}")
+                if self.peek() != ',':
+                    break
+                self.next()
+
+        def update(item: dict) -> dict:
+            updated = copy_value(item)
+            for path, value in assignments:
+                set_path(updated, path, copy_value(value(item)))
+            for path in removals:
+                remove_path(updated, path)
+            for path, value in additions:
+                current, addition = get_path(item, path), value(item)
+                if isinstance(addition, set):
+                    set_path(updated, path, (set() if current is MISSING else set(current)) | addition)
+                else:
+                    set_path(updated, path, (Decimal(0) if current is MISSING else to_number(current)) +
+                             to_number(addition))
+            for path, value in deletions:
+                current = get_path(item, path)
+                if current is not MISSING:
+                    remaining = set(current) - value(item)
+                    if remaining:
+                        set_path(updated, path, remaining)
+                    else:
+                        remove_path(updated, path)
+            return updated
+        return update
+
+    def parse_set_value(self):
+        left = self.parse_set_term()
+        if self.peek() in ('+', '-'):
+            operator = self.next()
+            right = self.parse_set_term()
+            if operator == '+':
+                return lambda item: to_number(left(item)) + to_number(right(item))
+            return lambda item: to_number(left(item)) - to_number(right(item))
+        return left
+
+    def parse_set_term(self):
+        function = (self.peek() or '').lower()
+        if function == 'if_not_exists' and self.peek(1) == '(':
+            self.next()
+            self.expect('(')
+            path = self.parse_path()
+            self.expect(',')
+            default = self.parse_operand()
+            self.expect(')')
+
+            def if_not_exists(item):
+                value = get_path(item, path)
+                return default(item) if value is MISSING else value
+            return if_not_exists
+        if function == 'list_append' and self.peek(1) == '(':
+            self.next()
+            self.expect('(')
+            first = self.parse_operand()
+            self.expect(',')
+            second = self.parse_operand()
+            self.expect(')')
+            return lambda item: list(first(item)) + list(second(item))
+        return self.parse_operand()
+
+    # Projections
+
+    def parse_projection(self) -> List[List[str]]:
+        paths = [self.parse_path()]
+        while self.peek() == ',':
+            self.next()
+            paths.append(self.parse_path())
+        if not self.at_end():
+            raise ExpressionError(f"Unexpected {self.peek()} in {self.expression!r}")
+        return paths
+
+    def find_equality(self, attribute_name: str):
+        """The value a key condition requires attribute_name to be equal to, or MISSING."""
+        for index, token in enumerate(self.tokens[:-2]):
+            if self.tokens[index + 1] != '=':
+                continue
+            left, right = token, self.tokens[index + 2]
+            for name, value in ((left, right), (right, left)):
+                if value.startswith(':') and not name.startswith(':') and \
+                        self.names.get(name, name) == attribute_name:
+                    return self.values[value]
+        return MISSING
+
+
+def compare(operator: str, left, right) -> bool:
+    if left is MISSING or right is MISSING:
+        return False
+    left, right = to_number(left), to_number(right)
+    if operator == '=':
+        return left == right
+    if operator == '<>':
+        return left != right
+    if type(left) != type(right):
+        return False
+    if operator == '<':
+        return left < right
+    if operator == '<=':
+        return left <= right
+    if operator == '>':
+        return left > right
+    return left >= right
+
+
+def _begins_with(value, prefix) -> bool:
+    return isinstance(value, (str, bytes)) and isinstance(prefix, type(value)) and value.startswith(prefix)
+
+
+def _contains(value, operand) -> bool:
+    if value is MISSING:
+        return False
+    try:
+        return operand in value
+    except TypeError:
+        return False
+
+
+def get_path(item: dict, path: List[str]):
+    value = item
+    for name in path:
+        if not isinstance(value, dict) or name not in value:
+            return MISSING
+        value = value[name]
+    return value
+
+
+def set_path(item: dict, path: List[str], value) -> None:
+    parent = get_path(item, path[:-1]) if len(path) > 1 else item
+    if not isinstance(parent, dict):
+        raise ExpressionError(f"The document path {'.'.join(path)} is invalid for update")
+    parent[path[-1]] = value
+
+
+def remove_path(item: dict, path: List[str]) -> None:
+    parent = get_path(item, path[:-1]) if len(path) > 1 else item
+    if isinstance(parent, dict):
+        parent.pop(path[-1], None)
+
+
+def copy_value(value):
+    """Copy an item such that changes to the copy don't affect the stored item."""
+    if isinstance(value, dict):
+        return {name: copy_value(nested) for name, nested in value.items()}
+    if isinstance(value, list):
+        return [copy_value(nested) for nested in value]
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+
+def project(item: dict, paths: List[List[str]]) -> dict:
+    projected = {}
+    for path in paths:
+        value = get_path(item, path)
+        if value is MISSING:
+            continue
+        target = projected
+        for name in path[:-1]:
+            target = target.setdefault(name, {})
+        target[path[-1]] = copy_value(value)
+    return projected
@@ -0,0 +1,878 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+In-process emulator of the AWS APIs used by this function: the Redshift Data API, the DynamoDB state table, Step
+Functions callbacks, the SQS queue of finished events, the S3 result bucket and CloudFormation custom resource
+responses. It lets `index.handler` run end to end without AWS, e.g. to benchmark the handler locally or in CI.
+
+ - Latency: every call sleeps for a configurable time per operation (seconds or a function returning seconds).
+ - Errors: every operation can fail with a configurable rate and error code.
+ - Statements: run for a configurable duration, fail with a configurable rate and have a configurable result.
+ - Finished events: statements submitted with WithEvent produce the Data API event on an in-memory SQS queue once they
+   complete (plus a configurable delivery delay). `deliver_finished_events` hands them to a handler the way the SQS
+   event source mapping of Lambda does.
+
+Usage:
+    emulator = Emulator(latency={'redshift-data': 0.02}, statement_duration=0.1)
+    with emulator.installed():
+        index.handler({'sqlStatement': 'select 1', 'taskToken': 'token', 'executionArn': execution_arn}, None)
+        emulator.wait_for_finished_events(1)
+        emulator.deliver_finished_events(index.handler)
+    assert emulator.stepfunctions.task_results['token']['status'] == 'SUCCEEDED'
+"""
+
+
+import heapq
+import io
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from botocore.exceptions import ClientError
+from botocore.hooks import HierarchicalEmitter, first_non_none_response
+
+from benchmark.ddb_expressions import ExpressionParser, MISSING, copy_value, project
+
+Latency = Union[float, Callable[[], float]]
+
+ACCOUNT_ID = '123456789012'
+REGION = 'eu-west-1'
+FINISHED_EVENTS_QUEUE_ARN = f'arn:aws:sqs:{REGION}:{ACCOUNT_ID}:finished-data-api-events'
+DEFAULT_COLUMN_METADATA = [{'name': '?column?', 'typeName': 'int4'}]
+DEFAULT_RECORDS = [[{'longValue': 1}]]
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class EmulatedExceptions(object):
+    """The `client.exceptions` of an emulated client, every error code is a ClientError subclass."""
+
+    def __init__(self, error_codes: List[str]):
+        self._classes = {}
+        for error_code in error_codes:
+            self.get(error_code)
+
+    def get(self, error_code: str) -> type:
+        if error_code not in self._classes:
+            self._classes[error_code] = type(error_code, (ClientError,), {})
+        return self._classes[error_code]
+
+    def __getattr__(self, error_code: str) -> type:
+        if error_code.startswith('_'):
+            raise AttributeError(error_code)
+        return self.get(error_code)
+
+    def error(self, error_code: str, message: str, operation_name: str) -> ClientError:
+        return self.get(error_code)({'Error': {'Code': error_code, 'Message': message}}, operation_name)
+
+
+class EmulatedService(object):
+    """Base of the emulated clients, it applies the configured latency and errors and counts calls."""
+    service_name = None
+    error_codes = []
+    throttling_error_code = 'ThrottlingException'
+
+    def __init__(self, emulator: 'Emulator'):
+        self.emulator = emulator
+        self.exceptions = EmulatedExceptions(self.error_codes)
+        self.meta = SimpleNamespace(client=self, service_model=SimpleNamespace(service_name=self.service_name),
+                                    events=HierarchicalEmitter())
+
+    def _call(self, operation_name: str):
+        self.emulator.before_call(self, operation_name)
+
+    def _error(self, error_code: str, message: str, operation_name: str) -> ClientError:
+        return self.exceptions.error(error_code, message, operation_name)
+
+
+class EmulatedStatement(object):
+    def __init__(self, statement_id: str, statement_name: Optional[str], query_string: str, with_event: bool,
+                 duration: float, error: Optional[str], sub_statements: int, has_result_set: bool):
+        self.id = statement_id
+        self.name = statement_name
+        self.query_string = query_string
+        self.with_event = with_event
+        self.created_at = utc_now()
+        self.started = time.monotonic()
+        self.duration = duration
+        self.error = error
+        self.sub_statements = sub_statements
+        self.has_result_set = has_result_set
+        self.aborted_after = None
+        self.event_sent = False
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def completes_after(self) -> float:
+        return self.aborted_after if self.aborted_after is not None else self.duration
+
+    def get_status(self) -> str:
+        if self.aborted_after is not None:
+            return 'ABORTED'
+        if self.elapsed() < self.duration:
+            return 'STARTED'
+        return 'FAILED' if self.error else 'FINISHED'
+
+    def is_active(self) -> bool:
+        return self.get_status() == 'STARTED'
+
+    def updated_at(self) -> datetime:
+        return self.created_at + timedelta(seconds=min(self.elapsed(), self.completes_after()))
+
+
+class EmulatedRedshiftData(EmulatedService):
+    service_name = 'redshift-data'
+    error_codes = ['ValidationException', 'ResourceNotFoundException', 'ActiveStatementsExceededException',
+                   'ExecuteStatementException', 'InternalServerException']
+
+    def __init__(self, emulator: 'Emulator'):
+        super(EmulatedRedshiftData, self).__init__(emulator)
+        self.statements = {}  # type: Dict[str, EmulatedStatement]
+
+    def _submit(self, operation_name: str, statement_name: Optional[str], sql: str, with_event: bool,
+                sub_statements: int) -> dict:
+        self._call(operation_name)
+        emulator = self.emulator
+        error = None
+        if emulator.random() < emulator.statement_failure_rate:
+            error = 'ERROR: emulated statement failure'
+        statement = EmulatedStatement(
+            str(uuid.uuid4()), statement_name, sql, with_event, emulator.get_statement_duration(sql), error,
+            sub_statements, has_result_set=sql.lstrip().lower().startswith(('select', 'with', 'show'))
+        )
+        with emulator.lock:
+            self.statements[statement.id] = statement
+            if with_event:
+                emulator.schedule_finished_event(statement)
+        response = {'Id': statement.id, 'CreatedAt': statement.created_at, 'Database': 'emulated'}
+        if statement_name is not None:
+            response['StatementName'] = statement_name
+        return response
+
+    def execute_statement(self, Sql: str, StatementName: str = None, WithEvent: bool = False, Parameters=None,
+                          **_kwargs) -> dict:
+        return self._submit('ExecuteStatement', StatementName, Sql, WithEvent, 0)
+
+    def batch_execute_statement(self, Sqls: List[str], StatementName: str = None, WithEvent: bool = False,
+                                **_kwargs) -> dict:
+        return self._submit('BatchExecuteStatement', StatementName, ';\n'.join(Sqls), WithEvent, len(Sqls))
+
+    def _get_statement(self, statement_id: str, operation_name: str) -> EmulatedStatement:
+        try:
+            return self.statements[statement_id]
+        except KeyError:
+            raise self._error('ResourceNotFoundException', f'Query {statement_id} does not exist.', operation_name)
+
+    def describe_statement(self, Id: str) -> dict:
+        self._call('DescribeStatement')
+        statement = self._get_statement(Id, 'DescribeStatement')
+        status = statement.get_status()
+        description = {
+            'Id': statement.id,
+            'Status': status,
+            'QueryString': statement.query_string,
+            'CreatedAt': statement.created_at,
+            'UpdatedAt': statement.updated_at(),
+            'Duration': int(min(statement.elapsed(), statement.completes_after()) * 10 ** 9),
+            'HasResultSet': statement.has_result_set and status == 'FINISHED',
+            'ResultRows': len(self.emulator.get_result(statement.query_string)[1]) if status == 'FINISHED' else -1,
+            'RedshiftQueryId': abs(hash(statement.id)) % 10 ** 6,
+        }
+        if status == 'FAILED':
+            description['Error'] = statement.error
+        return description
+
+    def get_statement_result(self, Id: str, NextToken: str = None) -> dict:
+        self._call('GetStatementResult')
+        statement = self._get_statement(Id, 'GetStatementResult')
+        if statement.get_status() != 'FINISHED' or not statement.has_result_set:
+            raise self._error('ValidationException', 'Query does not have result. Please check query status.',
+                              'GetStatementResult')
+        column_metadata, records = self.emulator.get_result(statement.query_string)
+        start = int(NextToken) if NextToken else 0
+        end = start + self.emulator.result_page_size
+        response = {'ColumnMetadata': column_metadata, 'Records': records[start:end], 'TotalNumRows': len(records)}
+        if end < len(records):
+            response['NextToken'] = str(end)
+        return response
+
+    def cancel_statement(self, Id: str) -> dict:
+        self._call('CancelStatement')
+        statement = self._get_statement(Id, 'CancelStatement')
+        with self.emulator.lock:
+            if not statement.is_active():
+                raise self._error('ValidationException', f'Could not cancel a query that is already in '
+                                                         f'{statement.get_status()} state.', 'CancelStatement')
+            statement.aborted_after = statement.elapsed()
+            if statement.with_event:
+                self.emulator.schedule_finished_event(statement)
+        return {'Status': True}
+
+    def list_statements(self, StatementName: str = None, Status: str = 'ALL', MaxResults: int = 100,
+                        **_kwargs) -> dict:
+        self._call('ListStatements')
+        statements = []
+        for statement in sorted(self.statements.values(), key=lambda s: s.created_at, reverse=True):
+            if StatementName is not None and not (statement.name or '').startswith(StatementName):
+                continue
+            status = statement.get_status()
+            if Status != 'ALL' and status != Status:
+                continue
+            statements.append({
+                'Id': statement.id,
+                'StatementName': statement.name,
+                'Status': status,
+                'QueryString': statement.query_string,
+                'CreatedAt': statement.created_at,
+                'UpdatedAt': statement.updated_at(),
+            })
+        return {'Statements': statements[:MaxResults]}
+
+
+class EmulatedTable(object):
+    """The boto3 Table resource of the emulated DynamoDB."""
+
+    def __init__(self, dynamodb: 'EmulatedDynamoDB', name: str):
+        self.dynamodb = dynamodb
+        self.name = name
+        self.table_name = name
+        self.meta = SimpleNamespace(client=dynamodb)
+
+    def put_item(self, **kwargs):
+        return self.dynamodb.put_item(TableName=self.name, **kwargs)
+
+    def get_item(self, **kwargs):
+        return self.dynamodb.get_item(TableName=self.name, **kwargs)
+
+    def update_item(self, **kwargs):
+        return self.dynamodb.update_item(TableName=self.name, **kwargs)
+
+    def delete_item(self, **kwargs):
+        return self.dynamodb.delete_item(TableName=self.name, **kwargs)
+
+    def query(self, **kwargs):
+        return self.dynamodb.query(TableName=self.name, **kwargs)
+
+
+class EmulatedDynamoDB(EmulatedService):
+    """
+    DynamoDB holding items as Python values, as both the boto3 resource and its `meta.client` use them. Tables are
+    created on first use with the key schema of the state table.
+    """
+    service_name = 'dynamodb'
+    error_codes = ['ConditionalCheckFailedException', 'ProvisionedThroughputExceededException',
+                   'ThrottlingException', 'ValidationException', 'ResourceNotFoundException',
+                   'TransactionConflictException', 'InternalServerError']
+    throttling_error_code = 'ProvisionedThroughputExceededException'
+
+    def __init__(self, emulator: 'Emulator', partition_key: str, sort_key: str):
+        super(EmulatedDynamoDB, self).__init__(emulator)
+        self.partition_key = partition_key
+        self.sort_key = sort_key
+        self.tables = {}  # type: Dict[str, Dict[str, Dict[str, dict]]]
+
+    # Resource API
+
+    def Table(self, name: str) -> EmulatedTable:
+        return EmulatedTable(self, name)
+
+    # Helpers
+
+    def _partitions(self, table_name: str) -> Dict[str, Dict[str, dict]]:
+        return self.tables.setdefault(table_name, {})
+
+    def _key(self, key: dict, operation_name: str) -> Tuple[str, str]:
+        if set(key) != {self.partition_key, self.sort_key}:
+            raise self._error('ValidationException', 'The provided key element does not match the schema',
+                              operation_name)
+        return key[self.partition_key], key[self.sort_key]
+
+    def _get(self, table_name: str, key: Tuple[str, str]) -> Optional[dict]:
+        return self._partitions(table_name).get(key[0], {}).get(key[1])
+
+    def _store(self, table_name: str, item: dict):
+        validate_item(item)
+        partition = self._partitions(table_name).setdefault(item[self.partition_key], {})
+        partition[item[self.sort_key]] = item
+
+    def _remove(self, table_name: str, key: Tuple[str, str]):
+        partition = self._partitions(table_name).get(key[0], {})
+        partition.pop(key[1], None)
+
+    def _check_condition(self, kwargs: dict, item: Optional[dict], operation_name: str):
+        condition_expression = kwargs.get('ConditionExpression')
+        if condition_expression is None:
+            return
+        parser = ExpressionParser(condition_expression, kwargs.get('ExpressionAttributeNames'),
+                                  kwargs.get('ExpressionAttributeValues'))
+        if not parser.parse_condition()(item or {}):
+            raise self._error('ConditionalCheckFailedException', 'The conditional request failed', operation_name)
+
+    @classmethod
+    def _with_capacity(cls, response: dict, kwargs: dict, table_name: str, items: List[Optional[dict]],
+                       is_write: bool) -> dict:
+        if kwargs.get('ReturnConsumedCapacity', 'NONE') == 'NONE':
+            return response
+        unit_size = 1024 if is_write else 4096
+        capacity_units = sum(max(1, math.ceil(item_size(item) / unit_size)) for item in items) or 1
+        if not is_write and not kwargs.get('ConsistentRead', False):
+            capacity_units /= 2
+        response['ConsumedCapacity'] = {'TableName': table_name, 'CapacityUnits': float(capacity_units)}
+        return response
+
+    # Client API
+
+    def put_item(self, TableName: str, Item: dict, **kwargs) -> dict:
+        self._call('PutItem')
+        with self.emulator.lock:
+            key = self._key({self.partition_key: Item.get(self.partition_key), self.sort_key: Item.get(self.sort_key)},
+                            'PutItem')
+            old_item = self._get(TableName, key)
+            self._check_condition(kwargs, old_item, 'PutItem')
+            self._store(TableName, copy_value(Item))
+        response = {}
+        if kwargs.get('ReturnValues') == 'ALL_OLD' and old_item is not None:
+            response['Attributes'] = copy_value(old_item)
+        return self._with_capacity(response, kwargs, TableName, [Item], is_write=True)
+
+    def get_item(self, TableName: str, Key: dict, AttributesToGet: List[str] = None,
+                 ProjectionExpression: str = None, ExpressionAttributeNames: dict = None, **kwargs) -> dict:
+        self._call('GetItem')
+        with self.emulator.lock:
+            item = self._get(TableName, self._key(Key, 'GetItem'))
+            item = copy_value(item) if item is not None else None
+        response = {}
+        if item is not None:
+            response['Item'] = projected(item, AttributesToGet, ProjectionExpression, ExpressionAttributeNames)
+        return self._with_capacity(response, kwargs, TableName, [item], is_write=False)
+
+    def update_item(self, TableName: str, Key: dict, UpdateExpression: str, **kwargs) -> dict:
+        self._call('UpdateItem')
+        update = ExpressionParser(UpdateExpression, kwargs.get('ExpressionAttributeNames'),
+                                  kwargs.get('ExpressionAttributeValues')).parse_update()
+        with self.emulator.lock:
+            key = self._key(Key, 'UpdateItem')
+            old_item = self._get(TableName, key)
+            self._check_condition(kwargs, old_item, 'UpdateItem')
+            new_item = update(old_item if old_item is not None else copy_value(Key))
+            new_item.update(Key)
+            self._store(TableName, new_item)
+        response = {}
+        return_values = kwargs.get('ReturnValues', 'NONE')
+        if return_values == 'ALL_OLD' and old_item is not None:
+            response['Attributes'] = copy_value(old_item)
+        elif return_values == 'ALL_NEW':
+            response['Attributes'] = copy_value(new_item)
+        return self._with_capacity(response, kwargs, TableName, [new_item], is_write=True)
+
+    def delete_item(self, TableName: str, Key: dict, **kwargs) -> dict:
+        self._call('DeleteItem')
+        with self.emulator.lock:
+            key = self._key(Key, 'DeleteItem')
+            old_item = self._get(TableName, key)
+            self._check_condition(kwargs, old_item, 'DeleteItem')
+            self._remove(TableName, key)
+        response = {}
+        if kwargs.get('ReturnValues') == 'ALL_OLD' and old_item is not None:
+            response['Attributes'] = copy_value(old_item)
+        return self._with_capacity(response, kwargs, TableName, [old_item], is_write=True)
+
+    def query(self, TableName: str, KeyConditionExpression, ExpressionAttributeNames: dict = None,
+              ExpressionAttributeValues: dict = None, ScanIndexForward: bool = True, Limit: int = None,
+              ProjectionExpression: str = None, FilterExpression: str = None, ExclusiveStartKey: dict = None,
+              **kwargs) -> dict:
+        self._call('Query')
+        names, values = dict(ExpressionAttributeNames or {}), dict(ExpressionAttributeValues or {})
+        if not isinstance(KeyConditionExpression, str):
+            from boto3.dynamodb.conditions import ConditionExpressionBuilder
+            built = ConditionExpressionBuilder().build_expression(KeyConditionExpression, is_key_condition=True)
+            KeyConditionExpression = built.condition_expression
+            names.update(built.attribute_name_placeholders)
+            values.update(built.attribute_value_placeholders)
+        key_parser = ExpressionParser(KeyConditionExpression, names, values)
+        partition_value = key_parser.find_equality(self.partition_key)
+        if partition_value is MISSING:
+            raise self._error('ValidationException', 'Query condition missed key schema element', 'Query')
+        key_condition = key_parser.parse_condition()
+        filter_condition = None
+        if FilterExpression is not None:
+            filter_condition = ExpressionParser(FilterExpression, names, values).parse_condition()
+        with self.emulator.lock:
+            partition = self._partitions(TableName).get(partition_value, {})
+            candidates = [copy_value(partition[sort_value]) for sort_value in sorted(partition,
+                                                                                     reverse=not ScanIndexForward)]
+        if ExclusiveStartKey is not None:
+            start = ExclusiveStartKey[self.sort_key]
+            candidates = [item for item in candidates
+                          if (item[self.sort_key] > start if ScanIndexForward else item[self.sort_key] < start)]
+        items, evaluated = [], []
+        for item in candidates:
+            if Limit is not None and len(evaluated) >= Limit:
+                break
+            if not key_condition(item):
+                continue
+            evaluated.append(item)
+            if filter_condition is None or filter_condition(item):
+                items.append(item)
+        response = {
+            'Items': [projected(item, None, ProjectionExpression, names) for item in items],
+            'Count': len(items),
+            'ScannedCount': len(evaluated),
+        }
+        if Limit is not None and len(evaluated) == Limit and evaluated[-1] is not candidates[-1]:
+            last = evaluated[-1]
+            response['LastEvaluatedKey'] = {self.partition_key: last[self.partition_key],
+                                            self.sort_key: last[self.sort_key]}
+        return self._with_capacity(response, kwargs, TableName, [{'size': sum(map(item_size, evaluated))}],
+                                   is_write=False)
+
+    def batch_get_item(self, RequestItems: dict, **kwargs) -> dict:
+        self._call('BatchGetItem')
+        responses, capacity = {}, []
+        for table_name, request in RequestItems.items():
+            if len(request['Keys']) > 100:
+                raise self._error('ValidationException', 'Too many items requested for the BatchGetItem call',
+                                  'BatchGetItem')
+            items = []
+            with self.emulator.lock:
+                for key in request['Keys']:
+                    item = self._get(table_name, self._key(key, 'BatchGetItem'))
+                    if item is not None:
+                        items.append(projected(copy_value(item), request.get('AttributesToGet'),
+                                               request.get('ProjectionExpression'),
+                                               request.get('ExpressionAttributeNames')))
+            responses[table_name] = items
+            capacity.append(self._with_capacity({}, dict(kwargs, ConsistentRead=request.get('ConsistentRead')),
+                                                table_name, items, is_write=False).get('ConsumedCapacity'))
+        response = {'Responses': responses, 'UnprocessedKeys': {}}
+        if kwargs.get('ReturnConsumedCapacity', 'NONE') != 'NONE':
+            response['ConsumedCapacity'] = capacity
+        return response
+
+    def batch_write_item(self, RequestItems: dict, **kwargs) -> dict:
+        self._call('BatchWriteItem')
+        capacity = []
+        for table_name, requests in RequestItems.items():
+            if len(requests) > 25:
+                raise self._error('ValidationException', 'Too many items requested for the BatchWriteItem call',
+                                  'BatchWriteItem')
+            written = []
+            with self.emulator.lock:
+                for request in requests:
+                    if 'PutRequest' in request:
+                        item = copy_value(request['PutRequest']['Item'])
+                        self._key({self.partition_key: item.get(self.partition_key),
+                                   self.sort_key: item.get(self.sort_key)}, 'BatchWriteItem')
+                        self._store(table_name, item)
+                        written.append(item)
+                    else:
+                        self._remove(table_name, self._key(request['DeleteRequest']['Key'], 'BatchWriteItem'))
+                        written.append(None)
+            capacity.append(self._with_capacity({}, kwargs, table_name, written, is_write=True).get('ConsumedCapacity'))
+        response = {'UnprocessedItems': {}}
+        if kwargs.get('ReturnConsumedCapacity', 'NONE') != 'NONE':
+            response['ConsumedCapacity'] = capacity
+        return response
+
+    def items(self, table_name: str) -> List[dict]:
+        """All items of a table, to inspect the state after a run."""
+        with self.emulator.lock:
+            return [copy_value(item) for partition in self._partitions(table_name).values()
+                    for item in partition.values()]
+
+
+class EmulatedStepFunctions(EmulatedService):
+    service_name = 'stepfunctions'
+    error_codes = ['TaskTimedOut', 'TaskDoesNotExist', 'InvalidToken', 'InvalidOutput', 'ThrottlingException']
+
+    def __init__(self, emulator: 'Emulator'):
+        super(EmulatedStepFunctions, self).__init__(emulator)
+        self.task_results = {}  # type: Dict[str, dict]
+
+    def _complete(self, operation_name: str, task_token: str, result: dict) -> dict:
+        self._call(operation_name)
+        with self.emulator.lock:
+            if task_token in self.task_results:
+                raise self._error('TaskTimedOut', 'Task Timed Out: Provided task has already been completed',
+                                  operation_name)
+            self.task_results[task_token] = dict(result, completed_at=utc_now())
+        return {}
+
+    def send_task_success(self, taskToken: str, output: str) -> dict:
+        json.loads(output)
+        return self._complete('SendTaskSuccess', taskToken, {'status': 'SUCCEEDED', 'output': output})
+
+    def send_task_failure(self, taskToken: str, error: str = None, cause: str = None) -> dict:
+        return self._complete('SendTaskFailure', taskToken, {'status': 'FAILED', 'error': error, 'cause': cause})
+
+
+class EmulatedSQS(EmulatedService):
+    service_name = 'sqs'
+    error_codes = ['ReceiptHandleIsInvalid', 'QueueDoesNotExist']
+
+    def __init__(self, emulator: 'Emulator'):
+        super(EmulatedSQS, self).__init__(emulator)
+        # The partial batch processor builds the queue URL from the endpoint of its client.
+        self._endpoint = SimpleNamespace(host=f'https://sqs.{REGION}.amazonaws.com')
+        self.deleted_receipt_handles = set()
+
+    def delete_message_batch(self, QueueUrl: str, Entries: List[dict]) -> dict:
+        self._call('DeleteMessageBatch')
+        with self.emulator.lock:
+            for entry in Entries:
+                self.deleted_receipt_handles.add(entry['ReceiptHandle'])
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries], 'Failed': []}
+
+
+class EmulatedS3(EmulatedService):
+    service_name = 's3'
+    error_codes = ['NoSuchKey', 'NoSuchBucket']
+
+    def __init__(self, emulator: 'Emulator'):
+        super(EmulatedS3, self).__init__(emulator)
+        self.objects = {}  # type: Dict[Tuple[str, str], bytes]
+
+    def put_object(self, Bucket: str, Key: str, Body, **_kwargs) -> dict:
+        self._call('PutObject')
+        body = Body if isinstance(Body, bytes) else Body.encode('utf-8') if isinstance(Body, str) else Body.read()
+        with self.emulator.lock:
+            self.objects[(Bucket, Key)] = body
+        return {'ETag': f'"{uuid.uuid4().hex}"'}
+
+    def get_object(self, Bucket: str, Key: str, **_kwargs) -> dict:
+        self._call('GetObject')
+        try:
+            body = self.objects[(Bucket, Key)]
+        except KeyError:
+            raise self._error('NoSuchKey', 'The specified key does not exist.', 'GetObject')
+        return {'Body': io.BytesIO(body), 'ContentLength': len(body)}
+
+
+class EmulatedCfnResponses(object):
+    """Stands in for the HTTP pool used to send custom resource responses to CloudFormation."""
+
+    def __init__(self, emulator: 'Emulator'):
+        self.emulator = emulator
+        self.responses = {}  # type: Dict[str, dict]
+
+    def request(self, method: str, url: str, headers: dict = None, body: str = None, **_kwargs):
+        self.emulator.before_call(SimpleNamespace(service_name='cloudformation'), 'CustomResourceResponse')
+        with self.emulator.lock:
+            self.responses[url] = json.loads(body)
+        return SimpleNamespace(status=200, reason='OK')
+
+
+class Emulator(object):
+    def __init__(self,
+                 latency: Optional[Dict[str, Latency]] = None,
+                 errors: Optional[Dict[str, Tuple[float, str]]] = None,
+                 statement_duration: Union[float, Callable[[str], float]] = 0.05,
+                 statement_failure_rate: float = 0.0,
+                 result: Optional[Callable[[str], Tuple[list, list]]] = None,
+                 result_page_size: int = 1000,
+                 event_delay: float = 0.0,
+                 throughput_limits: Optional[Dict[str, float]] = None,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            latency: Seconds each call sleeps, or a function returning it, keyed by '<service>.<Operation>' (e.g.
+                     'dynamodb.PutItem') or '<service>' for all operations of a service.
+            errors: (rate, error code) keyed like latency, e.g. {'stepfunctions': (0.01, 'ThrottlingException')}.
+            statement_duration: Seconds a statement runs, or a function of the SQL text returning it.
+            statement_failure_rate: Fraction of statements that fail.
+            result: Function of the SQL text returning (ColumnMetadata, Records) of its result.
+            result_page_size: Number of records per GetStatementResult page.
+            event_delay: Seconds between the completion of a statement and its finished event being on the queue.
+            throughput_limits: Calls per second keyed like latency, calls above it within a second are throttled. Unlike
+                               errors, throttles then depend on the rate calls are made at like in AWS.
+            seed: Seed for the random numbers used for error injection.
+        """
+        from ddb import DDB_ID, DDB_INVOCATION_ID
+        self.latency = latency or {}
+        self.errors = errors or {}
+        self.throughput_limits = throughput_limits or {}
+        self._recent_calls = defaultdict(deque)  # Throughput limit key -> times of the calls in the last second
+        self.statement_duration = statement_duration
+        self.statement_failure_rate = statement_failure_rate
+        self.result = result
+        self.result_page_size = result_page_size
+        self.event_delay = event_delay
+        self._random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.calls = Counter()
+        self._finished_events = []  # Heap of (visible at, sequence, statement id)
+        self._event_sequence = 0
+        self._queue = []
+        self.redshift_data = EmulatedRedshiftData(self)
+        self.dynamodb = EmulatedDynamoDB(self, DDB_ID, DDB_INVOCATION_ID)
+        self.stepfunctions = EmulatedStepFunctions(self)
+        self.sqs = EmulatedSQS(self)
+        self.s3 = EmulatedS3(self)
+        self.cfn = EmulatedCfnResponses(self)
+        self._clients = {service.service_name: service for service in
+                         (self.redshift_data, self.dynamodb, self.stepfunctions, self.sqs, self.s3)}
+
+    # Client factory, see aws_clients.set_client_factory
+
+    def client(self, service_name: str):
+        try:
+            return self._clients[service_name]
+        except KeyError:
+            raise NotImplementedError(f"The emulator has no {service_name} client")
+
+    def resource(self, service_name: str):
+        if service_name != 'dynamodb':
+            raise NotImplementedError(f"The emulator has no {service_name} resource")
+        return self.dynamodb
+
+    def install(self):
+        """Make the function use the emulator for all AWS calls."""
+        import aws_clients
+        import callback_sources.cfnresponse as cfn_response
+        from ddb import ddb_state_table
+        aws_clients.set_client_factory(self)
+        ddb_state_table.get_ddb_state_table.cache_clear()
+        self._cfn_http, cfn_response.http = cfn_response.http, self.cfn
+
+    def uninstall(self):
+        import aws_clients
+        import callback_sources.cfnresponse as cfn_response
+        from ddb import ddb_state_table
+        aws_clients.set_client_factory(None)
+        ddb_state_table.get_ddb_state_table.cache_clear()
+        cfn_response.http = self._cfn_http
+
+    @contextmanager
+    def installed(self):
+        self.install()
+        try:
+            yield self
+        finally:
+            self.uninstall()
+
+    # Configuration
+
+    def random(self) -> float:
+        with self.lock:
+            return self._random.random()
+
+    def _lookup(self, configuration: dict, service_name: str, operation_name: str):
+        return configuration.get(f'{service_name}.{operation_name}', configuration.get(service_name))
+
+    def before_call(self, service, operation_name: str):
+        """
+        Apply the latency and errors of a call. Like botocore every attempt emits `before-send` and `needs-retry` on the
+        events of the client, a needs-retry handler that returns a delay has the attempt retried after it.
+        """
+        events = getattr(getattr(service, 'meta', None), 'events', None)
+        attempts = 0
+        while True:
+            attempts += 1
+            if events is not None:
+                events.emit(f'before-send.{service.service_name}.{operation_name}', request=None)
+            error = self._attempt(service, operation_name)
+            if events is None:
+                delay = None
+            else:
+                response = (SimpleNamespace(status_code=200 if error is None else 400),
+                            {} if error is None else error.response)
+                delay = first_non_none_response(events.emit(
+                    f'needs-retry.{service.service_name}.{operation_name}', response=response, endpoint=None,
+                    operation=SimpleNamespace(name=operation_name), attempts=attempts, caught_exception=None,
+                    request_dict={}
+                ))
+            if delay is None:
+                if error is not None:
+                    raise error
+                return
+            time.sleep(delay)
+
+    def _attempt(self, service, operation_name: str) -> Optional[ClientError]:
+        service_name = service.service_name
+        with self.lock:
+            self.calls[f'{service_name}.{operation_name}'] += 1
+        latency = self._lookup(self.latency, service_name, operation_name)
+        if latency is not None:
+            seconds = latency() if callable(latency) else latency
+            if seconds > 0:
+                time.sleep(seconds)
+        error = self._lookup(self.errors, service_name, operation_name)
+        if error is not None and self.random() < error[0]:
+            return service.exceptions.error(error[1], f'Emulated {error[1]}', operation_name)
+        if self._exceeds_throughput_limit(service_name, operation_name):
+            error_code = service.throttling_error_code
+            return service.exceptions.error(error_code, f'Emulated {error_code}', operation_name)
+        return None
+
+    def _exceeds_throughput_limit(self, service_name: str, operation_name: str) -> bool:
+        key = f'{service_name}.{operation_name}'
+        if key not in self.throughput_limits:
+            key = service_name
+            if key not in self.throughput_limits:
+                return False
+        now = time.monotonic()
+        with self.lock:
+            recent_calls = self._recent_calls[key]
+            while recent_calls and recent_calls[0] <= now - 1.0:
+                recent_calls.popleft()
+            if len(recent_calls) >= self.throughput_limits[key]:
+                return True
+            recent_calls.append(now)
+            return False
+
+    def get_statement_duration(self, sql: str) -> float:
+        return self.statement_duration(sql) if callable(self.statement_duration) else self.statement_duration
+
+    def get_result(self, sql: str) -> Tuple[list, list]:
+        if self.result is None:
+            return DEFAULT_COLUMN_METADATA, DEFAULT_RECORDS
+        return self.result(sql)
+
+    # Finished events
+
+    def schedule_finished_event(self, statement: EmulatedStatement):
+        visible_at = statement.started + statement.completes_after() + self.event_delay
+        self._event_sequence += 1
+        heapq.heappush(self._finished_events, (visible_at, self._event_sequence, statement.id))
+
+    def _enqueue_finished_events(self):
+        now = time.monotonic()
+        with self.lock:
+            while self._finished_events and self._finished_events[0][0] <= now:
+                visible_at, _, statement_id = heapq.heappop(self._finished_events)
+                statement = self.redshift_data.statements[statement_id]
+                if statement.event_sent or statement.started + statement.completes_after() + self.event_delay > now:
+                    # Already sent or rescheduled because the statement was cancelled.
+                    continue
+                statement.event_sent = True
+                self._queue.append(self.make_finished_event_record(statement))
+
+    def make_finished_event_record(self, statement: EmulatedStatement) -> dict:
+        event = {
+            'version': '0',
+            'id': str(uuid.uuid4()),
+            'detail-type': 'Redshift Data Statement Status Change',
+            'source': 'aws.redshift-data',
+            'account': ACCOUNT_ID,
+            'time': statement.updated_at().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'region': REGION,
+            'resources': [f'arn:aws:redshift:{REGION}:{ACCOUNT_ID}:cluster:emulated'],
+            'detail': {
+                'principal': f'arn:aws:sts::{ACCOUNT_ID}:assumed-role/emulated',
+                'statementName': statement.name,
+                'statementId': statement.id,
+                'redshiftQueryId': abs(hash(statement.id)) % 10 ** 6,
+                'state': statement.get_status(),
+                'rows': len(self.get_result(statement.query_string)[1]) if statement.has_result_set else -1,
+                'expireAt': int((statement.created_at + timedelta(days=1)).timestamp()),
+            },
+        }
+        return {
+            'messageId': str(uuid.uuid4()),
+            'receiptHandle': str(uuid.uuid4()),
+            'body': json.dumps(event),
+            'attributes': {'ApproximateReceiveCount': '1', 'SentTimestamp': str(int(time.time() * 1000))},
+            'messageAttributes': {},
+            'md5OfBody': '',
+            'eventSource': 'aws:sqs',
+            'eventSourceARN': FINISHED_EVENTS_QUEUE_ARN,
+            'awsRegion': REGION,
+        }
+
+    def pending_finished_events(self) -> int:
+        """Number of finished events that are on the queue."""
+        self._enqueue_finished_events()
+        with self.lock:
+            return len(self._queue)
+
+    def wait_for_finished_events(self, count: int, timeout: float = 10.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.pending_finished_events() < count:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def receive_finished_events(self, max_records: int = 10) -> Optional[dict]:
+        """Take a batch of finished events from the queue as SQS event, or None if there are none."""
+        self._enqueue_finished_events()
+        with self.lock:
+            records, self._queue = self._queue[:max_records], self._queue[max_records:]
+        return {'Records': records} if records else None
+
+    def deliver_finished_events(self, handler: Callable[[dict, object], object], max_records: int = 10,
+                                context=None) -> int:
+        """
+        Invoke handler with a batch of finished events like the SQS event source mapping of Lambda does. When the
+        handler fails, records that it did not delete are put back on the queue (as after their visibility timeout).
+
+        Returns:
+            The number of records that were delivered.
+        """
+        event = self.receive_finished_events(max_records)
+        if event is None:
+            return 0
+        try:
+            handler(event, context)
+        except Exception:
+            self.return_failed_finished_events(event)
+        return len(event['Records'])
+
+    def return_failed_finished_events(self, event: dict):
+        """Put the records of a failed batch that the handler did not delete back on the queue."""
+        with self.lock:
+            retried = [record for record in event['Records']
+                       if record['receiptHandle'] not in self.sqs.deleted_receipt_handles]
+            for record in retried:
+                record['attributes']['ApproximateReceiveCount'] = \
+                    str(int(record['attributes']['ApproximateReceiveCount']) + 1)
+            self._queue.extend(retried)
+
+
+def validate_item(item: dict):
+    """Reject what DynamoDB (or boto3 serialization) rejects, so emulated runs catch the same bugs."""
+    for name, value in item.items():
+        validate_value(value, name)
+
+
+def validate_value(value, name: str):
+    if isinstance(value, float):
+        raise TypeError(f'Float types are not supported. Use Decimal types instead ({name}).')
+    if isinstance(value, dict):
+        for nested_name, nested in value.items():
+            validate_value(nested, f'{name}.{nested_name}')
+    elif isinstance(value, (list, tuple)):
+        for nested in value:
+            validate_value(nested, name)
+    elif not isinstance(value, (str, bytes, bytearray, int, Decimal, bool, set, type(None))) and \
+            type(value).__name__ != 'Binary':
+        raise TypeError(f'Unsupported type "{type(value)}" for value {name}')
+
+
+def item_size(item: Optional[dict]) -> int:
+    if item is None:
+        return 0
+    if set(item) == {'size'} and isinstance(item['size'], int):
+        return item['size']
+    return len(json.dumps(item, default=lambda o: o.value.decode('latin-1') if hasattr(o, 'value') else str(o)))
+
+
+def projected(item: dict, attributes_to_get: Optional[List[str]], projection_expression: Optional[str],
+              names: Optional[dict]) -> dict:
+    if attributes_to_get is not None:
+        return {name: item[name] for name in attributes_to_get if name in item}
+    if projection_expression is not None:
+        return project(item, ExpressionParser(projection_expression, names).parse_projection())
+    return item
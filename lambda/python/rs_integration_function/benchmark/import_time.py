@@ -0,0 +1,90 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Benchmark the time it takes to import the handler module, which is what a cold start pays before the first invocation
+is handled. Every sample imports the module in a fresh interpreter.
+
+Usage (from the rs_integration_function directory):
+    python -m benchmark.import_time --samples 20 --max-median-ms 400
+
+Exits non-zero if a threshold is exceeded or if AWS clients are created at import time such that it can be used to
+catch cold-start regressions.
+"""
+
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+FUNCTION_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dummy configuration, importing the handler must not need AWS access.
+IMPORT_ENV = {
+    'DDB_TABLE_NAME': 'Dummy',
+    'TTL': '1',
+    'CLUSTER_IDENTIFIER': 'DummyCluster',
+    'DATABASE': 'DummyDB',
+    'DB_USER': 'DummyUser',
+    'AWS_REGION': 'eu-west-1',
+    'AWS_DEFAULT_REGION': 'eu-west-1',
+}
+
+IMPORT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+import aws_clients
+print(json.dumps({{"seconds": elapsed, "clients": aws_clients.created_clients()}}))
+"""
+
+
+def measure_import(module: str) -> dict:
+    env = dict(os.environ, **IMPORT_ENV)
+    output = subprocess.check_output(
+        [sys.executable, '-c', IMPORT_SCRIPT.format(module=module)], cwd=FUNCTION_ROOT, env=env
+    )
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='index', help='Module to import (default: index).')
+    parser.add_argument('--samples', type=int, default=10, help='Number of fresh interpreters to measure.')
+    parser.add_argument('--max-median-ms', type=float, default=None, help='Fail if the median exceeds this.')
+    args = parser.parse_args(argv)
+
+    samples = [measure_import(args.module) for _ in range(args.samples)]
+    durations_ms = [sample['seconds'] * 1000 for sample in samples]
+    clients = sorted({client for sample in samples for client in sample['clients']})
+    report = {
+        'module': args.module,
+        'samples': args.samples,
+        'min_ms': round(min(durations_ms), 1),
+        'median_ms': round(statistics.median(durations_ms), 1),
+        'p95_ms': round(percentile(durations_ms, 0.95), 1),
+        'max_ms': round(max(durations_ms), 1),
+        'clients_created_at_import': clients,
+    }
+    print(json.dumps(report, indent=2))
+
+    failed = False
+    if clients:
+        print(f"AWS clients created at import time: {clients}", file=sys.stderr)
+        failed = True
+    if args.max_median_ms is not None and report['median_ms'] > args.max_median_ms:
+        print(f"Median import time {report['median_ms']}ms exceeds {args.max_median_ms}ms", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
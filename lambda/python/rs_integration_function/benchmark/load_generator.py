@@ -0,0 +1,385 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Drive the handler with a mix of the events it routes at a target rate and report throughput and latency per action.
+Requests are scheduled open loop: request i is started at i / rate seconds regardless of how long earlier requests take,
+so a handler that cannot keep up shows as growing `lag` rather than as a lower request rate.
+
+Actions:
+    execute_sfn      executeStatement with a Step Functions callback
+    execute_cfn      executeStatement with a CloudFormation custom resource callback
+    describe         describeStatement of a submitted statement
+    get_result       getStatementResult of a submitted statement
+    cancel           cancelStatement of the most recently submitted statement
+    finished_events  a batch of finished Data API events as delivered by SQS (only against the emulator)
+
+Usage (from the rs_integration_function directory):
+    python -m benchmark.load_generator --rate 200 --duration 30 --workers 16 \
+        --mix execute_sfn=4,describe=4,get_result=1,cancel=1,finished_events=2 --latency dynamodb=0.005
+
+By default the handler runs against `benchmark.emulator.Emulator`, use `--target aws` to run it with the configured
+credentials and environment against real resources (e.g. a test stack). With `--processes` every process runs its
+own handler (and emulator) at an equal share of the rate, like concurrent Lambda execution environments. To compare
+goodput under throttling, limit the throughput of an API with e.g. `--throughput-limits stepfunctions=20` and run with
+and without ADAPTIVE_RATE_LIMITING=true.
+"""
+
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from benchmark.import_time import IMPORT_ENV, percentile
+from event_labels import SQL_STATEMENT, TASK_TOKEN, EXECUTION_ARN, STATEMENT_ID, ACTION, DESCRIBE_STATEMENT, \
+    GET_STATEMENT_RESULT, CANCEL_STATEMENT
+
+EXECUTE_SFN = 'execute_sfn'
+EXECUTE_CFN = 'execute_cfn'
+DESCRIBE = 'describe'
+GET_RESULT = 'get_result'
+CANCEL = 'cancel'
+FINISHED_EVENTS = 'finished_events'
+ACTIONS = [EXECUTE_SFN, EXECUTE_CFN, DESCRIBE, GET_RESULT, CANCEL, FINISHED_EVENTS]
+DEFAULT_MIX = {EXECUTE_SFN: 4, EXECUTE_CFN: 1, DESCRIBE: 4, GET_RESULT: 1, CANCEL: 1, FINISHED_EVENTS: 2}
+
+TARGET_EMULATOR = 'emulator'
+TARGET_AWS = 'aws'
+
+LOAD_SQL = 'select 1'
+LOAD_EXECUTION_PREFIX = 'arn:aws:states:eu-west-1:123456789012:execution:LoadGenerator:'
+# Statement ids that are used for describe, get_result and cancel requests.
+KNOWN_STATEMENTS = 1000
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for entry in mix.split(','):
+        action, _, weight = entry.partition('=')
+        action = action.strip()
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action {action}, expected one of {ACTIONS}")
+        weights[action] = float(weight) if weight else 1.0
+    return weights
+
+
+class LoadGenerator(object):
+    def __init__(self, handler: Callable[[dict, object], object], mix: Dict[str, float], rate: float,
+                 duration: float, workers: int, emulator=None, finished_events_batch_size: int = 10,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            handler: The handler to invoke, usually `index.handler`.
+            mix: Relative weight per action.
+            rate: Requests per second.
+            duration: Seconds to generate load for.
+            workers: Threads that invoke the handler, this bounds the concurrency.
+            emulator: The installed emulator, required for the finished_events action.
+            finished_events_batch_size: Maximum number of records per finished events batch.
+            seed: Seed for the choice of actions and statements.
+        """
+        if FINISHED_EVENTS in mix and mix[FINISHED_EVENTS] > 0 and emulator is None:
+            raise ValueError(f"The {FINISHED_EVENTS} action needs the emulator to produce finished events.")
+        self.handler = handler
+        self.actions = [action for action in mix if mix[action] > 0]
+        self.weights = [mix[action] for action in self.actions]
+        self.rate = rate
+        self.duration = duration
+        self.workers = workers
+        self.emulator = emulator
+        self.finished_events_batch_size = finished_events_batch_size
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._statement_ids = deque(maxlen=KNOWN_STATEMENTS)
+        self._sequence = 0
+        self.latencies = defaultdict(list)  # type: Dict[str, List[float]]
+        self.errors = defaultdict(Counter)  # type: Dict[str, Counter]
+        self.lags = []  # type: List[float]
+        self.skipped = Counter()
+
+    def choose_action(self) -> str:
+        with self._lock:
+            return self._random.choices(self.actions, self.weights)[0]
+
+    def next_sequence(self) -> int:
+        with self._lock:
+            self._sequence += 1
+            return self._sequence
+
+    def choose_statement_id(self, most_recent: bool = False) -> Optional[str]:
+        with self._lock:
+            if not self._statement_ids:
+                return None
+            if most_recent:
+                return self._statement_ids[-1]
+            return self._random.choice(self._statement_ids)
+
+    def make_event(self, action: str) -> Optional[dict]:
+        """The invocation event for action, None if it cannot be made (yet)."""
+        if action == EXECUTE_SFN:
+            return {
+                SQL_STATEMENT: LOAD_SQL,
+                TASK_TOKEN: str(uuid.uuid4()),
+                EXECUTION_ARN: f'{LOAD_EXECUTION_PREFIX}{self.next_sequence()}',
+            }
+        if action == EXECUTE_CFN:
+            return {
+                SQL_STATEMENT: LOAD_SQL,
+                'RequestType': 'Create',
+                'ResponseURL': f'https://cloudformation-custom-resource-response.example.com/{uuid.uuid4()}',
+                'StackId': 'arn:aws:cloudformation:eu-west-1:123456789012:stack/LoadGenerator/1',
+                'RequestId': str(uuid.uuid4()),
+                'ResourceType': 'Custom::LoadGenerator',
+                'LogicalResourceId': f'LoadGenerator{self.next_sequence()}',
+            }
+        if action in (DESCRIBE, GET_RESULT, CANCEL):
+            statement_id = self.choose_statement_id(most_recent=action == CANCEL)
+            if statement_id is None:
+                return None
+            return {
+                STATEMENT_ID: statement_id,
+                ACTION: {DESCRIBE: DESCRIBE_STATEMENT, GET_RESULT: GET_STATEMENT_RESULT,
+                         CANCEL: CANCEL_STATEMENT}[action],
+            }
+        if action == FINISHED_EVENTS:
+            return self.emulator.receive_finished_events(self.finished_events_batch_size)
+        raise ValueError(f"Unknown action {action}")
+
+    def invoke(self, action: str, scheduled_at: float):
+        started = time.perf_counter()
+        event = self.make_event(action)
+        if event is None:
+            with self._lock:
+                self.skipped[action] += 1
+            return
+        error = None
+        # noinspection PyBroadException
+        try:
+            response = self.handler(event, None)
+        except Exception as e:
+            error = type(e).__name__
+            response = None
+            if action == FINISHED_EVENTS:
+                self.emulator.return_failed_finished_events(event)
+        latency = time.perf_counter() - started
+        with self._lock:
+            self.lags.append(started - scheduled_at)
+            self.latencies[action].append(latency)
+            if error is not None:
+                self.errors[action][error] += 1
+            elif action in (EXECUTE_SFN, EXECUTE_CFN) and isinstance(response, dict) and 'Id' in response:
+                self._statement_ids.append(response['Id'])
+
+    def run(self) -> dict:
+        start = time.perf_counter()
+        total = int(self.rate * self.duration)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for i in range(total):
+                scheduled_at = start + i / self.rate
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.invoke, self.choose_action(), scheduled_at)
+        return {
+            'elapsed': time.perf_counter() - start,
+            'latencies': dict(self.latencies),
+            'errors': {action: dict(errors) for action, errors in self.errors.items()},
+            'lags': self.lags,
+            'skipped': dict(self.skipped),
+        }
+
+
+def merge_samples(samples: List[dict]) -> dict:
+    merged = {'elapsed': 0.0, 'latencies': defaultdict(list), 'errors': defaultdict(Counter), 'lags': [],
+              'skipped': Counter(), 'stages': defaultdict(lambda: defaultdict(list)), 'counts': Counter()}
+    for sample in samples:
+        merged['elapsed'] = max(merged['elapsed'], sample['elapsed'])
+        merged['lags'].extend(sample['lags'])
+        merged['skipped'].update(sample['skipped'])
+        merged['counts'].update(sample.get('counts', {}))
+        for action, latencies in sample['latencies'].items():
+            merged['latencies'][action].extend(latencies)
+        for action, errors in sample['errors'].items():
+            merged['errors'][action].update(errors)
+        for action, stages in sample.get('stages', {}).items():
+            for name, values in stages.items():
+                merged['stages'][action][name].extend(values)
+    return merged
+
+
+def summarize(samples: dict) -> dict:
+    def milliseconds(values: List[float], fraction: float) -> float:
+        return round(percentile(values, fraction) * 1000, 2)
+
+    elapsed = samples['elapsed']
+    report = {'elapsed_s': round(elapsed, 2), 'actions': {}}
+    all_latencies = []
+    for action in ACTIONS:
+        latencies = samples['latencies'].get(action)
+        if not latencies:
+            continue
+        all_latencies.extend(latencies)
+        report['actions'][action] = {
+            'requests': len(latencies),
+            'errors': dict(samples['errors'].get(action, {})),
+            'throughput_per_s': round(len(latencies) / elapsed, 1),
+            'p50_ms': milliseconds(latencies, 0.5),
+            'p95_ms': milliseconds(latencies, 0.95),
+            'p99_ms': milliseconds(latencies, 0.99),
+            'max_ms': round(max(latencies) * 1000, 2),
+        }
+    if all_latencies:
+        report['total'] = {
+            'requests': len(all_latencies),
+            'errors': sum(sum(errors.values()) for errors in samples['errors'].values()),
+            'throughput_per_s': round(len(all_latencies) / elapsed, 1),
+            'p50_ms': milliseconds(all_latencies, 0.5),
+            'p99_ms': milliseconds(all_latencies, 0.99),
+            'lag_p99_ms': milliseconds(samples['lags'], 0.99),
+        }
+    if samples['skipped']:
+        report['skipped'] = dict(samples['skipped'])
+    if samples.get('stages'):
+        # Stage durations as reported by the metrics of the handler, per handler action.
+        report['stages_p50_ms'] = {
+            action: {name: round(percentile(values, 0.5), 2) for name, values in sorted(stages.items())}
+            for action, stages in sorted(samples['stages'].items())
+        }
+    if samples.get('counts'):
+        # E.g. throttles and retries of AWS API calls as counted by the handler.
+        report['counts'] = dict(sorted(samples['counts'].items()))
+    return report
+
+
+def collect_stages(lines: List[str]) -> dict:
+    from metrics import DIMENSION_ACTION
+    stages = defaultdict(lambda: defaultdict(list))
+    for line in lines:
+        emf = json.loads(line)
+        for definition in emf['_aws']['CloudWatchMetrics'][0]['Metrics']:
+            name = definition['Name']
+            if definition['Unit'] == 'Milliseconds':
+                stages[emf[DIMENSION_ACTION]][name].append(emf[name])
+    return {action: dict(values) for action, values in stages.items()}
+
+
+def collect_counts(lines: List[str]) -> Counter:
+    from metrics import CAPACITY_SUFFIX
+    counts = Counter()
+    for line in lines:
+        emf = json.loads(line)
+        for definition in emf['_aws']['CloudWatchMetrics'][0]['Metrics']:
+            name = definition['Name']
+            if definition['Unit'] == 'Count' and not name.endswith(CAPACITY_SUFFIX):
+                counts[name] += emf[name]
+    return counts
+
+
+def run_load(arguments: dict) -> dict:
+    """Run a load generator in this process with the (picklable) arguments of the command line."""
+    if arguments['target'] == TARGET_EMULATOR:
+        for name, value in IMPORT_ENV.items():
+            os.environ.setdefault(name, value)
+    os.environ.setdefault('LOG_LEVEL', arguments['log_level'])
+    import index
+    import metrics
+    emf_lines = []
+    metrics.set_metrics_sink(emf_lines.append)
+
+    emulator = None
+    if arguments['target'] == TARGET_EMULATOR:
+        from benchmark.emulator import Emulator
+        emulator = Emulator(latency=arguments['latency'], errors=arguments['errors'],
+                            throughput_limits=arguments['throughput_limits'],
+                            statement_duration=arguments['statement_duration'],
+                            statement_failure_rate=arguments['statement_failure_rate'], seed=arguments['seed'])
+        emulator.install()
+    try:
+        generator = LoadGenerator(index.handler, arguments['mix'], arguments['rate'], arguments['duration'],
+                                  arguments['workers'], emulator=emulator, seed=arguments['seed'])
+        samples = generator.run()
+    finally:
+        if emulator is not None:
+            emulator.uninstall()
+        metrics.set_metrics_sink(metrics.write_to_stdout)
+    samples['stages'] = collect_stages(emf_lines)
+    samples['counts'] = collect_counts(emf_lines)
+    return samples
+
+
+def parse_per_api(values: Optional[str]) -> dict:
+    """Parse comma separated <service>[.<Operation>]=number pairs, e.g. of latency or throughput limits."""
+    if not values:
+        return {}
+    return {key.strip(): float(value) for key, _, value in
+            (entry.partition('=') for entry in values.split(','))}
+
+
+def parse_errors(errors: Optional[str]) -> dict:
+    if not errors:
+        return {}
+    parsed = {}
+    for key, _, error in (entry.partition('=') for entry in errors.split(',')):
+        rate, _, error_code = error.partition(':')
+        parsed[key.strip()] = (float(rate), error_code.strip())
+    return parsed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=[TARGET_EMULATOR, TARGET_AWS], default=TARGET_EMULATOR)
+    parser.add_argument('--rate', type=float, default=50, help='Requests per second over all processes.')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to generate load for.')
+    parser.add_argument('--workers', type=int, default=8, help='Threads invoking the handler per process.')
+    parser.add_argument('--processes', type=int, default=1, help='Processes that each run the handler.')
+    parser.add_argument('--mix', default=','.join(f'{action}={weight}' for action, weight in DEFAULT_MIX.items()),
+                        help='Comma separated action=weight pairs.')
+    parser.add_argument('--latency', default=None,
+                        help="Emulated latency in seconds as comma separated <service>[.<Operation>]=seconds pairs.")
+    parser.add_argument('--errors', default=None,
+                        help="Emulated errors as comma separated <service>[.<Operation>]=rate:ErrorCode pairs.")
+    parser.add_argument('--throughput-limits', default=None,
+                        help="Emulated calls per second above which calls are throttled as comma separated "
+                             "<service>[.<Operation>]=calls pairs.")
+    parser.add_argument('--statement-duration', type=float, default=0.05, help='Emulated statement duration.')
+    parser.add_argument('--statement-failure-rate', type=float, default=0.0, help='Emulated statement failure rate.')
+    parser.add_argument('--log-level', default='WARNING', help='Log level of the handler.')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--max-p99-ms', type=float, default=None, help='Fail if the overall p99 exceeds this.')
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    if args.target == TARGET_AWS:
+        mix.pop(FINISHED_EVENTS, None)
+    arguments = {
+        'target': args.target, 'mix': mix, 'rate': args.rate / args.processes, 'duration': args.duration,
+        'workers': args.workers, 'latency': parse_per_api(args.latency), 'errors': parse_errors(args.errors),
+        'throughput_limits': parse_per_api(args.throughput_limits),
+        'statement_duration': args.statement_duration, 'statement_failure_rate': args.statement_failure_rate,
+        'log_level': args.log_level, 'seed': args.seed,
+    }
+    if args.processes == 1:
+        samples = [run_load(arguments)]
+    else:
+        with multiprocessing.get_context('spawn').Pool(args.processes) as pool:
+            samples = pool.map(run_load, [dict(arguments, seed=None if args.seed is None else args.seed + i)
+                                          for i in range(args.processes)])
+    report = summarize(merge_samples(samples))
+    print(json.dumps(report, indent=2))
+
+    if args.max_p99_ms is not None and report.get('total', {}).get('p99_ms', 0) > args.max_p99_ms:
+        print(f"p99 latency {report['total']['p99_ms']}ms exceeds {args.max_p99_ms}ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
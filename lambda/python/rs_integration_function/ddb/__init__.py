@@ -7,3 +7,30 @@ DDB_TABLE_NAME = 'DDB_TABLE_NAME'  # This is as per LambdaToDynamoDB AWS constru
 DDB_TTL = 'TTL'
 DDB_FINISHED_EVENT_DETAILS = 'finished_event_details'
 DDB_CALLBACK_DETAILS = 'callback_details'
+DDB_BATCH_GET_MAX_KEYS = 100  # BatchGetItem limit per request
+DDB_MARK_CONCURRENCY = 10  # Parallel UpdateItem calls when a batch of handled statements is written
+DDB_STATEMENT_NAME = 'statement_name'
+DDB_ACTIVE_STATEMENT_KEY = 'active_statement_key'  # Set on statements that are registered as active singleton.
+DDB_ACTIVE_STATEMENT_PREFIX = 'active_statement:'
+DDB_ACTIVE_STATEMENT_INVOCATION_ID = 'active'
+DDB_STATEMENT_ID = 'statement_id'  # The Data API Id of the statement, set once it is submitted.
+DDB_SQL_HASH = 'sql_hash'
+DDB_SQL_LOCATION = 'sql_location'  # S3 location of the full SQL text when it is offloaded.
+DDB_SHARD_SEPARATOR = '#'  # Separates the execution ARN and the shard in sharded partition keys.
+DDB_CONFIGURATION_ID = 'configuration'  # Settings that the keys of the state items depend on.
+DDB_CONFIGURATION_INVOCATION_ID = 'state_table'
+DDB_SHARDS = 'shards'
+DDB_RESULT_CACHE_PREFIX = 'result_cache:'  # Cached statement of a SQL text, keyed by the result cache key.
+DDB_RESULT_CACHE_INVOCATION_ID = 'entry'
+DDB_CACHED_RESULT_PREFIX = 'cached_result:'  # Cached result of a statement, keyed by its Data API Id.
+DDB_CACHED_RESULT_INVOCATION_ID = 'result'
+DDB_RESULT = 'result'  # zlib compressed JSON of a cached result or, for large results, its manifest.
+DDB_RESULT_SIZE = 'result_size'
+DDB_ADMISSION_SLOTS_PREFIX = 'admission_slots:'  # Counter of the statements of a priority that hold a slot.
+DDB_ADMISSION_SLOTS_INVOCATION_ID = 'slots'
+DDB_ADMISSION_IN_FLIGHT = 'in_flight'
+DDB_ADMISSION_LEASE_PREFIX = 'lease:'  # Slot counter attribute per statement that holds a slot, until when it is valid.
+DDB_ADMISSION_QUEUE_PREFIX = 'admission_queue:'  # Statements of a priority waiting for a slot, by invocation id.
+DDB_ADMISSION_REQUEST = 'request'  # zlib compressed JSON of the arguments to submit a queued statement with.
+DDB_ADMISSION_PRIORITY = 'admission_priority'  # Set on statements that take or wait for a slot of this priority.
+DDB_ADMISSION_QUEUED = 'admission_queued'  # Set on statements that were queued with this priority.
@@ -0,0 +1,245 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Distributed admission control for statement submissions, kept in the state table. Every priority has a limit on the
+number of statements that are running at once:
+ - A counter item per priority is the semaphore. A statement takes a slot with a conditional increment that also adds
+   a lease for it to the counter item, and gives it back by removing its lease with a decrement when its finished event
+   has been handled. A slot is given back at most once, also when a statement is handled more than once.
+ - A statement can't give back its slot when its invocation dies before submitting it, so leases expire: when no slot
+   is left the expired leases are checked and the slots of statements that are no longer running are reclaimed, the
+   leases of running statements are renewed.
+ - Statements that don't get a slot wait in a queue partition per priority, ordered by their invocation id so they are
+   admitted first in, first out as slots are given back.
+"""
+
+
+import json
+import os
+import time
+import zlib
+from typing import Callable, Dict, Optional
+
+from boto3.dynamodb.types import Binary
+
+from ddb import DDB_ID, DDB_INVOCATION_ID, DDB_STATEMENT_NAME, DDB_TTL, DDB_ADMISSION_SLOTS_PREFIX, \
+    DDB_ADMISSION_SLOTS_INVOCATION_ID, DDB_ADMISSION_IN_FLIGHT, DDB_ADMISSION_LEASE_PREFIX, \
+    DDB_ADMISSION_QUEUE_PREFIX, DDB_ADMISSION_REQUEST
+from ddb.ddb_state_table import DDBStateTable, get_ddb_state_table, get_dynamodb, \
+    get_conditional_check_failed_exception
+from environment_labels import ADMISSION_LIMITS
+from exceptions import ConfigurationError
+from logger import logger, l_response, l_statement_name
+from metrics import consumed_capacity_mode, add_consumed_capacity, STAGE_ADMISSION
+from statement_class import StatementName
+
+DEFAULT_PRIORITY = 'normal'
+# A slot is taken before its statement is submitted, for a short while the statement is not yet known by the Data API.
+LEASE_SUBMISSION_SECONDS = 60
+# The lease of a statement that was found running is renewed for this long before it is checked again.
+LEASE_RENEWAL_SECONDS = 300
+
+
+def parse_admission_limits(admission_limits: str) -> Dict[str, int]:
+    """Parse limits of the form `high=20,normal=10,low=2`."""
+    limits = {}
+    try:
+        for entry in filter(None, (entry.strip() for entry in admission_limits.split(','))):
+            priority, limit = entry.split('=')
+            limits[priority.strip()] = int(limit)
+            assert limits[priority.strip()] >= 1
+    except (ValueError, AssertionError):
+        raise ConfigurationError(f"{ADMISSION_LIMITS} should be priority=limit pairs with limit >= 1 e.g. normal=10.")
+    return limits
+
+
+admission_limits = parse_admission_limits(os.environ.get(ADMISSION_LIMITS, ''))
+
+
+def is_admission_controlled(priority: str) -> bool:
+    """Priorities without a limit are not admission controlled, without ADMISSION_LIMITS none are."""
+    return priority in admission_limits
+
+
+def get_slots_key(priority: str) -> dict:
+    return {DDB_ID: DDB_ADMISSION_SLOTS_PREFIX + priority, DDB_INVOCATION_ID: DDB_ADMISSION_SLOTS_INVOCATION_ID}
+
+
+def get_queue_partition_key(priority: str) -> str:
+    return DDB_ADMISSION_QUEUE_PREFIX + priority
+
+
+def get_lease_name(statement_name: StatementName) -> str:
+    return DDB_ADMISSION_LEASE_PREFIX + str(statement_name)
+
+
+def acquire_slot(priority: str, statement_name: StatementName) -> bool:
+    """Take a slot of a priority for a statement if fewer than its limit are taken and the statement has none yet."""
+    try:
+        response = get_ddb_state_table().update_item(
+            Key=get_slots_key(priority),
+            UpdateExpression="SET #L = :expires ADD #F :one",
+            ConditionExpression="(attribute_not_exists(#F) OR #F < :limit) AND attribute_not_exists(#L)",
+            ExpressionAttributeNames={'#F': DDB_ADMISSION_IN_FLIGHT, '#L': get_lease_name(statement_name)},
+            ExpressionAttributeValues={':one': 1, ':limit': admission_limits[priority],
+                                       ':expires': int(time.time()) + LEASE_SUBMISSION_SECONDS},
+            ReturnConsumedCapacity=consumed_capacity_mode(),
+        )
+        add_consumed_capacity(STAGE_ADMISSION, response)
+        return True
+    except get_conditional_check_failed_exception():
+        return False
+
+
+def release_slot(priority: str, statement_name: StatementName, expires: Optional[int] = None) -> bool:
+    """
+    Give back the slot of a statement, if it holds one.
+
+    Args:
+        priority: The priority of the statement.
+        statement_name: The statement.
+        expires: Only give back the slot if the lease of the statement is still valid until expires, e.g. to reclaim
+                 an expired lease that may be renewed concurrently.
+
+    Returns:
+        Whether a slot was given back.
+    """
+    condition_expression = "attribute_exists(#L)"
+    expression_attribute_values = {':minus_one': -1}
+    if expires is not None:
+        condition_expression = "#L = :expires"
+        expression_attribute_values[':expires'] = expires
+    try:
+        response = get_ddb_state_table().update_item(
+            Key=get_slots_key(priority),
+            UpdateExpression="REMOVE #L ADD #F :minus_one",
+            ConditionExpression=condition_expression,
+            ExpressionAttributeNames={'#F': DDB_ADMISSION_IN_FLIGHT, '#L': get_lease_name(statement_name)},
+            ExpressionAttributeValues=expression_attribute_values,
+            ReturnConsumedCapacity=consumed_capacity_mode(),
+        )
+        add_consumed_capacity(STAGE_ADMISSION, response)
+        return True
+    except get_conditional_check_failed_exception():
+        logger.debug({l_statement_name: str(statement_name), 'priority': priority, 'message': 'Holds no slot.'})
+        return False
+
+
+def get_leases(priority: str) -> Dict[str, int]:
+    """The statement names that hold a slot of a priority with the time their lease expires."""
+    response = get_ddb_state_table().get_item(
+        Key=get_slots_key(priority),
+        ConsistentRead=True,
+        ReturnConsumedCapacity=consumed_capacity_mode(),
+    )
+    add_consumed_capacity(STAGE_ADMISSION, response)
+    return {
+        name[len(DDB_ADMISSION_LEASE_PREFIX):]: int(expires)
+        for name, expires in response.get('Item', {}).items() if name.startswith(DDB_ADMISSION_LEASE_PREFIX)
+    }
+
+
+def renew_lease(priority: str, statement_name: StatementName, expires: int) -> None:
+    """Extend the lease of a statement, unless it was given back or renewed concurrently."""
+    try:
+        response = get_ddb_state_table().update_item(
+            Key=get_slots_key(priority),
+            UpdateExpression="SET #L = :renewed",
+            ConditionExpression="#L = :expires",
+            ExpressionAttributeNames={'#L': get_lease_name(statement_name)},
+            ExpressionAttributeValues={':expires': expires, ':renewed': int(time.time()) + LEASE_RENEWAL_SECONDS},
+            ReturnConsumedCapacity=consumed_capacity_mode(),
+        )
+        add_consumed_capacity(STAGE_ADMISSION, response)
+    except get_conditional_check_failed_exception():
+        pass
+
+
+def reclaim_expired_slots(priority: str, is_running: Callable[[str], bool]) -> int:
+    """
+    Reclaim the slots of a priority whose lease expired and whose statement is no longer running, e.g. because the
+    invocation that took the slot died before submitting the statement. The leases of running statements are renewed.
+
+    Args:
+        priority: The priority of the slots.
+        is_running: Whether the statement with a statement name is still running.
+
+    Returns:
+        The number of slots that were reclaimed.
+    """
+    reclaimed = 0
+    now = int(time.time())
+    for statement_name, expires in get_leases(priority).items():
+        if expires >= now:
+            continue
+        if is_running(statement_name):
+            renew_lease(priority, StatementName.from_str(statement_name), expires)
+        elif release_slot(priority, StatementName.from_str(statement_name), expires):
+            logger.warning({l_statement_name: statement_name, 'priority': priority, 'message': 'Reclaimed slot.'})
+            reclaimed += 1
+    return reclaimed
+
+
+def enqueue(priority: str, statement_name: StatementName, request: dict) -> None:
+    """
+    Queue a statement until a slot is available.
+
+    Args:
+        priority: The priority of the statement.
+        statement_name: The registered statement.
+        request: The JSON serializable arguments to submit the statement with once it is admitted.
+    """
+    response = get_ddb_state_table().put_item(
+        Item={
+            DDB_ID: get_queue_partition_key(priority),
+            DDB_INVOCATION_ID: statement_name.invocation_id,
+            DDB_STATEMENT_NAME: str(statement_name),
+            DDB_ADMISSION_REQUEST: zlib.compress(json.dumps(request).encode('utf-8')),
+            DDB_TTL: DDBStateTable.get_ttl_value(),
+        },
+        ReturnConsumedCapacity=consumed_capacity_mode(),
+    )
+    add_consumed_capacity(STAGE_ADMISSION, response)
+
+
+def remove(priority: str, statement_name: StatementName) -> Optional[dict]:
+    """
+    Remove a statement from the queue of a priority.
+
+    Returns:
+        The request the statement was queued with or None if it is no longer queued.
+    """
+    try:
+        response = get_ddb_state_table().delete_item(
+            Key={DDB_ID: get_queue_partition_key(priority), DDB_INVOCATION_ID: statement_name.invocation_id},
+            ConditionExpression="attribute_exists(#S)",
+            ExpressionAttributeNames={'#S': DDB_STATEMENT_NAME},
+            ReturnValues='ALL_OLD',
+            ReturnConsumedCapacity=consumed_capacity_mode(),
+        )
+    except get_conditional_check_failed_exception():
+        return None
+    add_consumed_capacity(STAGE_ADMISSION, response)
+    value = response['Attributes'][DDB_ADMISSION_REQUEST]
+    return json.loads(zlib.decompress(value.value if isinstance(value, Binary) else value).decode('utf-8'))
+
+
+def peek(priority: str) -> Optional[StatementName]:
+    """The statement that is queued longest for a priority, None if the queue is empty."""
+    response = get_dynamodb().meta.client.query(
+        TableName=get_ddb_state_table().name,
+        KeyConditionExpression="#K = :queue",
+        ProjectionExpression="#S",
+        ExpressionAttributeNames={'#K': DDB_ID, '#S': DDB_STATEMENT_NAME},
+        ExpressionAttributeValues={':queue': get_queue_partition_key(priority)},
+        ScanIndexForward=True,
+        Limit=1,
+        ConsistentRead=True,
+        ReturnConsumedCapacity=consumed_capacity_mode(),
+    )
+    add_consumed_capacity(STAGE_ADMISSION, response)
+    if len(response['Items']) == 0:
+        return None
+    statement_name = StatementName.from_str(response['Items'][0][DDB_STATEMENT_NAME])
+    logger.debug({l_statement_name: str(statement_name), l_response: response})
+    return statement_name
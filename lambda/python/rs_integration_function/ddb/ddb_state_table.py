@@ -3,29 +3,94 @@
 
 
 import json
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache
 from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
 
-import boto3
-from boto3.dynamodb.conditions import Key
 import os
 
+from aws_clients import get_resource
+
 from callback_sources.builder import CallbackSourceBuilder
 from callback_sources.helper import CallbackInterface, NoCallback
-from exceptions import ConfigurationError, PreviousExecutionNotFound, NoTrackedState
+from exceptions import ConfigurationError, PreviousExecutionNotFound, NoTrackedState, ActiveStatementExists, \
+    UnprocessedItems
 from statement_class import StatementName
-from ddb import DDB_ID, DDB_TABLE_NAME, DDB_TTL, DDB_FINISHED_EVENT_DETAILS, DDB_INVOCATION_ID, DDB_CALLBACK_DETAILS
-from event_labels import SQL_STATEMENT
+from ddb import DDB_ID, DDB_TABLE_NAME, DDB_TTL, DDB_FINISHED_EVENT_DETAILS, DDB_INVOCATION_ID, DDB_CALLBACK_DETAILS, \
+    DDB_BATCH_GET_MAX_KEYS, DDB_STATEMENT_NAME, DDB_ACTIVE_STATEMENT_KEY, DDB_ACTIVE_STATEMENT_PREFIX, \
+    DDB_ACTIVE_STATEMENT_INVOCATION_ID, DDB_STATEMENT_ID, DDB_MARK_CONCURRENCY, DDB_SHARD_SEPARATOR, \
+    DDB_ADMISSION_PRIORITY, DDB_ADMISSION_QUEUED, DDB_CONFIGURATION_ID, DDB_CONFIGURATION_INVOCATION_ID, DDB_SHARDS
 from assertion import assert_env_set
+from environment_labels import STATE_TABLE_SHARDS
+from ddb.item_encoding import encode_sql_statement, encode_callback_details, decode_callback_details, \
+    encode_finished_event_details
 from logger import logger, l_statement_name, l_response, l_finished_event_details, l_ttl, l_item, l_exception
+from metrics import consumed_capacity_mode, add_consumed_capacity, STAGE_DDB_REGISTER, STAGE_DDB_GET, STAGE_DDB_MARK
+from rate_limiter import get_retry_delay, MAX_ATTEMPTS
+from sql_text import hash_sql_statement
 
 assert_env_set(DDB_TABLE_NAME)
-dynamodb = boto3.resource('dynamodb')
-ddb_state_table = dynamodb.Table(os.environ[DDB_TABLE_NAME])
 try:
     ddb_ttl_in_days = int(os.environ[DDB_TTL])
 except ValueError:
     raise ConfigurationError(f"{DDB_TTL} should be TTL in number of days that state is kept.")
+try:
+    state_table_shards = int(os.environ.get(STATE_TABLE_SHARDS, 1))
+    assert state_table_shards >= 1
+except (ValueError, AssertionError):
+    raise ConfigurationError(f"{STATE_TABLE_SHARDS} should be the number of partitions per execution ARN (>= 1).")
+# The number of shards that was verified against the state table, once per container before statements are registered.
+recorded_state_table_shards: Optional[int] = None
+
+
+def get_dynamodb():
+    return get_resource('dynamodb')
+
+
+@lru_cache(maxsize=None)
+def get_ddb_state_table():
+    return get_dynamodb().Table(os.environ[DDB_TABLE_NAME])
+
+
+def get_conditional_check_failed_exception():
+    return get_ddb_state_table().meta.client.exceptions.ConditionalCheckFailedException
+
+
+def check_state_table_shards() -> None:
+    """
+    Record the number of shards with the state table, or verify that it is the recorded one. The partition key of a
+    statement follows from the number of shards so the statements in flight would no longer be found after a change.
+
+    Raises:
+        ConfigurationError: When the state table holds statements for another number of shards.
+    """
+    global recorded_state_table_shards
+    if recorded_state_table_shards == state_table_shards:
+        return
+    try:
+        response = get_ddb_state_table().put_item(
+            Item={
+                DDB_ID: DDB_CONFIGURATION_ID,
+                DDB_INVOCATION_ID: DDB_CONFIGURATION_INVOCATION_ID,
+                DDB_SHARDS: state_table_shards,
+            },
+            ConditionExpression="attribute_not_exists(#S) OR #S = :shards",
+            ExpressionAttributeNames={'#S': DDB_SHARDS},
+            ExpressionAttributeValues={':shards': state_table_shards},
+            ReturnConsumedCapacity=consumed_capacity_mode(),
+        )
+    except get_conditional_check_failed_exception() as e:
+        raise ConfigurationError(
+            f"{STATE_TABLE_SHARDS}={state_table_shards} differs from the number of shards of the state table. Only "
+            f"change it when no statements are in flight and delete the item with {DDB_ID} '{DDB_CONFIGURATION_ID}' "
+            f"first."
+        ) from e
+    add_consumed_capacity(STAGE_DDB_REGISTER, response)
+    recorded_state_table_shards = state_table_shards
 
 
 class DDBStateTable(object):
@@ -49,7 +114,7 @@ class DDBStateTable(object):
         for key, value in expression_attribute_values.items():
             cleaned_expression_attribute_values[key] = self.object_floats_to_decimal(value)
         kwargs['ExpressionAttributeValues'] = cleaned_expression_attribute_values
-        return ddb_state_table.update_item(*args, **kwargs)
+        return get_ddb_state_table().update_item(*args, **kwargs)
 
     def put_item(self, *args, **kwargs):
         """
@@ -59,52 +124,311 @@ class DDBStateTable(object):
         """
         assert 'Item' in kwargs, 'We use the Table Resource put_item so Item is required.'
         kwargs['Item'] = self.object_floats_to_decimal(kwargs['Item'])
-        return ddb_state_table.put_item(*args, **kwargs)
+        return get_ddb_state_table().put_item(*args, **kwargs)
 
-    def register_execution_start(self, callback_object: CallbackInterface, sql_statement: str) -> StatementName:
+    @classmethod
+    def get_partition_key(cls, statement_name: StatementName) -> str:
+        """
+        Get the partition key of a statement. Without sharding all statements of an execution ARN share one partition.
+        With STATE_TABLE_SHARDS > 1 the statements are spread over that many partitions based on their invocation id,
+        so the shard of a statement is known from its statement name. Statements that are in flight are no longer found
+        when the number of shards changes, so registering statements fails once it differs from the recorded number.
+        """
+        if state_table_shards == 1:
+            return statement_name.execution_arn
+        shard = zlib.crc32(statement_name.invocation_id.encode('utf-8')) % state_table_shards
+        return f"{statement_name.execution_arn}{DDB_SHARD_SEPARATOR}{shard}"
+
+    @classmethod
+    def get_partition_keys_for_execution_arn(cls, execution_arn: str) -> List[str]:
+        if state_table_shards == 1:
+            return [execution_arn]
+        return [f"{execution_arn}{DDB_SHARD_SEPARATOR}{shard}" for shard in range(state_table_shards)]
+
+    @classmethod
+    def get_execution_arn_for_partition_key(cls, partition_key: str) -> str:
+        # Execution ARNs cannot hold the separator.
+        return partition_key.split(DDB_SHARD_SEPARATOR)[0]
+
+    @classmethod
+    def get_key(cls, statement_name: StatementName) -> dict:
+        return {
+            DDB_ID: cls.get_partition_key(statement_name),
+            DDB_INVOCATION_ID: statement_name.invocation_id,
+        }
+
+    def register_execution_start(self, callback_object: CallbackInterface, sql_statement: str,
+                                 run_as_singleton=False, previous_statement_name: Optional[str] = None,
+                                 admission_priority: Optional[str] = None) -> StatementName:
         """
         Register a UUID4 string in a state table in DynamoDB and link it with the task of the stepfunction execution.
         Return this GUID string such that it can be used as statement name to update the task when the statement
         completes.
+
+        When run_as_singleton is set the statement is also claimed as the active statement for its SQL text, see
+        `claim_active_statement` which also documents previous_statement_name. The admission_priority of a statement
+        that is admission controlled is stored before it takes a slot, so the slot is given back when it is handled.
         """
+        check_state_table_shards()
         statement_name = StatementName.from_execution_arn(callback_object.get_id())
         item_details = {
-            DDB_ID: statement_name.execution_arn,
-            DDB_INVOCATION_ID: statement_name.invocation_id,
-            SQL_STATEMENT: sql_statement,
-            DDB_CALLBACK_DETAILS: callback_object.to_json()
+            **self.get_key(statement_name),
+            DDB_CALLBACK_DETAILS: encode_callback_details(callback_object.to_json()),
+            **encode_sql_statement(sql_statement)
         }
         if isinstance(callback_object, NoCallback):
             # No callback is expected so TTL can immediately be set.
             item_details[DDB_TTL] = self.get_ttl_value()
+        if admission_priority is not None:
+            item_details[DDB_ADMISSION_PRIORITY] = admission_priority
+        if run_as_singleton:
+            item_details[DDB_ACTIVE_STATEMENT_KEY] = self.claim_active_statement(
+                statement_name, sql_statement, previous_statement_name
+            )
         logger.debug({l_item: item_details})
-        self.put_item(
-            Item=item_details,
-            ConditionExpression="attribute_not_exists(sqlStatement)"  # Re-registration is  not allowed
-        )
+        try:
+            # The item has no floats but binary callback details so it is put as is.
+            response = get_ddb_state_table().put_item(
+                Item=item_details,
+                ConditionExpression="attribute_not_exists(sqlStatement)",  # Re-registration is  not allowed
+                ReturnConsumedCapacity=consumed_capacity_mode(),
+            )
+            add_consumed_capacity(STAGE_DDB_REGISTER, response)
+        except Exception:
+            if run_as_singleton:
+                self.release_active_statement(statement_name, item_details[DDB_ACTIVE_STATEMENT_KEY])
+            raise
         return statement_name
 
     @classmethod
-    def get_latest_statement_name_for_execution_arn(cls, execution_arn: str) -> StatementName:
-        response = ddb_state_table.query(
-            KeyConditionExpression=Key(DDB_ID).eq(execution_arn),
-            ProjectionExpression="#I",
+    def get_active_statement_key(cls, sql_statement: str) -> str:
+        return DDB_ACTIVE_STATEMENT_PREFIX + hash_sql_statement(sql_statement)
+
+    def claim_active_statement(self, statement_name: StatementName, sql_statement: str,
+                               previous_statement_name: Optional[str] = None) -> str:
+        """
+        Claim the active statement index entry for the SQL text of a statement using a single conditional write. The
+        entry is keyed by the hash of the normalized SQL text so this is O(1) no matter how many statements are in
+        flight. Expired entries can always be claimed.
+
+        Args:
+            statement_name: The statement that becomes the active statement for its SQL text.
+            sql_statement: The SQL text.
+            previous_statement_name: Take over the entry from this statement, to be used when it is known that this
+                                     statement is no longer active.
+
+        Returns:
+            The key of the active statement index entry.
+
+        Raises:
+            ActiveStatementExists: When another statement has claimed the entry.
+        """
+        active_statement_key = self.get_active_statement_key(sql_statement)
+        condition_expression = "attribute_not_exists(#S) OR #T < :now"
+        expression_attribute_values = {':now': int(datetime.utcnow().timestamp())}
+        if previous_statement_name is not None:
+            condition_expression += " OR #S = :previous"
+            expression_attribute_values[':previous'] = previous_statement_name
+        try:
+            response = self.put_item(
+                Item={
+                    DDB_ID: active_statement_key,
+                    DDB_INVOCATION_ID: DDB_ACTIVE_STATEMENT_INVOCATION_ID,
+                    DDB_STATEMENT_NAME: str(statement_name),
+                    DDB_TTL: self.get_ttl_value(),
+                },
+                ConditionExpression=condition_expression,
+                ExpressionAttributeNames={'#S': DDB_STATEMENT_NAME, '#T': DDB_TTL},
+                ExpressionAttributeValues=expression_attribute_values,
+                ReturnConsumedCapacity=consumed_capacity_mode(),
+            )
+            add_consumed_capacity(STAGE_DDB_REGISTER, response)
+        except get_conditional_check_failed_exception() as e:
+            response = get_ddb_state_table().get_item(
+                Key={
+                    DDB_ID: active_statement_key,
+                    DDB_INVOCATION_ID: DDB_ACTIVE_STATEMENT_INVOCATION_ID,
+                },
+                ConsistentRead=True,
+                ReturnConsumedCapacity=consumed_capacity_mode(),
+            )
+            add_consumed_capacity(STAGE_DDB_REGISTER, response)
+            logger.debug({l_statement_name: str(statement_name), l_response: response})
+            raise ActiveStatementExists(response.get('Item', {}).get(DDB_STATEMENT_NAME)) from e
+        return active_statement_key
+
+    @classmethod
+    def release_active_statement(cls, statement_name: StatementName, active_statement_key: str) -> None:
+        """
+        Remove the active statement index entry if it is still claimed by statement_name.
+        """
+        try:
+            response = get_ddb_state_table().delete_item(
+                Key={
+                    DDB_ID: active_statement_key,
+                    DDB_INVOCATION_ID: DDB_ACTIVE_STATEMENT_INVOCATION_ID,
+                },
+                ConditionExpression="#S = :statement_name",
+                ExpressionAttributeNames={'#S': DDB_STATEMENT_NAME},
+                ExpressionAttributeValues={':statement_name': str(statement_name)},
+                ReturnConsumedCapacity=consumed_capacity_mode(),
+            )
+            add_consumed_capacity(STAGE_DDB_MARK, response)
+        except get_conditional_check_failed_exception():
+            logger.info({l_statement_name: str(statement_name), 'active_statement_key': active_statement_key,
+                         'message': 'Active statement was already released.'})
+
+    @classmethod
+    def query_latest_item(cls, partition_key: str, return_consumed_capacity: str) -> dict:
+        """
+        Get the invocation id, statement id and finished event details of the last item of a partition. This uses the
+        client of the resource, which still converts between DynamoDB and Python types, as it is called from multiple
+        threads.
+        """
+        return get_dynamodb().meta.client.query(
+            TableName=get_ddb_state_table().name,
+            KeyConditionExpression="#K = :partition_key",
+            ProjectionExpression="#I, #S, #D",
             ExpressionAttributeNames={
-                "#I": DDB_INVOCATION_ID
+                "#K": DDB_ID,
+                "#I": DDB_INVOCATION_ID,
+                "#S": DDB_STATEMENT_ID,
+                "#D": DDB_FINISHED_EVENT_DETAILS,
             },
+            ExpressionAttributeValues={':partition_key': partition_key},
+            ScanIndexForward=False,
+            Limit=1,
             ConsistentRead=True,
-            ReturnConsumedCapacity='NONE',
+            ReturnConsumedCapacity=return_consumed_capacity,
         )
-        logger.debug({l_response: response})
-        items = response['Items']
+
+    @classmethod
+    def get_latest_item_for_execution_arn(cls, execution_arn: str) -> dict:
+        """
+        Get the item of the latest statement issued for an execution ARN, with its invocation id, statement id and
+        finished event details. Invocation ids sort in order of registration so this only reads the last item of the
+        partition. When the state is sharded the last item of every shard is read in parallel and the latest of those
+        is returned.
+        """
+        partition_keys = cls.get_partition_keys_for_execution_arn(execution_arn)
+        return_consumed_capacity = consumed_capacity_mode()
+        if len(partition_keys) == 1:
+            responses = [cls.query_latest_item(partition_keys[0], return_consumed_capacity)]
+        else:
+            with ThreadPoolExecutor(max_workers=len(partition_keys)) as executor:
+                responses = list(executor.map(
+                    lambda partition_key: cls.query_latest_item(partition_key, return_consumed_capacity),
+                    partition_keys
+                ))
+        items = []
+        for response in responses:
+            add_consumed_capacity(STAGE_DDB_GET, response)
+            logger.debug({l_response: response})
+            items.extend(response['Items'])
         if len(items) == 0:
             e = PreviousExecutionNotFound(f"No started statements found for {execution_arn}")
-            logger.warning({l_exception: e, l_response: response}, stack_info=True)
+            logger.warning({l_exception: e, l_response: responses}, stack_info=True)
             raise e
-        return StatementName(
-            execution_arn,
-            invocation_id=str(max(float(i[DDB_INVOCATION_ID]) for i in items))
+        return max(items, key=lambda item: item[DDB_INVOCATION_ID])
+
+    @classmethod
+    def get_latest_statement_for_execution_arn(cls, execution_arn: str) -> Tuple[StatementName, Optional[str]]:
+        """
+        Get the latest statement issued for an execution ARN.
+
+        Returns:
+            The statement name and the Data API statement Id. The latter is None if it was not recorded (yet).
+        """
+        latest_item = cls.get_latest_item_for_execution_arn(execution_arn)
+        return StatementName(execution_arn, invocation_id=latest_item[DDB_INVOCATION_ID]), \
+            latest_item.get(DDB_STATEMENT_ID)
+
+    @classmethod
+    def query_unhandled_items(cls, partition_key: str, return_consumed_capacity: str) -> Tuple[List[dict], List[dict]]:
+        """
+        Get all items of a partition whose finished event has not been handled, following pagination.
+
+        Returns:
+            The items and the responses of the queries, for their consumed capacity.
+        """
+        items, responses = [], []
+        query_args = {}
+        while True:
+            response = get_dynamodb().meta.client.query(
+                TableName=get_ddb_state_table().name,
+                KeyConditionExpression="#K = :partition_key",
+                FilterExpression="attribute_not_exists(#D)",
+                ExpressionAttributeNames={"#K": DDB_ID, "#D": DDB_FINISHED_EVENT_DETAILS},
+                ExpressionAttributeValues={':partition_key': partition_key},
+                ConsistentRead=True,
+                ReturnConsumedCapacity=return_consumed_capacity,
+                **query_args
+            )
+            responses.append(response)
+            items.extend(response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                return items, responses
+            query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def get_unhandled_statements_for_execution_arn(self, execution_arn: str) -> 'DDBStateTableBatch':
+        """
+        Get the statements of an execution ARN whose finished event has not been handled, e.g. to cancel them. When the
+        state is sharded all shards are queried in parallel.
+
+        Returns:
+            A batch of the unhandled statements, see `DDBStateTableBatch`, their items are in `items`.
+        """
+        partition_keys = self.get_partition_keys_for_execution_arn(execution_arn)
+        return_consumed_capacity = consumed_capacity_mode()
+        with ThreadPoolExecutor(max_workers=len(partition_keys)) as executor:
+            results = list(executor.map(
+                lambda partition_key: self.query_unhandled_items(partition_key, return_consumed_capacity),
+                partition_keys
+            ))
+        items = {}
+        for partition_items, responses in results:
+            for response in responses:
+                add_consumed_capacity(STAGE_DDB_GET, response)
+            for item in partition_items:
+                items[str(StatementName(execution_arn, item[DDB_INVOCATION_ID]))] = item
+        logger.debug({l_statement_name: execution_arn, l_item: list(items)})
+        return DDBStateTableBatch(self, items)
+
+    @classmethod
+    def get_latest_statement_name_for_execution_arn(cls, execution_arn: str) -> StatementName:
+        statement_name, _ = cls.get_latest_statement_for_execution_arn(execution_arn)
+        return statement_name
+
+    def register_statement_id(self, statement_name: StatementName, statement_id: str) -> None:
+        """
+        Store the Data API statement Id with the statement such that it can be resolved without the Data API. This only
+        updates registered statements, it does not create an item for a statement whose item is gone.
+        """
+        response = self.update_item(
+            Key=self.get_key(statement_name),
+            UpdateExpression="SET #S = :statement_id",
+            ConditionExpression="attribute_exists(sqlStatement)",
+            ReturnConsumedCapacity=consumed_capacity_mode(),
+            ExpressionAttributeNames={
+                '#S': DDB_STATEMENT_ID
+            },
+            ExpressionAttributeValues={
+                ':statement_id': statement_id
+            }
         )
+        add_consumed_capacity(STAGE_DDB_REGISTER, response)
+
+    def register_admission_queued(self, statement_name: StatementName, priority: str) -> None:
+        """Record that a statement waits for an admission slot, e.g. to remove it from the queue when cancelled."""
+        response = self.update_item(
+            Key=self.get_key(statement_name),
+            UpdateExpression="SET #Q = :priority",
+            ConditionExpression="attribute_exists(sqlStatement)",
+            ReturnConsumedCapacity=consumed_capacity_mode(),
+            ExpressionAttributeNames={'#Q': DDB_ADMISSION_QUEUED},
+            ExpressionAttributeValues={':priority': priority}
+        )
+        add_consumed_capacity(STAGE_DDB_REGISTER, response)
 
     @classmethod
     def get_callback_source_for_statement_name(cls, statement_name: StatementName) -> CallbackInterface:
@@ -116,40 +440,126 @@ class DDBStateTable(object):
         Returns:
             The task token that requested issuing of this statement.
         """
-        response = ddb_state_table.get_item(
-            Key={
-                DDB_ID: statement_name.execution_arn,
-                DDB_INVOCATION_ID: statement_name.invocation_id,
-            },
+        response = get_ddb_state_table().get_item(
+            Key=cls.get_key(statement_name),
             AttributesToGet=[
                 DDB_CALLBACK_DETAILS,
             ],
             ConsistentRead=True,
-            ReturnConsumedCapacity='NONE',
+            ReturnConsumedCapacity=consumed_capacity_mode(),
         )
+        add_consumed_capacity(STAGE_DDB_GET, response)
         logger.debug({
             l_statement_name: statement_name,
             l_response: response
         })
         try:
             return CallbackSourceBuilder.get_callback_object_for_event(
-                json.loads(response['Item'][DDB_CALLBACK_DETAILS])
+                decode_callback_details(response['Item'][DDB_CALLBACK_DETAILS])
             )
         except KeyError as ke:
             raise NoTrackedState(f"No state for {statement_name}") from ke
 
+    @classmethod
+    def is_statement_name_handled(cls, statement_name: StatementName) -> bool:
+        """
+        Whether the finished event of a statement has been handled, e.g. when its callback was already sent by the
+        invocation that submitted it.
+        """
+        response = get_ddb_state_table().get_item(
+            Key=cls.get_key(statement_name),
+            AttributesToGet=[
+                DDB_FINISHED_EVENT_DETAILS,
+            ],
+            ConsistentRead=True,
+            ReturnConsumedCapacity=consumed_capacity_mode(),
+        )
+        add_consumed_capacity(STAGE_DDB_GET, response)
+        return DDB_FINISHED_EVENT_DETAILS in response.get('Item', {})
+
+    @classmethod
+    def is_statement_name_queued(cls, statement_name: StatementName) -> bool:
+        """
+        Whether a statement waits for an admission slot: it was queued and has neither been submitted nor handled.
+        Such a statement is not known by the Data API yet.
+        """
+        response = get_ddb_state_table().get_item(
+            Key=cls.get_key(statement_name),
+            AttributesToGet=[
+                DDB_ADMISSION_QUEUED,
+                DDB_STATEMENT_ID,
+                DDB_FINISHED_EVENT_DETAILS,
+            ],
+            ConsistentRead=True,
+            ReturnConsumedCapacity=consumed_capacity_mode(),
+        )
+        add_consumed_capacity(STAGE_DDB_GET, response)
+        item = response.get('Item', {})
+        submitted_or_handled = DDB_STATEMENT_ID in item or DDB_FINISHED_EVENT_DETAILS in item
+        return DDB_ADMISSION_QUEUED in item and not submitted_or_handled
+
+    @classmethod
+    def get_items_for_statement_names(cls, statement_names: List[StatementName]) -> Dict[str, dict]:
+        """
+        Fetch the tracked items for multiple statement names using BatchGetItem. Items are returned keyed by the string
+        representation of their statement name; statement names without tracked state are absent from the result.
+        """
+        keys = {}
+        for statement_name in statement_names:
+            # BatchGetItem rejects duplicate keys which SQS can deliver within one batch.
+            keys[str(statement_name)] = cls.get_key(statement_name)
+        keys = list(keys.values())
+        items = {}
+        for i in range(0, len(keys), DDB_BATCH_GET_MAX_KEYS):
+            request_items = {
+                get_ddb_state_table().name: {
+                    'Keys': keys[i:i + DDB_BATCH_GET_MAX_KEYS],
+                    'ConsistentRead': True,
+                }
+            }
+            attempts = 0
+            while request_items:
+                if attempts > 0:
+                    # Keys are left unprocessed when the table is throttled, back off before requesting them again.
+                    if attempts >= MAX_ATTEMPTS:
+                        raise UnprocessedItems(f"Keys left unprocessed after {attempts} attempts: {request_items}")
+                    time.sleep(get_retry_delay(attempts))
+                response = get_dynamodb().batch_get_item(
+                    RequestItems=request_items, ReturnConsumedCapacity=consumed_capacity_mode()
+                )
+                attempts += 1
+                add_consumed_capacity(STAGE_DDB_GET, response)
+                logger.debug({l_response: response})
+                for item in response['Responses'].get(get_ddb_state_table().name, []):
+                    statement_name = StatementName(
+                        cls.get_execution_arn_for_partition_key(item[DDB_ID]), item[DDB_INVOCATION_ID]
+                    )
+                    items[str(statement_name)] = item
+                request_items = response.get('UnprocessedKeys')
+        return items
+
+    def batch(self, statement_names: List[StatementName]) -> 'DDBStateTableBatch':
+        """
+        Get a view on this state table for processing a batch of finished statements. The state of all statement
+        names is fetched upfront and marking statements as handled is buffered until `DDBStateTableBatch.flush`.
+        """
+        return DDBStateTableBatch(self, self.get_items_for_statement_names(statement_names))
+
     @classmethod
     def get_ttl_value(cls) -> int:
         expiry_time = datetime.utcnow() + timedelta(days=ddb_ttl_in_days)
         return int(expiry_time.timestamp())
 
-    def mark_statement_name_as_handled(self, statement_name: StatementName, finished_event_details: dict) -> None:
+    def mark_statement_name_as_handled(self, statement_name: StatementName, finished_event_details: dict) -> dict:
         """
         We take the convention that if a TTL is set the statement_name has been processed. The TTL will allow automatic
         cleanup from DDB.
         Args:
             statement_name:
             finished_event_details: information reported by Data API finished event
+
+        Returns:
+            The item as it was before it was marked.
         """
         ttl_field = self.get_ttl_value()
 
@@ -159,24 +569,174 @@ class DDBStateTable(object):
             l_ttl: ttl_field
         })
         response = self.update_item(
-            Key={
-                DDB_ID: statement_name.execution_arn,
-                DDB_INVOCATION_ID: statement_name.invocation_id,
-            },
+            Key=self.get_key(statement_name),
             UpdateExpression="SET #T = :ttl, #D = :details",
             ReturnValues='ALL_OLD',
-            ReturnConsumedCapacity='NONE',
+            ReturnConsumedCapacity=consumed_capacity_mode(),
             ExpressionAttributeNames={
                 '#T': DDB_TTL,
                 '#D': DDB_FINISHED_EVENT_DETAILS
             },
             ExpressionAttributeValues={
                 ':ttl': ttl_field,
-                ':details': finished_event_details
+                ':details': encode_finished_event_details(finished_event_details)
             }
         )
+        add_consumed_capacity(STAGE_DDB_MARK, response)
         logger.debug({
             l_statement_name: statement_name,
             l_response: response,
             l_ttl: ttl_field
         })
+        active_statement_key = response.get('Attributes', {}).get(DDB_ACTIVE_STATEMENT_KEY)
+        if active_statement_key is not None:
+            self.release_active_statement(statement_name, active_statement_key)
+        return response.get('Attributes', {})
+
+
+class DDBStateTableBatch(object):
+    """
+    Batch-aware counterpart of `DDBStateTable` for a batch of finished events. Lookups are served from items fetched
+    with a single BatchGetItem and marking statements as handled is buffered until the batch is flushed. The fetched
+    items are a snapshot, so the handled fields are written with a conditional UpdateItem per statement rather than by
+    writing back the snapshot, which would overwrite concurrent updates (e.g. the statement Id and admission priority
+    registered after submitting, or statements handled by an inline wait or cancelExecution).
+    """
+
+    def __init__(self, state_table: DDBStateTable, items: Dict[str, dict]):
+        self.state_table = state_table
+        self.items = items
+        self.handled_items = {}  # Statement name -> (ttl, encoded finished event details)
+        self.written_items = {}  # Statement name -> item before it was marked, of the statements written by a flush
+
+    def get_callback_source_for_statement_name(self, statement_name: StatementName) -> CallbackInterface:
+        try:
+            item = self.items[str(statement_name)]
+            return CallbackSourceBuilder.get_callback_object_for_event(
+                decode_callback_details(item[DDB_CALLBACK_DETAILS])
+            )
+        except KeyError as ke:
+            raise NoTrackedState(f"No state for {statement_name}") from ke
+
+    def is_statement_name_handled(self, statement_name: StatementName) -> bool:
+        return DDB_FINISHED_EVENT_DETAILS in self.items.get(str(statement_name), {})
+
+    def mark_statement_name_as_handled(self, statement_name: StatementName, finished_event_details: dict) -> None:
+        ttl_field = self.state_table.get_ttl_value()
+        logger.debug({
+            l_statement_name: str(statement_name),
+            l_finished_event_details: finished_event_details,
+            l_ttl: ttl_field
+        })
+        self.handled_items[str(statement_name)] = (ttl_field, encode_finished_event_details(finished_event_details))
+
+    def mark_handled_item(self, statement_name: str, ttl_field: int, details: dict) -> Tuple[Optional[dict], dict]:
+        """
+        Set the handled fields of a statement unless it was handled concurrently.
+
+        Returns:
+            The item as it was before it was marked, None if it was already handled, and the response for its consumed
+            capacity.
+        """
+        try:
+            response = self.state_table.update_item(
+                Key=self.state_table.get_key(StatementName.from_str(statement_name)),
+                UpdateExpression="SET #T = :ttl, #D = :details",
+                ConditionExpression="attribute_not_exists(#D)",
+                ReturnValues='ALL_OLD',
+                ReturnConsumedCapacity=consumed_capacity_mode(),
+                ExpressionAttributeNames={'#T': DDB_TTL, '#D': DDB_FINISHED_EVENT_DETAILS},
+                ExpressionAttributeValues={':ttl': ttl_field, ':details': details},
+            )
+        except get_conditional_check_failed_exception() as e:
+            logger.info({l_statement_name: statement_name, 'message': 'Statement was already handled.'})
+            return None, e.response
+        logger.debug({l_statement_name: statement_name, l_response: response})
+        return response.get('Attributes', {}), response
+
+    def flush(self) -> Dict[str, dict]:
+        """
+        Write the handled fields of all statements that were marked as handled, the updates are sent in parallel. The
+        callbacks of the statements are sent already so failed updates are sent again with a backoff rather than
+        failing the records. When updates still fail after MAX_ATTEMPTS the last error is raised, the statements that
+        were written are in `written_items` and the others are left in `handled_items`.
+
+        Returns:
+            The items as they were before they were marked by statement name, of the statements this flush marked.
+            Statements that were handled concurrently are left out.
+        """
+        self.written_items = {}
+        attempts = 0
+        while self.handled_items:
+            if attempts > 0:
+                time.sleep(get_retry_delay(attempts))
+            error = self.write_handled_items()
+            attempts += 1
+            if error is not None and attempts >= MAX_ATTEMPTS:
+                raise error
+        return self.written_items
+
+    def write_handled_items(self) -> Optional[Exception]:
+        """
+        Send an update for every statement in `handled_items`. Statements whose update failed are put back.
+
+        Returns:
+            The last error of a failed update, None if all updates succeeded.
+        """
+        handled_items = list(self.handled_items.items())
+        self.handled_items.clear()
+        with ThreadPoolExecutor(max_workers=min(len(handled_items), DDB_MARK_CONCURRENCY)) as executor:
+            futures = [executor.submit(self.mark_handled_item, statement_name, ttl_field, details)
+                       for statement_name, (ttl_field, details) in handled_items]
+        error = None
+        for (statement_name, handled_item), future in zip(handled_items, futures):
+            try:
+                previous_item, response = future.result()
+            except Exception as e:
+                logger.warning({l_statement_name: statement_name, l_exception: e})
+                self.handled_items[statement_name] = handled_item
+                error = e
+                continue
+            # Consumed capacity is added here as the metrics of this invocation are not visible to the executor threads.
+            add_consumed_capacity(STAGE_DDB_MARK, response)
+            if previous_item is None:
+                continue
+            self.written_items[statement_name] = previous_item
+            if DDB_ACTIVE_STATEMENT_KEY in previous_item:
+                # Only singleton statements have an active statement entry.
+                try:
+                    self.state_table.release_active_statement(
+                        StatementName.from_str(statement_name), previous_item[DDB_ACTIVE_STATEMENT_KEY]
+                    )
+                except Exception as e:
+                    # The statement is handled, a later singleton execution checks whether the claim is still running.
+                    logger.error({l_statement_name: statement_name, l_exception: e})
+        return error
+        with ThreadPoolExecutor(max_workers=min(len(handled_items), DDB_MARK_CONCURRENCY)) as executor:
+            futures = [executor.submit(self.mark_handled_item, statement_name, ttl_field, details)
+                       for statement_name, (ttl_field, details) in handled_items]
+        error = None
+        for (statement_name, _), future in zip(handled_items, futures):
+            try:
+                previous_item, response = future.result()
+            except Exception as e:
+                logger.error({l_statement_name: statement_name, l_exception: e})
+                error = error or e
+                continue
+            # Consumed capacity is added here as the metrics of this invocation are not visible to the executor threads.
+            add_consumed_capacity(STAGE_DDB_MARK, response)
+            if previous_item is None:
+                continue
+            self.written_items[statement_name] = previous_item
+            if DDB_ACTIVE_STATEMENT_KEY in previous_item:
+                # Only singleton statements have an active statement entry.
+                try:
+                    self.state_table.release_active_statement(
+                        StatementName.from_str(statement_name), previous_item[DDB_ACTIVE_STATEMENT_KEY]
+                    )
+                except Exception as e:
+                    logger.error({l_statement_name: statement_name, l_exception: e})
+                    error = error or e
+        if error is not None:
+            raise error
+        return self.written_items
@@ -0,0 +1,78 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Encoding of the state items. Items used to hold the full SQL text, the callback details as JSON string and the complete
+finished event. These can get large (multi-row INSERT statements can be hundreds of KB) which costs WCUs/RCUs and can
+get close to the 400KB item limit. The compact format holds:
+ - A hash and a preview of the SQL text, optionally the full text is stored in the result bucket
+ - The callback details as zlib compressed JSON (binary attribute)
+ - Only the fields of the finished event that are used when handling statements
+Decoders support both formats.
+"""
+
+
+import hashlib
+import json
+import os
+import zlib
+
+from boto3.dynamodb.types import Binary
+
+from ddb import DDB_SQL_HASH, DDB_SQL_LOCATION
+from environment_labels import OFFLOAD_SQL_STATEMENTS
+from event_labels import SQL_STATEMENT
+from result_store import is_result_store_configured, store_result
+from sql_text import hash_sql_statement
+
+SQL_PREVIEW_LENGTH = 1024
+FINISHED_EVENT_FIELDS = ['time']
+FINISHED_EVENT_DETAIL_FIELDS = ['statementId', 'state', 'rows', 'error']
+
+
+def is_sql_offload_enabled() -> bool:
+    return os.environ.get(OFFLOAD_SQL_STATEMENTS, 'false').lower() == 'true' and is_result_store_configured()
+
+
+def get_sql_text_key(sql_statement: str) -> str:
+    return hashlib.sha256(sql_statement.encode('utf-8')).hexdigest()
+
+
+def encode_sql_statement(sql_statement: str) -> dict:
+    """
+    Get the item attributes that track a SQL statement.
+    """
+    sql_hash = hash_sql_statement(sql_statement)
+    attributes = {
+        SQL_STATEMENT: sql_statement[:SQL_PREVIEW_LENGTH],
+        DDB_SQL_HASH: sql_hash,
+    }
+    if len(sql_statement) > SQL_PREVIEW_LENGTH and is_sql_offload_enabled():
+        # Keyed on a hash of the exact text so only identical statements share the stored text. The normalized hash
+        # identifies statements that are the same SQL but may be formatted differently.
+        attributes[DDB_SQL_LOCATION] = store_result(f"sql_statements/{get_sql_text_key(sql_statement)}.json",
+                                                    {SQL_STATEMENT: sql_statement})
+    return attributes
+
+
+def encode_callback_details(callback_json: str) -> bytes:
+    return zlib.compress(callback_json.encode('utf-8'))
+
+
+def decode_callback_details(value) -> dict:
+    if isinstance(value, Binary):
+        value = value.value
+    if isinstance(value, bytes):
+        return json.loads(zlib.decompress(value).decode('utf-8'))
+    # Items registered before the compact format hold the callback details as JSON string.
+    return json.loads(value)
+
+
+def encode_finished_event_details(finished_event: dict) -> dict:
+    """
+    Only keep the fields of a finished event that are used once the statement is handled. The structure is the same as
+    the finished event so both formats can be read the same way.
+    """
+    compact = {field: finished_event[field] for field in FINISHED_EVENT_FIELDS if field in finished_event}
+    detail = finished_event.get('detail', {})
+    compact['detail'] = {field: detail[field] for field in FINISHED_EVENT_DETAIL_FIELDS if field in detail}
+    return compact
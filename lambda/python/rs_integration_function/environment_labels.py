@@ -6,4 +6,33 @@ CLUSTER_IDENTIFIER = 'CLUSTER_IDENTIFIER'
 DATABASE = 'DATABASE'
 DB_USER = 'DB_USER'
 
+# Optional: maximum number of records of an SQS batch of finished events that are handled in parallel (default 1).
+CALLBACK_CONCURRENCY = 'CALLBACK_CONCURRENCY'
+# Optional: S3 bucket and key prefix to store statement results that are too large to return inline.
+RESULT_BUCKET = 'RESULT_BUCKET'
+RESULT_PREFIX = 'RESULT_PREFIX'
+# Optional: set to 'true' to store the full text of long SQL statements in RESULT_BUCKET rather than only a preview.
+OFFLOAD_SQL_STATEMENTS = 'OFFLOAD_SQL_STATEMENTS'
+# Optional: number of shards the state of one execution ARN is spread over (default 1, i.e. not sharded).
+STATE_TABLE_SHARDS = 'STATE_TABLE_SHARDS'
+# Optional: seconds to wait for a statement to complete before relying on its finished event (default 0, no wait).
+INLINE_WAIT_SECONDS = 'INLINE_WAIT_SECONDS'
+# Optional: set to 'false' to stop emitting per-stage latency metrics (default 'true') and their CloudWatch namespace.
+METRICS_ENABLED = 'METRICS_ENABLED'
+METRICS_NAMESPACE = 'METRICS_NAMESPACE'
+# Optional: set to 'true' to cache results of statements that are executed with a result cache TTL, the maximum size in
+# bytes of a cached result and the size in bytes of the in-memory cache of a warm container.
+RESULT_CACHE_ENABLED = 'RESULT_CACHE_ENABLED'
+RESULT_CACHE_MAX_BYTES = 'RESULT_CACHE_MAX_BYTES'
+RESULT_CACHE_MEMORY_BYTES = 'RESULT_CACHE_MEMORY_BYTES'
+# Optional: maximum number of running statements with a callback per priority e.g. 'high=20,normal=10,low=2'. Statements
+# of other priorities are not limited (default no limits).
+ADMISSION_LIMITS = 'ADMISSION_LIMITS'
+# Optional: set to 'true' to rate limit AWS API calls per API with an adaptive (AIMD) token bucket and retry throttled
+# and transient errors with jittered backoff instead of the botocore retries (default 'false').
+ADAPTIVE_RATE_LIMITING = 'ADAPTIVE_RATE_LIMITING'
+# Optional: seconds a warm container answers describeStatement from memory for statements that have not completed
+# (default 0, disabled). Descriptions of completed statements are kept in memory regardless.
+DESCRIBE_CACHE_SECONDS = 'DESCRIBE_CACHE_SECONDS'
+
 env_variable_labels = [CLUSTER_IDENTIFIER, DATABASE, DB_USER]
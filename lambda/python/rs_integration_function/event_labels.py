@@ -5,11 +5,20 @@
 TASK_TOKEN = "taskToken"
 EXECUTION_ARN = "executionArn"
 SQL_STATEMENT = 'sqlStatement'
+SQL_STATEMENTS = 'sqlStatements'
 STATEMENT_ID = 'statementId'
 NEXT_TOKEN = 'nextToken'
+PARAMETERS = 'parameters'
+INLINE_PARAMETERS = 'inlineParameters'
+FETCH_ALL = 'fetchAll'
+INLINE_WAIT = 'inlineWaitSeconds'
+RESULT_CACHE_TTL = 'resultCacheTtlSeconds'
+PRIORITY = 'priority'
 ACTION = 'action'
 DESCRIBE_STATEMENT = 'describeStatement'
 GET_STATEMENT_RESULT = 'getStatementResult'
 CANCEL_STATEMENT = 'cancelStatement'
+CANCEL_EXECUTION = 'cancelExecution'
 EXECUTE_STATEMENT = 'executeStatement'
 EXECUTE_SINGLETON_STATEMENT = 'executeSingletonStatement'
+EXECUTE_BATCH_STATEMENT = 'executeBatchStatement'
@@ -21,3 +21,19 @@ class PreviousExecutionNotFound(Exception):
 
 class NoTrackedState(Exception):
     """DDB is not tracking state for a Statement name. This is unexpected."""
+
+
+class ResultTooLarge(Exception):
+    """A statement result does not fit in the response and no result bucket is configured to store it."""
+
+
+class UnprocessedItems(Exception):
+    """DynamoDB left items of a batch request unprocessed after all attempts, e.g. because the table is throttled."""
+
+
+class ActiveStatementExists(Exception):
+    """An active statement with the same SQL text is already registered in the state table."""
+
+    def __init__(self, statement_name: str):
+        super(ActiveStatementExists, self).__init__(f"Active statement {statement_name} has the same SQL text.")
+        self.statement_name = statement_name
@@ -2,31 +2,60 @@
 # SPDX-License-Identifier: MIT-0
 
 
+import os
 import traceback
 import json
-from aws_lambda_powertools.utilities.batch import sqs_batch_processor
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from botocore.exceptions import ClientError
 
 from callback_sources.builder import CallbackSourceBuilder
 from callback_sources.helper import CallbackInterface, NoCallback
-from ddb.ddb_state_table import DDBStateTable
-from exceptions import ConcurrentExecution, InvalidRequest
+from ddb import DDB_INVOCATION_ID, DDB_STATEMENT_ID, DDB_FINISHED_EVENT_DETAILS, DDB_ADMISSION_PRIORITY, \
+    DDB_ADMISSION_QUEUED
+from ddb.admission_control import DEFAULT_PRIORITY, is_admission_controlled, acquire_slot, release_slot, enqueue, \
+    peek, remove, reclaim_expired_slots
+from ddb.ddb_state_table import DDBStateTable, DDBStateTableBatch
+from exceptions import ConcurrentExecution, InvalidRequest, ConfigurationError, ActiveStatementExists
 from integration import sanitize_response
 from logger import logger, l_sanitized_response, l_response, l_record, l_traceback, l_exception, \
-    l_callback_object
-from environment_labels import env_variable_labels
+    l_callback_object, l_statement_name
+from metrics import record_metrics, set_dimensions, stage, DIMENSION_ACTION, DIMENSION_CALLBACK_TYPE, \
+    STAGE_DDB_REGISTER, STAGE_EXECUTE_STATEMENT, STAGE_DDB_GET, STAGE_DESCRIBE_STATEMENT, STAGE_CALLBACK, \
+    STAGE_DDB_MARK, STAGE_INLINE_WAIT, STAGE_RESULT_CACHE, STAGE_CANCEL_STATEMENT, STAGE_ADMISSION
+from environment_labels import env_variable_labels, CALLBACK_CONCURRENCY, INLINE_WAIT_SECONDS
 from event_labels import (
     EXECUTION_ARN, SQL_STATEMENT, STATEMENT_ID, ACTION, DESCRIBE_STATEMENT, GET_STATEMENT_RESULT,
-    NEXT_TOKEN, CANCEL_STATEMENT, EXECUTE_SINGLETON_STATEMENT, EXECUTE_STATEMENT
+    NEXT_TOKEN, CANCEL_STATEMENT, EXECUTE_SINGLETON_STATEMENT, EXECUTE_STATEMENT, FETCH_ALL, SQL_STATEMENTS,
+    EXECUTE_BATCH_STATEMENT, PARAMETERS, INLINE_PARAMETERS, INLINE_WAIT, RESULT_CACHE_TTL, CANCEL_EXECUTION, PRIORITY
 )
 from assertion import assert_env_set
-from redshift_data.api import describe_statement, \
-    get_statement_result, cancel_statement, get_statement_id_for_statement_name, execute_statement, \
-    is_statement_in_active_state
+from redshift_data.api import describe_statement, get_statement_result, get_full_statement_result, \
+    cancel_statement, get_statement_id_for_statement_name, execute_statement, is_statement_name_in_active_state, \
+    batch_execute_statement, wait_for_statement, get_statement_description, remember_statement_description
 from redshift_data.finished_event import FinishedEvent
+from redshift_data.result_cache import is_result_cache_enabled, get_result_cache_key, get_cached_statement, \
+    put_cached_statement, set_cached_statement_finished, get_cached_finished_event
+from sqs_processor import ConcurrentSQSProcessor
+from sql_text import is_read_only_statement
 from statement_class import StatementName
+from step_function.api import StepFunctionAPI
 
 for env_variable_label in env_variable_labels:
     assert_env_set(env_variable_label)
+try:
+    callback_concurrency = int(os.environ.get(CALLBACK_CONCURRENCY, 1))
+except ValueError:
+    raise ConfigurationError(f"{CALLBACK_CONCURRENCY} should be the number of callbacks that are sent in parallel.")
+StepFunctionAPI.max_pool_connections = max(StepFunctionAPI.max_pool_connections, callback_concurrency)
+try:
+    default_inline_wait_seconds = float(os.environ.get(INLINE_WAIT_SECONDS, 0))
+except ValueError:
+    raise ConfigurationError(f"{INLINE_WAIT_SECONDS} should be the number of seconds to wait for a statement.")
+# Waiting is bounded well below the Lambda timeout, longer statements are better served by their finished event.
+MAX_INLINE_WAIT_SECONDS = 20
 
 ddb_sfn_state_table = DDBStateTable()
 
@@ -35,7 +64,8 @@ def handler(event: dict, context):
     """
     The entry point of an execution only task is to guarantee that returned object is JSON serializable.
     """
-    sanitized_response = sanitize_response(_handler(event, context))
+    with record_metrics(action="pre_routing"):
+        sanitized_response = sanitize_response(_handler(event, context))
     logger.debug({l_sanitized_response: sanitized_response})
     return sanitized_response
 
@@ -47,40 +77,150 @@ def get_statement_id(event: dict) -> str:
     """
     provided_statement_id = event[STATEMENT_ID]
     if provided_statement_id == 'LATEST':
-        assert EXECUTION_ARN in event, f"The field {EXECUTION_ARN} is mandatory for {STATEMENT_ID}='LATEST'!"
-        statement_name = ddb_sfn_state_table.get_latest_statement_name_for_execution_arn(event[EXECUTION_ARN])
-        return get_statement_id_for_statement_name(str(statement_name))
+        return get_latest_statement_id(event, get_latest_item(event))
     else:
         return provided_statement_id
 
 
+def get_latest_item(event: dict) -> dict:
+    assert EXECUTION_ARN in event, f"The field {EXECUTION_ARN} is mandatory for {STATEMENT_ID}='LATEST'!"
+    return ddb_sfn_state_table.get_latest_item_for_execution_arn(event[EXECUTION_ARN])
+
+
+def get_latest_statement_id(event: dict, latest_item: dict) -> str:
+    statement_id = latest_item.get(DDB_STATEMENT_ID)
+    if statement_id is None:
+        # Statement Id was not recorded (yet), fall back on the Data API.
+        statement_name = StatementName(event[EXECUTION_ARN], invocation_id=latest_item[DDB_INVOCATION_ID])
+        return get_statement_id_for_statement_name(str(statement_name))
+    return statement_id
+
+
+def describe_statement_for_event(event: dict) -> dict:
+    """
+    Describe the statement of a describeStatement event. When the finished event of the latest statement of an
+    execution has been handled its stored details answer, they are read with the item that resolves 'LATEST'.
+    """
+    if event[STATEMENT_ID] != 'LATEST':
+        return get_statement_description(event[STATEMENT_ID])
+    latest_item = get_latest_item(event)
+    if DDB_FINISHED_EVENT_DETAILS in latest_item:
+        return FinishedEvent(latest_item[DDB_FINISHED_EVENT_DETAILS]).to_statement_description()
+    return get_statement_description(get_latest_statement_id(event, latest_item))
+
+
+def set_function_label(function: str):
+    """Label the logs and the metrics of this invocation with the function that handles it."""
+    logger.structure_logs(append=True, function=function)
+    set_dimensions(**{DIMENSION_ACTION: function})
+
+
 def _handler(event: dict, context):
-    logger.structure_logs(append=True, function="pre_routing")
+    set_function_label("pre_routing")
     logger.debug(event)
     if "Records" in event:
-        logger.structure_logs(append=True, function="complete_statement")
+        set_function_label("complete_statement")
         # This event is an SQS record so this is a finished Redshift Data API event
         return sqs_finished_data_api_request_handler(event, context)
     elif SQL_STATEMENT in event:
-        logger.structure_logs(append=True, function="execute_statement")
+        set_function_label("execute_statement")
         return handle_redshift_statement_invocation_event(event)
+    elif SQL_STATEMENTS in event:
+        set_function_label("execute_batch_statement")
+        return handle_redshift_batch_statement_invocation_event(event)
     elif STATEMENT_ID in event and ACTION in event and event[ACTION] == DESCRIBE_STATEMENT:
-        logger.structure_logs(append=True, function="describe_statement")
-        return describe_statement(get_statement_id(event))
+        set_function_label("describe_statement")
+        return describe_statement_for_event(event)
     elif STATEMENT_ID in event and ACTION in event and event[ACTION] == GET_STATEMENT_RESULT:
-        logger.structure_logs(append=True, function="get_statement_result")
+        set_function_label("get_statement_result")
+        if event.get(FETCH_ALL, False):
+            return get_full_statement_result(get_statement_id(event))
         return get_statement_result(get_statement_id(event), next_token=event.get(NEXT_TOKEN))
     elif STATEMENT_ID in event and ACTION in event and event[ACTION] == CANCEL_STATEMENT:
-        logger.structure_logs(append=True, function="cancel_statement")
+        set_function_label("cancel_statement")
         return cancel_statement(get_statement_id(event))
+    elif ACTION in event and event[ACTION] == CANCEL_EXECUTION:
+        set_function_label("cancel_execution")
+        if EXECUTION_ARN not in event:
+            raise InvalidRequest(f"The field {EXECUTION_ARN} is mandatory for {CANCEL_EXECUTION} {event}")
+        return cancel_execution(event[EXECUTION_ARN])
     else:
         raise InvalidRequest(f"Unsupported invocation event {event}.")
 
+# Statements of an execution that are cancelled in parallel, this matches the connection pool of the Data API client.
+CANCEL_CONCURRENCY = 10
+CANCELLED = 'CANCELLED'
+NOT_ACTIVE = 'NOT_ACTIVE'
+CANCEL_FAILED = 'FAILED'
+
+
+def cancel_tracked_statement(statement_name: str, item: dict) -> dict:
+    """
+    Cancel a statement that is tracked in the state table. A statement that is no longer active completes through its
+    finished event as usual.
+
+    Returns:
+        The outcome with statementName, statementId, status (CANCELLED, NOT_ACTIVE or FAILED) and error if it failed.
+    """
+    outcome = {'statementName': statement_name, 'statementId': item.get(DDB_STATEMENT_ID)}
+    try:
+        if outcome['statementId'] is None and DDB_ADMISSION_QUEUED in item:
+            # A queued statement is cancelled by taking it from its queue, unless it is being admitted right now.
+            with stage(STAGE_ADMISSION):
+                request = remove(item[DDB_ADMISSION_QUEUED], StatementName.from_str(statement_name))
+            if request is not None:
+                outcome['status'] = CANCELLED
+                return outcome
+        if outcome['statementId'] is None:
+            # The statement Id was not recorded (yet), fall back on the Data API.
+            outcome['statementId'] = get_statement_id_for_statement_name(statement_name)
+        cancel_statement(outcome['statementId'])
+        outcome['status'] = CANCELLED
+    except ClientError as e:
+        outcome['status'] = NOT_ACTIVE if e.response['Error']['Code'] == 'ValidationException' else CANCEL_FAILED
+        outcome['error'] = str(e)
+    except Exception as e:
+        outcome['status'] = CANCEL_FAILED
+        outcome['error'] = str(e)
+    return outcome
+
+
+def cancel_execution(execution_arn: str) -> dict:
+    """
+    Cancel all statements of an execution whose finished event has not been handled, e.g. when a workflow is aborted, so
+    they release their cluster capacity. Statements are cancelled in parallel and the cancelled ones are marked as
+    handled without sending their callback, their finished events are ignored.
+    """
+    with stage(STAGE_DDB_GET):
+        state_table_batch = ddb_sfn_state_table.get_unhandled_statements_for_execution_arn(execution_arn)
+    statements = list(state_table_batch.items.items())
+    outcomes = []
+    if statements:
+        with stage(STAGE_CANCEL_STATEMENT):
+            with ThreadPoolExecutor(max_workers=min(CANCEL_CONCURRENCY, len(statements))) as executor:
+                outcomes = list(executor.map(lambda statement: cancel_tracked_statement(*statement), statements))
+    for outcome in outcomes:
+        if outcome['status'] == CANCELLED:
+            finished_event = FinishedEvent.from_cancellation(
+                outcome['statementName'], outcome['statementId'], f"Cancelled by {CANCEL_EXECUTION}"
+            )
+            state_table_batch.mark_statement_name_as_handled(StatementName.from_str(outcome['statementName']),
+                                                             finished_event)
+    try:
+        with stage(STAGE_DDB_MARK):
+            state_table_batch.flush()
+    finally:
+        for statement_name, item in state_table_batch.written_items.items():
+            release_admission(StatementName.from_str(statement_name), item.get(DDB_ADMISSION_PRIORITY))
+    logger.info({EXECUTION_ARN: execution_arn, l_response: outcomes})
+    return {EXECUTION_ARN: execution_arn, 'statements': outcomes}
+
+
 def make_statement_invocation_parameters(event):
     
     params = None
-    if 'parameters' in event:
-        params = event['parameters']
+    if PARAMETERS in event:
+        params = event[PARAMETERS]
     return params
     
 
@@ -95,30 +235,374 @@ def handle_redshift_statement_invocation_event(event):
         callback_object = CallbackSourceBuilder.get_callback_object_for_event(event)
         
         paras = make_statement_invocation_parameters(event)
+        inline_parameters = event.get(INLINE_PARAMETERS, True)
         
-        return handle_redshift_statement_invocation(sql_statement, callback_object, run_as_singleton, paras)
+        return handle_redshift_statement_invocation(sql_statement, callback_object, run_as_singleton, paras,
+                                                    inline_parameters, get_inline_wait_seconds(event),
+                                                    get_result_cache_ttl_seconds(event), get_priority(event))
     else:
         raise InvalidRequest(f"Unsupported {ACTION} to execute sql_statement {event}")
 
 
-def handle_redshift_statement_invocation(sql_statement: str, callback_object: CallbackInterface, run_as_singleton=False, params = None):
-    
-    
-    if run_as_singleton and is_statement_in_active_state(sql_statement):
-        raise ConcurrentExecution(f"There is already an instance of {sql_statement} running.")
-    statement_name = ddb_sfn_state_table.register_execution_start(callback_object, sql_statement)
+def get_inline_wait_seconds(event: dict) -> float:
+    try:
+        inline_wait_seconds = float(event.get(INLINE_WAIT, default_inline_wait_seconds))
+    except (TypeError, ValueError):
+        raise InvalidRequest(f"{INLINE_WAIT} should be a number of seconds {event}")
+    return min(max(inline_wait_seconds, 0), MAX_INLINE_WAIT_SECONDS)
+
+
+def get_result_cache_ttl_seconds(event: dict) -> float:
+    """The result cache TTL of a statement, 0 when its result should not be cached."""
+    try:
+        result_cache_ttl_seconds = float(event.get(RESULT_CACHE_TTL, 0))
+    except (TypeError, ValueError):
+        raise InvalidRequest(f"{RESULT_CACHE_TTL} should be a number of seconds {event}")
+    if result_cache_ttl_seconds <= 0 or not is_result_cache_enabled():
+        return 0
+    if not is_read_only_statement(event[SQL_STATEMENT]):
+        raise InvalidRequest(f"{RESULT_CACHE_TTL} is only supported for read-only statements {event}")
+    return result_cache_ttl_seconds
+
+
+def get_priority(event: dict) -> str:
+    priority = event.get(PRIORITY, DEFAULT_PRIORITY)
+    if not isinstance(priority, str):
+        raise InvalidRequest(f"{PRIORITY} should be the name of a priority {event}")
+    return priority
+
+
+# A statement is claimed as active before it is submitted so for a short while it is not yet known by the Data API.
+ACTIVE_STATEMENT_SUBMISSION_GRACE = timedelta(minutes=1)
+
+
+def is_active_statement_owner_running(statement_name: str) -> bool:
+    """
+    The active statement index is released when the finished event of its statement is handled. Finished events are not
+    guaranteed (e.g. statements without callback are executed without event) so the owner is verified before its claim
+    is considered stale. An owner that waits for an admission slot keeps its claim until it is submitted or handled.
+    """
+    owner = StatementName.from_str(statement_name)
+    if datetime.utcnow() - owner.invocation_id_to_datetime() < ACTIVE_STATEMENT_SUBMISSION_GRACE:
+        return True
+    if ddb_sfn_state_table.is_statement_name_queued(owner):
+        return True
+    return is_statement_name_in_active_state(statement_name)
+
+
+def register_singleton_execution_start(callback_object: CallbackInterface, sql_statement: str,
+                                       admission_priority: Optional[str] = None) -> StatementName:
+    try:
+        return ddb_sfn_state_table.register_execution_start(callback_object, sql_statement, run_as_singleton=True,
+                                                            admission_priority=admission_priority)
+    except ActiveStatementExists as ase:
+        previous_statement_name = ase.statement_name
+        if previous_statement_name is not None and is_active_statement_owner_running(previous_statement_name):
+            raise ConcurrentExecution(f"There is already an instance of {sql_statement} running.") from ase
+    try:
+        # The previous owner is no longer running so take over its claim.
+        return ddb_sfn_state_table.register_execution_start(callback_object, sql_statement, run_as_singleton=True,
+                                                            previous_statement_name=previous_statement_name,
+                                                            admission_priority=admission_priority)
+    except ActiveStatementExists as ase:
+        raise ConcurrentExecution(f"There is already an instance of {sql_statement} running.") from ase
+
+
+def handle_redshift_statement_invocation(sql_statement: str, callback_object: CallbackInterface, run_as_singleton=False,
+                                         params=None, inline_parameters=True, inline_wait_seconds=0,
+                                         result_cache_ttl_seconds=0, priority=DEFAULT_PRIORITY):
+    set_dimensions(**{DIMENSION_CALLBACK_TYPE: type(callback_object).__name__})
     with_event = not isinstance(callback_object, NoCallback)
     if not with_event:
         logger.debug(f'No callback for {sql_statement}')
-    response = execute_statement(sql_statement, str(statement_name), with_event=with_event, params=params)
+    # Only statements with a callback are admission controlled, their finished event gives back the slot. The priority
+    # is registered before the slot is taken so that a statement never holds a slot its item does not know about.
+    admission_priority = priority if with_event and is_admission_controlled(priority) else None
+    with stage(STAGE_DDB_REGISTER):
+        if run_as_singleton:
+            statement_name = register_singleton_execution_start(callback_object, sql_statement, admission_priority)
+        else:
+            statement_name = ddb_sfn_state_table.register_execution_start(callback_object, sql_statement,
+                                                                          admission_priority=admission_priority)
+    request = {SQL_STATEMENT: sql_statement, PARAMETERS: params, INLINE_PARAMETERS: inline_parameters,
+               INLINE_WAIT: inline_wait_seconds, RESULT_CACHE_TTL: result_cache_ttl_seconds}
+    return submit_statement(statement_name, callback_object, request, admission_priority, run_as_singleton)
+
+
+def submit_statement(statement_name: StatementName, callback_object: CallbackInterface, request: dict,
+                     admission_priority: Optional[str] = None, run_as_singleton=False, admitted=False) -> dict:
+    """
+    Submit a registered statement: complete it from the result cache, take an admission slot or queue it, execute it and
+    wait for it inline. A queued statement goes through here again once it has been given a slot (admitted).
+    """
+    sql_statement = request[SQL_STATEMENT]
+    with_event = not isinstance(callback_object, NoCallback)
+    result_cache_ttl_seconds = request.get(RESULT_CACHE_TTL, 0)
+    result_cache_key = None
+    if result_cache_ttl_seconds > 0:
+        result_cache_key = get_result_cache_key(sql_statement, request[PARAMETERS], request[INLINE_PARAMETERS])
+        response = complete_statement_from_result_cache(statement_name, callback_object, result_cache_key)
+        if response is not None:
+            if admitted:
+                release_admission(statement_name, admission_priority)
+            return response
+    if admission_priority is not None and not admitted:
+        with stage(STAGE_ADMISSION):
+            admitted = admit_or_enqueue(statement_name, admission_priority, request)
+        if not admitted:
+            response = {"StatementName": str(statement_name), "AdmissionPending": True, "Priority": admission_priority}
+            logger.info({l_response: response, l_callback_object: callback_object})
+            return response
+    try:
+        with stage(STAGE_EXECUTE_STATEMENT):
+            response = execute_statement(sql_statement, str(statement_name), with_event=with_event,
+                                         params=request[PARAMETERS], inline_parameters=request[INLINE_PARAMETERS])
+    except Exception:
+        if run_as_singleton:
+            ddb_sfn_state_table.release_active_statement(
+                statement_name, ddb_sfn_state_table.get_active_statement_key(sql_statement)
+            )
+        if admission_priority is not None:
+            release_admission(statement_name, admission_priority)
+        raise
+    logger.info({
+        l_response: response,
+        l_callback_object: callback_object
+    })
+    register_statement_id(statement_name, response)
+    if result_cache_key is not None:
+        register_result_cache_statement(statement_name, result_cache_key, response, result_cache_ttl_seconds)
+    inline_wait_seconds = request.get(INLINE_WAIT, 0)
+    if with_event and inline_wait_seconds > 0:
+        complete_statement_inline(statement_name, callback_object, response["Id"], inline_wait_seconds)
+    return response
+
+
+def complete_statement_inline(statement_name: StatementName, callback_object: CallbackInterface, statement_id: str,
+                              timeout_seconds: float):
+    """
+    Wait for a short statement to complete and send its callback directly rather than when its finished event has gone
+    through EventBridge and SQS. If the statement does not complete within timeout_seconds, or completing it fails, it
+    is completed by its finished event. The finished event of a statement that is completed here is ignored.
+    """
+    # noinspection PyBroadException
+    try:
+        with stage(STAGE_INLINE_WAIT):
+            description = wait_for_statement(statement_id, timeout_seconds)
+        if description is None:
+            logger.info({l_statement_name: str(statement_name), 'message': 'Statement completes via finished event.'})
+            return
+        remember_statement_description(statement_id, description)
+        finished_event = FinishedEvent.from_statement_description(str(statement_name), description)
+        send_callback(statement_name, callback_object, finished_event)
+        mark_statement_name_as_handled(ddb_sfn_state_table, statement_name, finished_event)
+    except Exception as e:
+        # The statement is submitted so don't fail the invocation, the finished event still completes it.
+        logger.warning({l_statement_name: str(statement_name), l_exception: e})
+
+
+def get_result_cache_hit(statement_name: StatementName, result_cache_key: str) -> Optional[FinishedEvent]:
+    """
+    The finished event for statement_name of the cached statement for a result cache key, None if no statement is
+    cached or it did not finish successfully.
+    """
+    cached_statement = get_cached_statement(result_cache_key)
+    if cached_statement is None:
+        return None
+    finished_event = get_cached_finished_event(str(statement_name), cached_statement)
+    if finished_event is None:
+        description = describe_statement(cached_statement[DDB_STATEMENT_ID])
+        if description["Status"] != FinishedEvent.QUERY_FINISHED:
+            # Rather than waiting for a running statement or re-using a failed one the statement is executed.
+            return None
+        finished_event = FinishedEvent.from_statement_description(str(statement_name), description)
+        set_cached_statement_finished(result_cache_key, cached_statement, finished_event)
+    return finished_event
+
+
+def complete_statement_from_result_cache(statement_name: StatementName, callback_object: CallbackInterface,
+                                         result_cache_key: str) -> Optional[dict]:
+    """
+    Complete a statement with the statement that is cached for the same SQL text, parameters and target instead of
+    submitting it. The callback is sent directly and getStatementResult serves the result of the cached statement.
+
+    Returns:
+        The response of the invocation or None if there is no cache hit, in which case the statement is executed.
+    """
+    # noinspection PyBroadException
+    try:
+        with stage(STAGE_RESULT_CACHE):
+            finished_event = get_result_cache_hit(statement_name, result_cache_key)
+    except Exception as e:
+        # The cache only saves work so the statement is executed when the lookup fails.
+        logger.warning({l_statement_name: str(statement_name), l_exception: e})
+        return None
+    if finished_event is None:
+        return None
+    response = {"Id": finished_event.get_statement_id(), "StatementName": str(statement_name), "ResultCacheHit": True}
+    logger.info({l_response: response, l_callback_object: callback_object})
+    register_statement_id(statement_name, response)
+    if not isinstance(callback_object, NoCallback):
+        send_callback(statement_name, callback_object, finished_event)
+    with stage(STAGE_DDB_MARK):
+        ddb_sfn_state_table.mark_statement_name_as_handled(statement_name, finished_event)
+    return response
+
+
+def register_result_cache_statement(statement_name: StatementName, result_cache_key: str, response: dict,
+                                    result_cache_ttl_seconds: float):
+    # noinspection PyBroadException
+    try:
+        with stage(STAGE_RESULT_CACHE):
+            put_cached_statement(result_cache_key, response["Id"], result_cache_ttl_seconds)
+    except Exception as e:
+        # The statement is submitted so don't fail the invocation, its result is just not cached.
+        logger.warning({l_statement_name: str(statement_name), l_exception: e})
+
+
+def register_statement_id(statement_name: StatementName, response: dict):
+    # noinspection PyBroadException
+    try:
+        with stage(STAGE_DDB_REGISTER):
+            ddb_sfn_state_table.register_statement_id(statement_name, response["Id"])
+    except Exception as e:
+        # The statement is submitted so don't fail the invocation, resolving LATEST falls back on the Data API.
+        logger.warning({l_statement_name: str(statement_name), l_exception: e})
+
+
+def admit_or_enqueue(statement_name: StatementName, priority: str, request: dict) -> bool:
+    """
+    Take an admission slot for a statement or queue it until a slot is given back.
+
+    Returns:
+        True if the statement has a slot and should be submitted, False if it is queued.
+    """
+    if acquire_slot(priority, statement_name):
+        return True
+    reclaimed = reclaim_expired_slots(priority, is_statement_name_in_active_state)
+    if reclaimed > 0 and acquire_slot(priority, statement_name):
+        return True
+    enqueue(priority, statement_name, request)
+    ddb_sfn_state_table.register_admission_queued(statement_name, priority)
+    # All slots may have been given back between trying to take one and queueing, then nobody would admit the queue.
+    admit_pending_statements(priority)
+    return False
+
+
+def admit_pending_statements(priority: str):
+    """
+    Submit the statements queued for a priority, oldest first, for as long as slots are available. A slot is taken for
+    the statement before it is taken from the queue, concurrent invocations can't take a slot for the same statement.
+    """
+    while True:
+        statement_name = peek(priority)
+        if statement_name is None or not acquire_slot(priority, statement_name):
+            return
+        request = remove(priority, statement_name)
+        if request is None:
+            # The statement was cancelled or admitted and handled concurrently.
+            release_slot(priority, statement_name)
+            continue
+        start_admitted_statement(statement_name, request, priority)
+
+
+def start_admitted_statement(statement_name: StatementName, request: dict, priority: str):
+    """
+    Submit a statement that was queued and has been given a slot, the same way as a statement that is admitted when it
+    is invoked. If it can't be submitted the statement fails: its failure callback is sent and the slot is given back.
+    """
+    # noinspection PyBroadException
+    try:
+        with stage(STAGE_DDB_GET):
+            callback_object = ddb_sfn_state_table.get_callback_source_for_statement_name(statement_name)
+        submit_statement(statement_name, callback_object, request, priority, admitted=True)
+    except Exception as e:
+        logger.warning({l_statement_name: str(statement_name), l_exception: e})
+        release_slot(priority, statement_name)
+        fail_statement(statement_name, str(e))
+
+
+def fail_statement(statement_name: StatementName, error: str):
+    # noinspection PyBroadException
+    try:
+        finished_event = FinishedEvent.from_error(str(statement_name), None, error)
+        with stage(STAGE_DDB_GET):
+            callback_source = ddb_sfn_state_table.get_callback_source_for_statement_name(statement_name)
+        send_callback(statement_name, callback_source, finished_event)
+        mark_statement_name_as_handled(ddb_sfn_state_table, statement_name, finished_event)
+    except Exception as e:
+        logger.fatal({l_statement_name: str(statement_name), l_exception: e, l_traceback: traceback.format_exc()})
+
+
+def release_admission(statement_name: StatementName, priority: Optional[str]):
+    """
+    Give back the admission slot of a statement that has been handled, if it holds one, and admit the statements that
+    wait for it. This never fails the caller: a slot that is not given back is reclaimed once its lease expired.
+    """
+    if priority is None:
+        return
+    # noinspection PyBroadException
+    try:
+        with stage(STAGE_ADMISSION):
+            if release_slot(priority, statement_name) and is_admission_controlled(priority):
+                admit_pending_statements(priority)
+    except Exception as e:
+        logger.fatal({'priority': priority, l_exception: e, l_traceback: traceback.format_exc()})
+
+
+def mark_statement_name_as_handled(state_table, statement_name: StatementName, finished_event: FinishedEvent):
+    """
+    Mark a statement as handled and give back its admission slot. A DDBStateTableBatch only writes when it is flushed,
+    its slots are given back by the caller of flush.
+    """
+    with stage(STAGE_DDB_MARK):
+        previous_item = state_table.mark_statement_name_as_handled(statement_name, finished_event)
+    if previous_item is not None and DDB_FINISHED_EVENT_DETAILS not in previous_item:
+        release_admission(statement_name, previous_item.get(DDB_ADMISSION_PRIORITY))
+
+
+# Separator used to track the statements of a batch as a single SQL text.
+BATCH_SQL_SEPARATOR = ';\n'
+
+
+def handle_redshift_batch_statement_invocation_event(event):
+    assert SQL_STATEMENTS in event, f"Programming error should never handle invocation without SQL_STATEMENTS {event}."
+    logger.info(event)
+    sql_statements = event[SQL_STATEMENTS]
+    action = event.get(ACTION)
+    if action not in (EXECUTE_BATCH_STATEMENT, None):
+        raise InvalidRequest(f"Unsupported {ACTION} to execute {SQL_STATEMENTS} {event}")
+    if not isinstance(sql_statements, list) or len(sql_statements) == 0 or \
+            not all(isinstance(sql_statement, str) for sql_statement in sql_statements):
+        raise InvalidRequest(f"{SQL_STATEMENTS} must be a non-empty list of SQL statements {event}")
+    if make_statement_invocation_parameters(event) is not None:
+        raise InvalidRequest(f"parameters are not supported with {SQL_STATEMENTS} {event}")
+    callback_object = CallbackSourceBuilder.get_callback_object_for_event(event)
+    return handle_redshift_batch_statement_invocation(sql_statements, callback_object)
+
+
+def handle_redshift_batch_statement_invocation(sql_statements: list, callback_object: CallbackInterface):
+    """
+    Execute the SQL statements as a single transaction. The batch is registered once and completes with a single
+    callback when all statements have finished or one of them has failed.
+    """
+    set_dimensions(**{DIMENSION_CALLBACK_TYPE: type(callback_object).__name__})
+    with stage(STAGE_DDB_REGISTER):
+        statement_name = ddb_sfn_state_table.register_execution_start(
+            callback_object, BATCH_SQL_SEPARATOR.join(sql_statements)
+        )
+    with_event = not isinstance(callback_object, NoCallback)
+    with stage(STAGE_EXECUTE_STATEMENT):
+        response = batch_execute_statement(sql_statements, str(statement_name), with_event=with_event)
     logger.info({
         l_response: response,
         l_callback_object: callback_object
     })
+    register_statement_id(statement_name, response)
     return response
 
 
-def finished_data_api_request_record_handler(record: dict):
+def finished_data_api_request_record_handler(record: dict, state_table=ddb_sfn_state_table):
     """
     This will be called for each finished invocation.
     It should raise an exception if the message was not processed successfully so we don't catch any exceptions
@@ -127,40 +611,110 @@ def finished_data_api_request_record_handler(record: dict):
     Args:
         record: Has 'body' as json string of event documented in section ata-api-monitoring-events-finished on
                 https://docs.aws.amazon.com/redshift/latest/mgmt/data-api-monitoring-events.html
+        state_table: The state table to resolve the callback source and mark the statement as handled. This is either
+                     the DDBStateTable or a DDBStateTableBatch when processing a batch of records.
 
     Returns:
         None:
     """
     try:
         logger.debug(record)
-        finished_event = FinishedEvent.from_record(record)
-        statement_name = StatementName.from_str(finished_event.get_statement_name())
-        callback_source = ddb_sfn_state_table.get_callback_source_for_statement_name(statement_name)
+        with record_metrics(action="complete_statement"):
+            handle_finished_event(FinishedEvent.from_record(record), state_table)
+    except Exception as e:
+        logger.fatal({
+            l_record: record,
+            l_exception: e,
+            l_traceback: traceback.format_exc()
+        })
+        raise e
+
+
+def send_callback(statement_name: StatementName, callback_source: CallbackInterface, finished_event: FinishedEvent):
+    with stage(STAGE_CALLBACK):
         if finished_event.has_failed():
-            # noinspection PyBroadException
-            try:
-                statement_description = describe_statement(finished_event.get_statement_id())
-                error = statement_description["Error"]
-                finished_event['detail']['error'] = error
-            except Exception as ex:
-                logger.warn(f"Could not get error for {finished_event} due to {ex}")
             callback_source.send_failure(statement_name, finished_event)
         elif finished_event.has_succeeded():
             callback_source.send_success(statement_name, finished_event)
         else:
             raise NotImplementedError(f"Unsupported Data API finished event state {finished_event.get_state()}")
 
-        ddb_sfn_state_table.mark_statement_name_as_handled(statement_name, finished_event)
+
+def handle_finished_event(finished_event: FinishedEvent, state_table):
+    statement_name = StatementName.from_str(finished_event.get_statement_name())
+    with stage(STAGE_DDB_GET):
+        callback_source = state_table.get_callback_source_for_statement_name(statement_name)
+        already_handled = state_table.is_statement_name_handled(statement_name)
+    set_dimensions(**{DIMENSION_CALLBACK_TYPE: type(callback_source).__name__})
+    if already_handled:
+        # The callback was sent by the invocation that submitted the statement.
+        logger.info({l_statement_name: str(statement_name), 'message': 'Statement was already handled.'})
+        return
+    if finished_event.has_failed():
+        # noinspection PyBroadException
+        try:
+            with stage(STAGE_DESCRIBE_STATEMENT):
+                statement_description = describe_statement(finished_event.get_statement_id())
+            error = statement_description["Error"]
+            finished_event['detail']['error'] = error
+        except Exception as ex:
+            logger.warn(f"Could not get error for {finished_event} due to {ex}")
+    send_callback(statement_name, callback_source, finished_event)
+    mark_statement_name_as_handled(state_table, statement_name, finished_event)
+
+
+def get_state_table_batch_for_records(records: list) -> DDBStateTableBatch:
+    """
+    Fetch the state of all statements in a batch of SQS records at once. Records that cannot be parsed are left out
+    here, they fail individually when the record itself is handled.
+    """
+    statement_names = []
+    for record in records:
+        # noinspection PyBroadException
+        try:
+            finished_event = FinishedEvent.from_record(record)
+            statement_names.append(StatementName.from_str(finished_event.get_statement_name()))
+        except Exception:
+            continue
+    return ddb_sfn_state_table.batch(statement_names)
+
+
+def flush_state_table_batch(state_table_batch: DDBStateTableBatch):
+    """
+    Write the handled state of all successfully processed records. The callbacks of those records are sent so they stay
+    successful when the write fails, retrying them would send their callbacks again. The write itself is retried by
+    the flush. The admission slots of the handled statements are given back once they are written, also those of a
+    flush that failed for some of the statements.
+    """
+    try:
+        state_table_batch.flush()
     except Exception as e:
+        # Unmarked statements keep their admission slot until its lease expires and a duplicate finished event would
+        # send their callback again.
         logger.fatal({
-            l_record: record,
             l_exception: e,
-            l_traceback: traceback.format_exc()
+            l_traceback: traceback.format_exc(),
+            'unmarked_statements': list(state_table_batch.handled_items),
         })
-        raise e
+    finally:
+        for statement_name, item in state_table_batch.written_items.items():
+            release_admission(StatementName.from_str(statement_name), item.get(DDB_ADMISSION_PRIORITY))
 
 
-@sqs_batch_processor(record_handler=finished_data_api_request_record_handler)
 def sqs_finished_data_api_request_handler(event, context):
+    """
+    Handle a batch of finished Data API events. Up to CALLBACK_CONCURRENCY records are handled in parallel. Failed
+    records are reported per record: successfully processed records are removed from the queue and the remaining ones
+    are retried.
+    """
     logger.debug({"event": event, "context": context})
+    records = event["Records"]
+    # Metrics of the batch operations are emitted with the invocation, those of each record separately.
+    with stage(STAGE_DDB_GET):
+        state_table_batch = get_state_table_batch_for_records(records)
+    processor = ConcurrentSQSProcessor(max_workers=callback_concurrency)
+    with processor(records, lambda record: finished_data_api_request_record_handler(record, state_table_batch)):
+        processor.process()
+        with stage(STAGE_DDB_MARK):
+            flush_state_table_batch(state_table_batch)
     return {"statusCode": 200}
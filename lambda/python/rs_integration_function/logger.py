@@ -15,8 +15,10 @@ l_message = 'message'
 l_next_token = 'next_token'
 l_record = 'record'
 l_response = 'response'
+l_result_location = 'result_location'
 l_rs_integration_function = 'rs_integration_function'
 l_sanitized_response = 'sanitized_response'
+l_sql_statement = 'sql_statement'
 l_statement_name = 'statement_name'
 l_task_timed_out = 'task_timed_out'
 l_task_token = 'task_token'
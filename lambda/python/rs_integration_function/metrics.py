@@ -0,0 +1,168 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Lightweight instrumentation of the stages of handling a statement. The duration of each stage and the DynamoDB capacity
+consumed are collected per unit of work (an invocation or a finished event record) and written as a single line in
+CloudWatch Embedded Metric Format (EMF). In AWS Lambda these lines are picked up from the logs, offline they end up on
+stdout or in a custom sink.
+
+Usage:
+    with record_metrics(action='execute_statement'):
+        set_dimensions(callback_type='SfnCallback')
+        with stage(STAGE_EXECUTE_STATEMENT):
+            ...
+"""
+
+
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from environment_labels import METRICS_ENABLED, METRICS_NAMESPACE
+
+STAGE_DDB_REGISTER = 'ddb_register'
+STAGE_EXECUTE_STATEMENT = 'execute_statement'
+STAGE_INLINE_WAIT = 'inline_wait'
+STAGE_RESULT_CACHE = 'result_cache'
+STAGE_ADMISSION = 'admission'
+STAGE_DDB_GET = 'ddb_get'
+STAGE_DESCRIBE_STATEMENT = 'describe_statement'
+STAGE_CANCEL_STATEMENT = 'cancel_statement'
+STAGE_CALLBACK = 'callback'
+STAGE_DDB_MARK = 'ddb_mark'
+DURATION = 'duration'
+CAPACITY_SUFFIX = '_capacity'
+# Client-side rate limiting of AWS API calls, see rate_limiter.
+RATE_LIMIT_WAIT = 'rate_limit_wait'
+THROTTLES_PREFIX = 'throttles_'
+RETRIES = 'retries'
+
+DIMENSION_ACTION = 'action'
+DIMENSION_CALLBACK_TYPE = 'callback_type'
+NO_CALLBACK_TYPE = 'none'
+
+DEFAULT_NAMESPACE = 'SfnRedshiftTasker'
+
+metrics_enabled = os.environ.get(METRICS_ENABLED, 'true').lower() == 'true'
+namespace = os.environ.get(METRICS_NAMESPACE, DEFAULT_NAMESPACE)
+
+
+def write_to_stdout(line: str):
+    sys.stdout.write(line + '\n')
+
+
+metrics_sink: Callable[[str], None] = write_to_stdout
+
+
+def set_metrics_sink(sink: Callable[[str], None]):
+    """Replace where EMF lines are written to, e.g. to collect them in memory for local benchmarks."""
+    global metrics_sink
+    metrics_sink = sink
+
+
+class MetricsRecorder(object):
+    def __init__(self, dimensions: dict):
+        self.dimensions = dimensions
+        self.milliseconds = defaultdict(float)
+        self.capacity_units = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def to_emf(self) -> dict:
+        metric_definitions = [{'Name': name, 'Unit': 'Milliseconds'} for name in self.milliseconds] + \
+                             [{'Name': name, 'Unit': 'Count'} for name in self.capacity_units] + \
+                             [{'Name': name, 'Unit': 'Count'} for name in self.counts]
+        return {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': namespace,
+                    'Dimensions': [sorted(self.dimensions)],
+                    'Metrics': metric_definitions,
+                }],
+            },
+            **self.dimensions,
+            **{name: round(value, 3) for name, value in self.milliseconds.items()},
+            **self.capacity_units,
+            **self.counts,
+        }
+
+    def flush(self):
+        if self.milliseconds or self.capacity_units or self.counts:
+            metrics_sink(json.dumps(self.to_emf()))
+
+
+current_recorder: ContextVar[Optional[MetricsRecorder]] = ContextVar('current_recorder', default=None)
+
+
+@contextmanager
+def record_metrics(action: str, callback_type: str = NO_CALLBACK_TYPE):
+    """
+    Collect the metrics of a unit of work and emit them when it completes. The total duration is recorded as well.
+    Nested units of work (e.g. a record within a batch) are emitted separately.
+    """
+    if not metrics_enabled:
+        yield None
+        return
+    recorder = MetricsRecorder({DIMENSION_ACTION: action, DIMENSION_CALLBACK_TYPE: callback_type})
+    token = current_recorder.set(recorder)
+    start = time.perf_counter()
+    try:
+        yield recorder
+    finally:
+        recorder.milliseconds[DURATION] += (time.perf_counter() - start) * 1000
+        current_recorder.reset(token)
+        recorder.flush()
+
+
+def set_dimensions(**dimensions):
+    recorder = current_recorder.get()
+    if recorder is not None:
+        recorder.dimensions.update(dimensions)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a stage, the durations of a stage that is entered multiple times are summed."""
+    recorder = current_recorder.get()
+    if recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.milliseconds[name] += (time.perf_counter() - start) * 1000
+
+
+def consumed_capacity_mode() -> str:
+    """The ReturnConsumedCapacity value for DynamoDB requests, capacity is only requested when it is recorded."""
+    return 'TOTAL' if current_recorder.get() is not None else 'NONE'
+
+
+def add_consumed_capacity(stage_name: str, response: dict):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return
+    consumed_capacity = response.get('ConsumedCapacity', [])
+    if isinstance(consumed_capacity, dict):
+        consumed_capacity = [consumed_capacity]
+    for table_capacity in consumed_capacity:
+        recorder.capacity_units[stage_name + CAPACITY_SUFFIX] += table_capacity.get('CapacityUnits', 0)
+
+
+def add_count(name: str, count: int = 1):
+    recorder = current_recorder.get()
+    if recorder is not None:
+        recorder.counts[name] += count
+
+
+def add_milliseconds(name: str, seconds: float):
+    """Add time that is spent within other stages, e.g. waiting for the rate limiter while sending a callback."""
+    recorder = current_recorder.get()
+    if recorder is not None:
+        recorder.milliseconds[name] += seconds * 1000
@@ -0,0 +1,192 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Adaptive client-side rate limiting and retry of the AWS API calls of a container. Under a burst every concurrent
+invocation retries throttled calls at once, which keeps the API throttled. With ADAPTIVE_RATE_LIMITING:
+ - Every API (e.g. 'dynamodb.UpdateItem') has a token bucket shared by all threads and clients of the container. It does
+   not limit until the API throttles, then its rate is cut to 70% of the measured send rate and it grows back
+   additively with every successful call (AIMD) until it is no longer needed.
+ - Throttled and transient errors are retried with full jitter exponential backoff instead of the botocore retries, so
+   retries of concurrent containers are spread out.
+
+The rate limiter hooks into the events every botocore client emits for each attempt (`before-send` and `needs-retry`),
+so it applies to all calls including those of boto3 resources. Throttles are counted as metrics also when it is off.
+"""
+
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+from environment_labels import ADAPTIVE_RATE_LIMITING
+from metrics import add_count, add_milliseconds, RATE_LIMIT_WAIT, THROTTLES_PREFIX, RETRIES
+
+THROTTLING_ERROR_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException', 'TooManyRequestsException',
+    'ProvisionedThroughputExceededException', 'TransactionInProgressException', 'RequestLimitExceeded',
+    'BandwidthLimitExceeded', 'LimitExceededException', 'RequestThrottled', 'SlowDown',
+}
+TRANSIENT_ERROR_CODES = {
+    'RequestTimeout', 'RequestTimeoutException', 'PriorRequestNotComplete', 'InternalError', 'InternalFailure',
+    'InternalServerError', 'InternalServerException', 'ServiceUnavailable',
+}
+# Requests per second an API is never limited below and above which it is no longer limited.
+MIN_RATE = 2.0
+MAX_RATE = 1000.0
+# Multiplicative decrease on a throttle, at most once per DECREASE_INTERVAL_SECONDS as concurrent calls that were sent
+# at the same rate are throttled together.
+DECREASE_FACTOR = 0.7
+DECREASE_INTERVAL_SECONDS = 1.0
+# Additive increase: requests per second gained for every second of successful calls at the current rate.
+ADDITIVE_INCREASE = 10.0
+# The send rate is measured over this window.
+MEASURE_SECONDS = 1.0
+# A call never waits longer than this for a token, it is throttled or succeeds which adjusts the rate.
+MAX_WAIT_SECONDS = 10.0
+# Retries: attempts in total and the bounds of the backoff before the jitter.
+MAX_ATTEMPTS = 8
+RETRY_BASE_SECONDS = 0.05
+RETRY_MAX_SECONDS = 5.0
+
+
+def is_adaptive_rate_limiting_enabled() -> bool:
+    return os.environ.get(ADAPTIVE_RATE_LIMITING, 'false').lower() == 'true'
+
+
+class AdaptiveRateLimiter(object):
+    """Token bucket of one API whose rate follows additive increase, multiplicative decrease (AIMD) on throttles."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.rate = None  # type: Optional[float]  # Requests per second, None while not limiting.
+        self.tokens = 0.0
+        self.last_refill = 0.0
+        self.last_decrease = None  # type: Optional[float]
+        self._sent = deque()
+        self._lock = threading.Lock()
+
+    def measured_rate(self, now: float) -> float:
+        while self._sent and self._sent[0] <= now - MEASURE_SECONDS:
+            self._sent.popleft()
+        return len(self._sent) / MEASURE_SECONDS
+
+    def reserve(self) -> float:
+        """Take a token, tokens may be reserved ahead so concurrent callers are spaced out. Returns seconds to wait."""
+        with self._lock:
+            now = self.clock()
+            self._sent.append(now)
+            if self.rate is None:
+                return 0.0
+            self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.last_refill) * self.rate) - 1
+            self.tokens = max(self.tokens, -self.rate * MAX_WAIT_SECONDS)
+            self.last_refill = now
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self) -> float:
+        """Wait for a token. Returns the seconds waited."""
+        seconds = self.reserve()
+        if seconds > 0:
+            time.sleep(seconds)
+        return seconds
+
+    def on_throttle(self):
+        with self._lock:
+            now = self.clock()
+            if self.last_decrease is not None and now - self.last_decrease < DECREASE_INTERVAL_SECONDS:
+                return
+            measured_rate = self.measured_rate(now)
+            if self.rate is None:
+                self.tokens = 0.0
+                self.last_refill = now
+                rate = measured_rate
+            else:
+                rate = min(self.rate, measured_rate)
+            self.rate = max(MIN_RATE, rate * DECREASE_FACTOR)
+            self.last_decrease = now
+
+    def on_success(self):
+        with self._lock:
+            if self.rate is None:
+                return
+            self.rate += ADDITIVE_INCREASE / self.rate
+            if self.rate >= MAX_RATE:
+                self.rate = None
+
+
+_rate_limiters = {}  # type: Dict[str, AdaptiveRateLimiter]
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api: str) -> AdaptiveRateLimiter:
+    rate_limiter = _rate_limiters.get(api)
+    if rate_limiter is None:
+        with _rate_limiters_lock:
+            rate_limiter = _rate_limiters.setdefault(api, AdaptiveRateLimiter())
+    return rate_limiter
+
+
+def reset_rate_limiters():
+    """Forget the learned rates, e.g. between benchmark runs."""
+    with _rate_limiters_lock:
+        _rate_limiters.clear()
+
+
+def get_retry_delay(attempts: int) -> float:
+    """Full jitter: a random delay up to the exponential backoff for the number of attempts made."""
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1)))
+
+
+def get_error_code(response) -> Optional[str]:
+    """The error code of the (http response, parsed response) that botocore passes to needs-retry handlers."""
+    if response is None:
+        return None
+    return response[1].get('Error', {}).get('Code')
+
+
+def is_server_error(response) -> bool:
+    return response is not None and response[0].status_code >= 500
+
+
+def register_rate_limiting(events, service_name: str, adaptive: bool):
+    """
+    Register the rate limiter with the event system of a client.
+
+    Args:
+        events: The `client.meta.events` of the client.
+        service_name: The service name the client was created for, e.g. 'stepfunctions'.
+        adaptive: Rate limit and retry, the botocore retries of the client should be disabled. Otherwise only throttles
+                  are counted.
+    """
+    metric_name = THROTTLES_PREFIX + service_name.replace('-', '_')
+
+    def before_send(event_name: str, **_kwargs):
+        waited = get_rate_limiter(f"{service_name}.{event_name.split('.')[-1]}").acquire()
+        if waited > 0:
+            add_milliseconds(RATE_LIMIT_WAIT, waited)
+
+    def needs_retry(response, attempts: int, caught_exception, operation, **_kwargs) -> Optional[float]:
+        error_code = get_error_code(response)
+        throttled = error_code in THROTTLING_ERROR_CODES
+        if throttled:
+            add_count(metric_name)
+        if not adaptive:
+            return None
+        rate_limiter = get_rate_limiter(f"{service_name}.{operation.name}")
+        if throttled:
+            rate_limiter.on_throttle()
+        elif error_code is None and caught_exception is None and not is_server_error(response):
+            rate_limiter.on_success()
+            return None
+        retryable = throttled or error_code in TRANSIENT_ERROR_CODES or is_server_error(response) or \
+            caught_exception is not None
+        if not retryable or attempts >= MAX_ATTEMPTS:
+            return None
+        add_count(RETRIES)
+        return get_retry_delay(attempts)
+
+    if adaptive:
+        events.register('before-send', before_send)
+    events.register('needs-retry', needs_retry)
@@ -2,86 +2,264 @@
 # SPDX-License-Identifier: MIT-0
 
 
+import json
 import os
+import time
+from typing import List, Optional, Tuple
 
-import boto3
-
+from aws_clients import get_client
 from environment_labels import CLUSTER_IDENTIFIER, DATABASE, DB_USER
-from logger import logger, l_id, l_next_token, l_statement_name, l_response
+from exceptions import ResultTooLarge
+from integration import fallback_encoder
+from logger import logger, l_id, l_next_token, l_statement_name, l_response, l_sql_statement
+from metrics import stage, STAGE_RESULT_CACHE
+from redshift_data.result_cache import is_result_cache_enabled, memory_result_cache, get_cached_result_item, \
+    load_cached_result, cache_result, RESULT_LOCATION
+from redshift_data.statement_descriptions import memory_description_cache, describe_cache_seconds
+from result_store import is_result_store_configured, store_result
+from sql_text import parse_sql_template
+
+# Step Functions limits state payloads to 256 KiB, keep headroom for the Lambda invoke output around the result.
+MAX_INLINE_RESULT_SIZE = 240 * 1024
 
-redshift_data_api = boto3.client('redshift-data')
+
+def get_redshift_data_api():
+    return get_client('redshift-data')
 
 
 def describe_statement(statement_id: str) -> dict:
-    return redshift_data_api.describe_statement(Id=statement_id)
+    return get_redshift_data_api().describe_statement(Id=statement_id)
+
+
+def get_statement_description(statement_id: str) -> dict:
+    """
+    Describe a statement for describeStatement, e.g. when it is polled. Descriptions of completed statements are served
+    from memory once they are seen and those of running statements for DESCRIBE_CACHE_SECONDS, other descriptions come
+    from the Data API.
+    """
+    description = memory_description_cache.get(statement_id)
+    if description is not None:
+        return description
+    description = describe_statement(statement_id)
+    if description["Status"] in TERMINAL_STATES:
+        remember_statement_description(statement_id, description)
+    elif describe_cache_seconds > 0:
+        memory_description_cache.put(statement_id, description, describe_cache_seconds)
+    return description
+
+
+def remember_statement_description(statement_id: str, description: dict):
+    """Remember the description of a completed statement such that describeStatement doesn't need the Data API."""
+    memory_description_cache.put(statement_id, description, float('inf'))
+
+
+def get_cached_statement_result(statement_id: str) -> Tuple[Optional[dict], Optional[dict]]:
+    """
+    Look up the result of a statement in the result cache.
+
+    Returns:
+        The cached full result, or None, and the result cache item of the statement if its result should be cached when
+        it is fetched.
+    """
+    if not is_result_cache_enabled():
+        return None, None
+    result = memory_result_cache.get(statement_id)
+    if result is not None:
+        return result, None
+    with stage(STAGE_RESULT_CACHE):
+        item = get_cached_result_item(statement_id)
+        if item is None:
+            return None, None
+        return load_cached_result(statement_id, item), item
 
 
 def get_statement_result(statement_id: str, next_token=None) -> dict:
+    """
+    Get a page of the result of a statement. For statements with a cached result the first page is the full result if
+    it fits in MAX_INLINE_RESULT_SIZE.
+    """
+    cache_item = None
+    if next_token is None:
+        result, cache_item = get_cached_statement_result(statement_id)
+        if result is not None and RESULT_LOCATION not in result and get_result_size(result) <= MAX_INLINE_RESULT_SIZE:
+            return result
     extra_args = {}
     if next_token is not None:
-        extra_args["NextToken"]: next_token
+        extra_args["NextToken"] = next_token
     logger.debug({
         l_id: statement_id,
         l_next_token: next_token
     })
-    return redshift_data_api.get_statement_result(Id=statement_id, **extra_args)
+    response = get_redshift_data_api().get_statement_result(Id=statement_id, **extra_args)
+    if cache_item is not None and not response.get("NextToken"):
+        # A single page is the full result, multi-page results are cached when they are fetched at once.
+        try_cache_result(statement_id, cache_item, {
+            "ColumnMetadata": response.get("ColumnMetadata", []),
+            "TotalNumRows": response.get("TotalNumRows", len(response["Records"])),
+            "Records": response["Records"],
+        })
+    return response
+
+
+def try_cache_result(statement_id: str, cache_item: dict, result: dict) -> Optional[dict]:
+    """Cache a fetched result, best-effort. Returns what is cached, None if nothing was cached."""
+    # noinspection PyBroadException
+    try:
+        with stage(STAGE_RESULT_CACHE):
+            return cache_result(statement_id, cache_item, result)
+    except Exception as e:
+        # The result is fetched so don't fail the invocation, e.g. when the cache entry expired in the meantime.
+        logger.warning({l_id: statement_id, 'message': f'Could not cache result: {e}'})
+        return None
+
+
+def get_result_size(result: dict) -> int:
+    return len(json.dumps(result, default=fallback_encoder))
+
+
+def get_full_statement_result(statement_id: str) -> dict:
+    """
+    Get all pages of the result of a statement. The result follows the response syntax of GetStatementResult without
+    NextToken if it fits in MAX_INLINE_RESULT_SIZE. Otherwise the result is stored in the result bucket and a manifest
+    is returned that has ResultLocation (Bucket and Key of the stored result) instead of Records.
+    """
+    result, cache_item = get_cached_statement_result(statement_id)
+    if result is None:
+        result = fetch_full_statement_result(statement_id)
+        if cache_item is not None:
+            cached = try_cache_result(statement_id, cache_item, result)
+            if cached is not None and RESULT_LOCATION in cached:
+                return cached
+    elif RESULT_LOCATION in result:
+        return result
+    result_size = get_result_size(result)
+    if result_size <= MAX_INLINE_RESULT_SIZE:
+        return result
+    if not is_result_store_configured():
+        raise ResultTooLarge(f"Result of {statement_id} is {result_size} bytes which exceeds the inline limit of "
+                             f"{MAX_INLINE_RESULT_SIZE} bytes and no result bucket is configured.")
+    result_location = store_result(f"{statement_id}.json", result)
+    return {
+        "ColumnMetadata": result["ColumnMetadata"],
+        "TotalNumRows": result["TotalNumRows"],
+        "ResultLocation": result_location,
+    }
+
+
+def fetch_full_statement_result(statement_id: str) -> dict:
+    records = []
+    response = get_statement_result(statement_id)
+    records.extend(response["Records"])
+    while response.get("NextToken"):
+        response = get_statement_result(statement_id, next_token=response["NextToken"])
+        records.extend(response["Records"])
+    return {
+        "ColumnMetadata": response.get("ColumnMetadata", []),
+        "TotalNumRows": response.get("TotalNumRows", len(records)),
+        "Records": records,
+    }
 
 
 def cancel_statement(statement_id: str) -> dict:
-    return redshift_data_api.cancel_statement(Id=statement_id)
+    return get_redshift_data_api().cancel_statement(Id=statement_id)
+
+
+ACTIVE_STATES = ("SUBMITTED", "PICKED", "STARTED")
+TERMINAL_STATES = ("FINISHED", "FAILED", "ABORTED")
+
+# Backoff between polls when waiting for a statement, short statements complete within tens of milliseconds.
+WAIT_INITIAL_INTERVAL = 0.05
+WAIT_MAX_INTERVAL = 1.0
+WAIT_BACKOFF_FACTOR = 1.5
 
 
-def is_statement_in_active_state(query_string):
-    active_states = ["SUBMITTED", "PICKED", "STARTED"]
-    for state in active_states:
-        response = redshift_data_api.list_statements(Status=state)
-        for statement in response["Statements"]:
-            if statement["QueryString"] == query_string:
-                return True
-    return False
+def wait_for_statement(statement_id: str, timeout_seconds: float) -> Optional[dict]:
+    """
+    Poll the description of a statement until it reaches a terminal state. The interval between polls grows from
+    WAIT_INITIAL_INTERVAL to WAIT_MAX_INTERVAL and polling stops when timeout_seconds have passed.
+
+    Returns:
+        The DescribeStatement response once the statement has completed or None if it did not complete in time.
+    """
+    deadline = time.monotonic() + timeout_seconds
+    interval = WAIT_INITIAL_INTERVAL
+    while True:
+        description = describe_statement(statement_id)
+        if description["Status"] in TERMINAL_STATES:
+            return description
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logger.debug({l_id: statement_id, l_response: description})
+            return None
+        time.sleep(min(interval, remaining))
+        interval = min(interval * WAIT_BACKOFF_FACTOR, WAIT_MAX_INTERVAL)
+
+
+def is_statement_name_in_active_state(statement_name: str) -> bool:
+    """
+    Check whether the statement with statement_name is still active. The StatementName filter of ListStatements matches
+    on prefix so only an exact match is considered.
+    """
+    response = get_redshift_data_api().list_statements(Status='ALL', StatementName=statement_name)
+    logger.debug({l_statement_name: statement_name, l_response: response})
+    return any(
+        statement["StatementName"] == statement_name and statement["Status"] in ACTIVE_STATES
+        for statement in response["Statements"]
+    )
 
 
 def get_statement_id_for_statement_name(statement_name: str) -> str:
-    response = redshift_data_api.list_statements(Status='ALL', StatementName=statement_name)
+    response = get_redshift_data_api().list_statements(Status='ALL', StatementName=statement_name)
     logger.debug({l_statement_name: statement_name, l_response: response})
-    statements = response["Statements"]
+    # The StatementName filter matches on prefix.
+    statements = [s for s in response["Statements"] if s["StatementName"] == statement_name]
     assert len(statements) == 1, f"Should retrieve 1 result for {statement_name} got {statements}"
     return statements[0]["Id"]
 
 
-def execute_statement(sql_statement: str, statement_name: str, with_event: bool, params = None) -> dict:
-    '''
-        Parameters=[
+def execute_statement(sql_statement: str, statement_name: str, with_event: bool, params=None,
+                      inline_parameters=True) -> dict:
+    """
+    Submit a SQL statement. Parameters use the format of the Data API and are referenced with :name placeholders:
+        params=[
             {
                 'name': 'string',
                 'value': 'string'
             },
-        ],
-    '''
-    
-    if params is None:
-        return redshift_data_api.execute_statement(
-            ClusterIdentifier=os.environ[CLUSTER_IDENTIFIER],
-            Database=os.environ[DATABASE],
-            DbUser=os.environ[DB_USER],
-            Sql=sql_statement,
-            StatementName=statement_name,
-            WithEvent=with_event  # When invoked from SFN with s task token we invoke using withEvent enabled.
-        )
-    else:
-        
-        for pair_dict in params:
-            name = pair_dict['name']
-            value = pair_dict['value']
-            sql_statement = sql_statement.replace(':' + name, "'" + value + "'")
-            
-        logger.info("updated sql: " + sql_statement)
-        
-        return redshift_data_api.execute_statement(
-            ClusterIdentifier=os.environ[CLUSTER_IDENTIFIER],
-            Database=os.environ[DATABASE],
-            DbUser=os.environ[DB_USER],
-            Sql=sql_statement,
-            StatementName=statement_name,
-            WithEvent=with_event  # When invoked from SFN with s task token we invoke using withEvent enabled.
-        )
\ No newline at end of file
+        ]
+    By default the values are inlined in the SQL text as string literals. Without inline_parameters they are passed to
+    the Data API as bound parameters instead, so the SQL text is the same for every invocation of the statement.
+    """
+    extra_args = {}
+    if params is not None:
+        sql_template = parse_sql_template(sql_statement)
+        values = {pair_dict['name']: str(pair_dict['value']) for pair_dict in params}
+        if inline_parameters:
+            sql_statement = sql_template.bind(values)
+            logger.debug({l_statement_name: statement_name, l_sql_statement: sql_statement})
+        else:
+            extra_args['Parameters'] = sql_template.get_parameters(values)
+    return get_redshift_data_api().execute_statement(
+        ClusterIdentifier=os.environ[CLUSTER_IDENTIFIER],
+        Database=os.environ[DATABASE],
+        DbUser=os.environ[DB_USER],
+        Sql=sql_statement,
+        StatementName=statement_name,
+        WithEvent=with_event,  # When invoked from SFN with s task token we invoke using withEvent enabled.
+        **extra_args
+    )
+
+
+def batch_execute_statement(sql_statements: List[str], statement_name: str, with_event: bool) -> dict:
+    """
+    Submit multiple SQL statements that are ran serially as a single transaction. The batch is tracked as one statement
+    so it completes with a single finished event.
+    """
+    return get_redshift_data_api().batch_execute_statement(
+        ClusterIdentifier=os.environ[CLUSTER_IDENTIFIER],
+        Database=os.environ[DATABASE],
+        DbUser=os.environ[DB_USER],
+        Sqls=sql_statements,
+        StatementName=statement_name,
+        WithEvent=with_event  # When invoked from SFN with s task token we invoke using withEvent enabled.
+    )
@@ -2,6 +2,8 @@
 # SPDX-License-Identifier: MIT-0
 
 import json
+from datetime import datetime, timezone
+from typing import Optional
 
 
 class FinishedEvent(dict):
@@ -18,6 +20,43 @@ class FinishedEvent(dict):
         finished_event_details = json.loads(finished_event_details_str)
         return cls(finished_event_details)
 
+    @classmethod
+    def from_statement_description(cls, statement_name: str, description: dict):
+        """
+        Build the finished event of a completed statement from its DescribeStatement response. This has the fields of
+        the Data API event that are used when handling finished statements.
+        """
+        detail = {
+            'statementName': statement_name,
+            'statementId': description['Id'],
+            'state': description['Status'],
+            'rows': description.get('ResultRows', -1),
+        }
+        if 'RedshiftQueryId' in description:
+            detail['redshiftQueryId'] = description['RedshiftQueryId']
+        if 'Error' in description:
+            detail['error'] = description['Error']
+        # Same format as the time of EventBridge events.
+        event_time = description['UpdatedAt'].astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        return cls({'detail': detail, 'time': event_time})
+
+    @classmethod
+    def from_cancellation(cls, statement_name: str, statement_id: Optional[str], reason: str):
+        """Build the finished event of a statement that is cancelled and handled without waiting for its event."""
+        return cls.from_error(statement_name, statement_id, reason, state=cls.QUERY_ABORTED)
+
+    @classmethod
+    def from_error(cls, statement_name: str, statement_id: Optional[str], error: str, state: str = QUERY_FAILED):
+        """Build the finished event of a statement that fails without a Data API event e.g. when it is not submitted."""
+        detail = {
+            'statementName': statement_name,
+            'statementId': statement_id,
+            'state': state,
+            'rows': -1,
+            'error': error,
+        }
+        return cls({'detail': detail, 'time': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')})
+
     def get_execution_detail(self) -> dict:
         return self['detail']
 
@@ -35,3 +74,19 @@ class FinishedEvent(dict):
 
     def has_succeeded(self):
         return self.get_state() == self.QUERY_FINISHED
+
+    def to_statement_description(self) -> dict:
+        """
+        The fields of a DescribeStatement response that the finished event of a completed statement has, e.g. when its
+        stored details are read. UpdatedAt is the time of the event in ISO format.
+        """
+        detail = self.get_execution_detail()
+        description = {
+            'Id': detail['statementId'],
+            'Status': detail['state'],
+            'ResultRows': int(detail.get('rows', -1)),
+            'UpdatedAt': self['time'],
+        }
+        if 'error' in detail:
+            description['Error'] = detail['error']
+        return description
@@ -0,0 +1,249 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Opt-in cache of the results of read-only statements that are issued repeatedly, e.g. by pollers. A statement that is
+executed with a result cache TTL is recorded in the state table under a hash of its normalized SQL text, its parameters
+and the target database. Executing the same statement within the TTL re-uses the recorded statement: its callback is
+sent directly and no statement is submitted. Its result is cached when it is first fetched, in the state table when it
+is small and in the result bucket otherwise, and warm containers keep recently used results in memory up to a size.
+"""
+
+
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+from boto3.dynamodb.types import Binary
+
+from ddb import DDB_ID, DDB_INVOCATION_ID, DDB_TTL, DDB_STATEMENT_ID, DDB_FINISHED_EVENT_DETAILS, \
+    DDB_RESULT_CACHE_PREFIX, DDB_RESULT_CACHE_INVOCATION_ID, DDB_CACHED_RESULT_PREFIX, \
+    DDB_CACHED_RESULT_INVOCATION_ID, DDB_RESULT, DDB_RESULT_SIZE
+from ddb.ddb_state_table import get_ddb_state_table
+from ddb.item_encoding import encode_finished_event_details
+from environment_labels import CLUSTER_IDENTIFIER, DATABASE, DB_USER, RESULT_CACHE_ENABLED, RESULT_CACHE_MAX_BYTES, \
+    RESULT_CACHE_MEMORY_BYTES
+from exceptions import ConfigurationError
+from integration import fallback_encoder
+from logger import logger, l_id, l_response
+from metrics import consumed_capacity_mode, add_consumed_capacity, STAGE_RESULT_CACHE
+from redshift_data.finished_event import FinishedEvent
+from result_store import is_result_store_configured, store_result
+from sql_text import normalize_sql_statement
+
+# Results up to this size are kept in the state table item (compressed), larger ones in the result bucket.
+MAX_ITEM_RESULT_SIZE = 64 * 1024
+RESULT_COLUMN_METADATA = 'ColumnMetadata'
+RESULT_TOTAL_NUM_ROWS = 'TotalNumRows'
+RESULT_LOCATION = 'ResultLocation'
+# The Data API keeps results for 24 hours and cached statements are re-used by their Id, so entries expire before that.
+MAX_RESULT_CACHE_TTL_SECONDS = 23 * 3600
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_MEMORY_BYTES = 16 * 1024 * 1024
+
+try:
+    result_cache_max_bytes = int(os.environ.get(RESULT_CACHE_MAX_BYTES, DEFAULT_MAX_BYTES))
+    result_cache_memory_bytes = int(os.environ.get(RESULT_CACHE_MEMORY_BYTES, DEFAULT_MEMORY_BYTES))
+except ValueError:
+    raise ConfigurationError(f"{RESULT_CACHE_MAX_BYTES} and {RESULT_CACHE_MEMORY_BYTES} should be a number of bytes.")
+
+
+def is_result_cache_enabled() -> bool:
+    return os.environ.get(RESULT_CACHE_ENABLED, 'false').lower() == 'true'
+
+
+class MemoryResultCache(object):
+    """
+    Least recently used results of this container, bounded by their total size. Entries also expire with the cached
+    statement they belong to.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # Statement id -> (expires at, size, result)
+        self._lock = threading.Lock()
+
+    def get(self, statement_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(statement_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                self._remove(statement_id)
+                return None
+            self._entries.move_to_end(statement_id)
+            return entry[2]
+
+    def put(self, statement_id: str, expires_at: int, size: int, result: dict):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(statement_id)
+            self._entries[statement_id] = (expires_at, size, result)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, statement_id: str):
+        entry = self._entries.pop(statement_id, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+memory_result_cache = MemoryResultCache(result_cache_memory_bytes)
+
+
+def get_result_cache_key(sql_statement: str, params: Optional[List[dict]] = None, inline_parameters=True) -> str:
+    """A hash of everything that determines the result of a statement: its SQL text, parameters and target."""
+    identity = {
+        'sql': normalize_sql_statement(sql_statement),
+        'parameters': sorted((pair['name'], str(pair['value'])) for pair in params or []),
+        'inline_parameters': bool(inline_parameters),
+        'target': [os.environ[CLUSTER_IDENTIFIER], os.environ[DATABASE], os.environ[DB_USER]],
+    }
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_cache_entry_key(cache_key: str) -> dict:
+    return {DDB_ID: DDB_RESULT_CACHE_PREFIX + cache_key, DDB_INVOCATION_ID: DDB_RESULT_CACHE_INVOCATION_ID}
+
+
+def get_cached_result_key(statement_id: str) -> dict:
+    return {DDB_ID: DDB_CACHED_RESULT_PREFIX + statement_id, DDB_INVOCATION_ID: DDB_CACHED_RESULT_INVOCATION_ID}
+
+
+def is_expired(item: dict) -> bool:
+    # DynamoDB deletes expired items in the background so they can still be read for a while.
+    return item[DDB_TTL] <= int(datetime.utcnow().timestamp())
+
+
+def get_cached_statement(cache_key: str) -> Optional[dict]:
+    """
+    Get the cached statement for a result cache key.
+
+    Returns:
+        The item with the statement id and, once known, the details of its finished event. None if there is no
+        statement cached for the key or it has expired.
+    """
+    response = get_ddb_state_table().get_item(
+        Key=get_cache_entry_key(cache_key),
+        ReturnConsumedCapacity=consumed_capacity_mode(),
+    )
+    add_consumed_capacity(STAGE_RESULT_CACHE, response)
+    item = response.get('Item')
+    if item is None or is_expired(item):
+        return None
+    return item
+
+
+def put_cached_statement(cache_key: str, statement_id: str, ttl_seconds: float) -> None:
+    """
+    Cache a submitted statement for a result cache key. Its result is cached once it is fetched, which needs the entry
+    for the statement id as well.
+    """
+    expires_at = int(datetime.utcnow().timestamp() + min(ttl_seconds, MAX_RESULT_CACHE_TTL_SECONDS))
+    for item in ({**get_cached_result_key(statement_id), DDB_TTL: expires_at},
+                 {**get_cache_entry_key(cache_key), DDB_STATEMENT_ID: statement_id, DDB_TTL: expires_at}):
+        response = get_ddb_state_table().put_item(Item=item, ReturnConsumedCapacity=consumed_capacity_mode())
+        add_consumed_capacity(STAGE_RESULT_CACHE, response)
+
+
+def set_cached_statement_finished(cache_key: str, cached_statement: dict, finished_event: FinishedEvent) -> None:
+    """Record that the cached statement finished such that later hits don't need to describe it."""
+    response = get_ddb_state_table().update_item(
+        Key=get_cache_entry_key(cache_key),
+        UpdateExpression="SET #D = :details",
+        ConditionExpression="#S = :statement_id",
+        ExpressionAttributeNames={'#D': DDB_FINISHED_EVENT_DETAILS, '#S': DDB_STATEMENT_ID},
+        ExpressionAttributeValues={
+            ':details': encode_finished_event_details(finished_event),
+            ':statement_id': cached_statement[DDB_STATEMENT_ID],
+        },
+        ReturnConsumedCapacity=consumed_capacity_mode(),
+    )
+    add_consumed_capacity(STAGE_RESULT_CACHE, response)
+
+
+def get_cached_finished_event(statement_name: str, cached_statement: dict) -> Optional[FinishedEvent]:
+    """The finished event of the cached statement for statement_name, None if it was not recorded yet."""
+    details = cached_statement.get(DDB_FINISHED_EVENT_DETAILS)
+    if details is None:
+        return None
+    detail = {name: int(value) if name == 'rows' else value for name, value in details['detail'].items()}
+    return FinishedEvent({**details, 'detail': {**detail, 'statementName': statement_name}})
+
+
+def get_cached_result_item(statement_id: str) -> Optional[dict]:
+    """The result cache item of a statement, None if the statement is not cached or has expired."""
+    response = get_ddb_state_table().get_item(
+        Key=get_cached_result_key(statement_id),
+        ReturnConsumedCapacity=consumed_capacity_mode(),
+    )
+    add_consumed_capacity(STAGE_RESULT_CACHE, response)
+    item = response.get('Item')
+    if item is None or is_expired(item):
+        return None
+    return item
+
+
+def load_cached_result(statement_id: str, item: dict) -> Optional[dict]:
+    """
+    Get the cached result held by a result cache item.
+
+    Returns:
+        The full result (ColumnMetadata, TotalNumRows and Records), the manifest of a result in the result bucket
+        (ResultLocation instead of Records) or None if the result was not cached (yet).
+    """
+    if DDB_RESULT not in item:
+        return None
+    value = item[DDB_RESULT]
+    result = json.loads(zlib.decompress(value.value if isinstance(value, Binary) else value).decode('utf-8'))
+    memory_result_cache.put(statement_id, int(item[DDB_TTL]), int(item[DDB_RESULT_SIZE]), result)
+    return result
+
+
+def cache_result(statement_id: str, item: dict, result: dict) -> Optional[dict]:
+    """
+    Cache the full result of a statement with its result cache item. Results larger than MAX_ITEM_RESULT_SIZE are stored
+    in the result bucket and the item holds their manifest. Results larger than RESULT_CACHE_MAX_BYTES are not cached,
+    neither are large results when no result bucket is configured.
+
+    Returns:
+        What is cached, i.e. the result or its manifest, None if nothing was cached.
+    """
+    encoded = json.dumps(result, default=fallback_encoder).encode('utf-8')
+    if len(encoded) > result_cache_max_bytes:
+        logger.info({l_id: statement_id, 'message': f'Result of {len(encoded)} bytes is too large to cache.'})
+        return None
+    if len(encoded) > MAX_ITEM_RESULT_SIZE:
+        if not is_result_store_configured():
+            return None
+        result = {
+            RESULT_COLUMN_METADATA: result[RESULT_COLUMN_METADATA],
+            RESULT_TOTAL_NUM_ROWS: result[RESULT_TOTAL_NUM_ROWS],
+            RESULT_LOCATION: store_result(f"{statement_id}.json", result),
+        }
+        encoded = json.dumps(result, default=fallback_encoder).encode('utf-8')
+    response = get_ddb_state_table().update_item(
+        Key=get_cached_result_key(statement_id),
+        UpdateExpression="SET #R = :result, #Z = :size",
+        ConditionExpression="attribute_exists(#T)",
+        ExpressionAttributeNames={'#R': DDB_RESULT, '#Z': DDB_RESULT_SIZE, '#T': DDB_TTL},
+        ExpressionAttributeValues={':result': zlib.compress(encoded), ':size': len(encoded)},
+        ReturnConsumedCapacity=consumed_capacity_mode(),
+    )
+    add_consumed_capacity(STAGE_RESULT_CACHE, response)
+    logger.debug({l_id: statement_id, l_response: response})
+    memory_result_cache.put(statement_id, int(item[DDB_TTL]), len(encoded), result)
+    return result
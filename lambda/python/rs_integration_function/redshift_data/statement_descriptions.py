@@ -0,0 +1,65 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+Descriptions of statements for describeStatement without a Data API call for every poll. The description of a completed
+statement no longer changes so warm containers keep it in memory until it is evicted. Descriptions of statements that
+are still running are only kept for DESCRIBE_CACHE_SECONDS, which is 0 (disabled) unless it is configured.
+"""
+
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from environment_labels import DESCRIBE_CACHE_SECONDS
+from exceptions import ConfigurationError
+
+DEFAULT_DESCRIBE_CACHE_SECONDS = 0.0
+MEMORY_DESCRIPTIONS = 1024
+
+try:
+    describe_cache_seconds = float(os.environ.get(DESCRIBE_CACHE_SECONDS, DEFAULT_DESCRIBE_CACHE_SECONDS))
+except ValueError:
+    raise ConfigurationError(f"{DESCRIBE_CACHE_SECONDS} should be a number of seconds.")
+
+
+class MemoryDescriptionCache(object):
+    """Least recently used descriptions of this container, each with the monotonic time it expires at."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # Statement id -> (expires at, description)
+        self._lock = threading.Lock()
+
+    def get(self, statement_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(statement_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[statement_id]
+                return None
+            self._entries.move_to_end(statement_id)
+            return entry[1]
+
+    def put(self, statement_id: str, description: dict, seconds: float):
+        # The metadata of the response that described the statement does not belong to later answers.
+        description = {field: value for field, value in description.items() if field != 'ResponseMetadata'}
+        with self._lock:
+            self._entries.pop(statement_id, None)
+            self._entries[statement_id] = (time.monotonic() + seconds, description)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def remove(self, statement_id: str):
+        with self._lock:
+            self._entries.pop(statement_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+memory_description_cache = MemoryDescriptionCache(MEMORY_DESCRIPTIONS)
@@ -0,0 +1,48 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+
+import json
+import os
+
+from aws_clients import get_client
+from environment_labels import RESULT_BUCKET, RESULT_PREFIX
+from integration import fallback_encoder
+from logger import logger, l_result_location
+
+DEFAULT_RESULT_PREFIX = 'statement_results/'
+BUCKET = 'Bucket'
+KEY = 'Key'
+
+
+def is_result_store_configured() -> bool:
+    return bool(os.environ.get(RESULT_BUCKET))
+
+
+def store_result(name: str, result: dict) -> dict:
+    """
+    Store a JSON serializable result in the result bucket.
+
+    Args:
+        name: Name of the result, unique within the result prefix.
+        result: The result to store.
+
+    Returns:
+        The location of the stored result with keys Bucket and Key.
+    """
+    location = {
+        BUCKET: os.environ[RESULT_BUCKET],
+        KEY: os.environ.get(RESULT_PREFIX, DEFAULT_RESULT_PREFIX) + name,
+    }
+    get_client('s3').put_object(
+        Body=json.dumps(result, default=fallback_encoder).encode('utf-8'),
+        ContentType='application/json',
+        **location
+    )
+    logger.debug({l_result_location: location})
+    return location
+
+
+def load_result(location: dict) -> dict:
+    response = get_client('s3').get_object(Bucket=location[BUCKET], Key=location[KEY])
+    return json.loads(response['Body'].read())
@@ -0,0 +1,170 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+
+import hashlib
+import re
+from functools import lru_cache
+from typing import Dict, List
+
+from exceptions import InvalidRequest
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql_statement(sql_statement: str) -> str:
+    """
+    Normalize the text of a SQL statement such that formatting differences do not change its identity:
+     - Runs of whitespace outside literals, quoted identifiers, comments and dollar quoted bodies are collapsed into a
+       single space, or a newline after a line comment
+     - Leading and trailing whitespace and trailing semicolons are removed
+    Tokens are kept as they are, e.g. 'a  b' and 'a b' are different values.
+    """
+    parts = []
+    position = 0
+    after_line_comment = False
+    for match in SQL_TOKEN.finditer(sql_statement):
+        if match.group('parameter') is not None or match.group() == '::':
+            continue
+        parts.append(_collapse_whitespace(sql_statement[position:match.start()], after_line_comment))
+        parts.append(match.group())
+        position = match.end()
+        after_line_comment = match.group().startswith('--')
+    parts.append(_collapse_whitespace(sql_statement[position:], after_line_comment))
+    return ''.join(parts).strip().rstrip('; ')
+
+
+def _collapse_whitespace(text: str, after_line_comment: bool) -> str:
+    if after_line_comment and text[:1].isspace():
+        # The line break ends the comment.
+        return '\n' + WHITESPACE.sub(' ', text.lstrip())
+    return WHITESPACE.sub(' ', text)
+
+
+def hash_sql_statement(sql_statement: str) -> str:
+    """
+    A SHA-256 hex digest of the normalized SQL statement, usable as key for the statement text.
+    """
+    return hashlib.sha256(normalize_sql_statement(sql_statement).encode('utf-8')).hexdigest()
+
+
+# Tokens that matter for finding parameter placeholders. Placeholders inside literals, quoted identifiers, comments and
+# dollar quoted bodies are not parameters and '::' is a type cast. Unterminated tokens extend to the end of the text.
+SQL_TOKEN = re.compile(r"""
+      '(?:[^'\\]|''|\\.)*'?                                 # String literal
+    | "(?:[^"]|"")*"?                                       # Quoted identifier
+    | --[^\n]*                                              # Line comment
+    | /\*.*?(?:\*/|\Z)                                      # Block comment
+    | \$(?P<tag>[A-Za-z_][A-Za-z0-9_]*|)\$.*?(?:\$(?P=tag)\$|\Z)  # Dollar quoted body
+    | ::                                                    # Type cast
+    | :(?P<parameter>[A-Za-z_][A-Za-z0-9_]*)                # Parameter placeholder
+""", re.VERBOSE | re.DOTALL)
+
+
+class SqlTemplate(object):
+    """
+    A SQL statement with named parameter placeholders (:name) parsed in a single pass. The text is kept as the parts
+    between placeholders so binding values is linear in the size of the statement.
+    """
+
+    def __init__(self, sql_statement: str):
+        self.sql_statement = sql_statement
+        self.text_parts = []
+        self.placeholders = []
+        position = 0
+        for match in SQL_TOKEN.finditer(sql_statement):
+            if match.group('parameter') is None:
+                continue
+            self.text_parts.append(sql_statement[position:match.start()])
+            self.placeholders.append(match.group('parameter'))
+            position = match.end()
+        self.text_parts.append(sql_statement[position:])
+        self.parameter_names = set(self.placeholders)
+
+    def _check_values(self, values: Dict[str, str]):
+        missing = self.parameter_names.difference(values)
+        if missing:
+            raise InvalidRequest(f"No value for parameters {sorted(missing)} of {self.sql_statement}")
+
+    def bind(self, values: Dict[str, str]) -> str:
+        """
+        Get the SQL text with every placeholder replaced by its value as quoted string literal. Redshift treats a
+        backslash in a string literal as escape character so backslashes are escaped as well as quotes.
+        """
+        self._check_values(values)
+        bound = [self.text_parts[0]]
+        for name, text_part in zip(self.placeholders, self.text_parts[1:]):
+            bound.append("'" + values[name].replace("\\", "\\\\").replace("'", "''") + "'")
+            bound.append(text_part)
+        return ''.join(bound)
+
+    def get_parameters(self, values: Dict[str, str]) -> List[Dict[str, str]]:
+        """
+        Get the values of the parameters used in the statement in the format of the Data API Parameters argument.
+        """
+        self._check_values(values)
+        return [{'name': name, 'value': values[name]} for name in sorted(self.parameter_names)]
+
+
+@lru_cache(maxsize=128)
+def parse_sql_template(sql_statement: str) -> SqlTemplate:
+    """Parse a SQL statement, templates are cached as the same statements are issued repeatedly."""
+    return SqlTemplate(sql_statement)
+
+
+READ_ONLY_FIRST_KEYWORDS = ('select', 'with', 'show')
+# Keywords that make a statement that starts like a query write or have side effects, e.g. SELECT INTO, WITH ... INSERT.
+WRITE_KEYWORDS = frozenset(['insert', 'update', 'delete', 'merge', 'create', 'drop', 'alter', 'truncate', 'grant',
+                            'revoke', 'copy', 'unload', 'call', 'into', 'vacuum', 'analyze', 'lock'])
+# Functions can have side effects (e.g. pg_terminate_backend or a user-defined function that writes) or be volatile
+# (e.g. random, getdate), so only these built-in functions and type names are allowed in read-only statements.
+READ_ONLY_FUNCTIONS = frozenset([
+    'count', 'sum', 'avg', 'min', 'max', 'median', 'stddev', 'variance', 'listagg', 'coalesce', 'nvl', 'nvl2',
+    'nullif', 'decode', 'greatest', 'least', 'lower', 'upper', 'trim', 'btrim', 'ltrim', 'rtrim', 'length', 'len',
+    'substring', 'substr', 'left', 'right', 'replace', 'concat', 'position', 'split_part', 'round', 'trunc', 'floor',
+    'ceil', 'ceiling', 'abs', 'cast', 'convert', 'date_trunc', 'date_part', 'extract', 'dateadd', 'datediff', 'to_char',
+    'to_date', 'to_number', 'row_number', 'rank', 'dense_rank', 'lag', 'lead', 'first_value', 'last_value',
+    'varchar', 'char', 'character', 'varying', 'numeric', 'decimal', 'timestamp',
+])
+# Keywords that can be followed by a parenthesis without being a function call.
+PARENTHESIS_KEYWORDS = frozenset([
+    'select', 'with', 'as', 'from', 'join', 'on', 'using', 'where', 'and', 'or', 'not', 'in', 'exists', 'any', 'all',
+    'some', 'values', 'case', 'when', 'then', 'else', 'is', 'like', 'ilike', 'between', 'distinct', 'union',
+    'intersect', 'except', 'having', 'by', 'over', 'within', 'filter', 'lateral',
+])
+SQL_WORD = re.compile(r'[a-z_][a-z0-9_$]*')
+# A word followed by a parenthesis, with the dot of a qualified name before it.
+SQL_CALL = re.compile(r'(\.\s*)?([a-z_][a-z0-9_$]*)\s*\(')
+QUOTED_IDENTIFIER_WORD = 'quoted_identifier'
+
+
+def _get_code(sql_statement: str) -> str:
+    """The lower case SQL text without literals and comments, quoted identifiers are replaced by a placeholder word."""
+    parts = []
+    position = 0
+    for match in SQL_TOKEN.finditer(sql_statement):
+        if match.group('parameter') is not None or match.group() == '::':
+            continue
+        parts.append(sql_statement[position:match.start()])
+        parts.append(f' {QUOTED_IDENTIFIER_WORD} ' if match.group().startswith('"') else ' ')
+        position = match.end()
+    parts.append(sql_statement[position:])
+    return ''.join(parts).lower()
+
+
+@lru_cache(maxsize=128)
+def is_read_only_statement(sql_statement: str) -> bool:
+    """
+    Whether a SQL statement only reads and its result only depends on the data, e.g. such that its result can be
+    cached. Literals and comments are ignored. This is conservative: statements that use a write keyword anywhere or
+    call a function other than READ_ONLY_FUNCTIONS are not read-only, e.g. queries of user-defined functions or of
+    random(). Functions without parentheses such as current_date are not detected.
+    """
+    code = _get_code(sql_statement)
+    words = SQL_WORD.findall(code)
+    if len(words) == 0 or words[0] not in READ_ONLY_FIRST_KEYWORDS or not WRITE_KEYWORDS.isdisjoint(words):
+        return False
+    for qualifier, name in SQL_CALL.findall(code):
+        if qualifier or (name not in READ_ONLY_FUNCTIONS and name not in PARENTHESIS_KEYWORDS):
+            return False
+    return True
@@ -0,0 +1,40 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from aws_lambda_powertools.utilities.batch import PartialSQSProcessor
+
+from aws_clients import get_client
+
+
+class SharedClientSession(object):
+    """Stand-in for the boto3 session that PartialSQSProcessor creates its client with, it hands out shared clients."""
+
+    @staticmethod
+    def client(service_name: str, config=None):
+        return get_client(service_name)
+
+
+class ConcurrentSQSProcessor(PartialSQSProcessor):
+    """
+    A PartialSQSProcessor that handles the records of a batch on a bounded thread pool. Record handlers mostly wait on
+    blocking network calls (the callbacks) so handling them in parallel reduces the batch latency from the sum of all
+    callbacks to roughly the slowest one. Success and failure are still tracked per record and the successful records
+    of a batch with failures are deleted by PartialSQSProcessor. It uses the shared SQS client of `aws_clients` rather
+    than a new client per instance.
+    """
+
+    def __init__(self, max_workers: int = 1, suppress_exception: bool = False):
+        super(ConcurrentSQSProcessor, self).__init__(suppress_exception=suppress_exception,
+                                                     boto3_session=SharedClientSession())
+        self.max_workers = max_workers
+
+    def process(self) -> List[Tuple]:
+        workers = min(self.max_workers, len(self.records))
+        if workers <= 1:
+            return super(ConcurrentSQSProcessor, self).process()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(self._process_record, self.records))
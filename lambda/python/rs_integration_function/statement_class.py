@@ -3,10 +3,51 @@
 
 
 import os
+import threading
 from datetime import datetime, timedelta
+from random import SystemRandom
 from uuid import uuid4
 
 
+class InvocationIdGenerator(object):
+    """
+    Generates invocation ids of the form `{seconds}.{microseconds:06}{sequence:04}{node:08}`. This is still a timestamp
+    so existing ids and the new ids parse alike. The fraction has a fixed width so ids sort in order of generation, also
+    when compared with ids in the old `str(timestamp)` format.
+     - sequence: ids generated in the same microsecond by one process get an increasing sequence number. Ids never go
+       back in time within a process, not even when the clock is adjusted.
+     - node: random per process so processes (e.g. concurrent Lambda containers) generating an id in the same
+       microsecond do not collide.
+    """
+    SEQUENCE_MODULUS = 10 ** 4
+    NODE_MODULUS = 10 ** 8
+    MICROSECONDS = 10 ** 6
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_microseconds = 0
+        self._sequence = 0
+        self._node = SystemRandom().randrange(self.NODE_MODULUS)
+
+    def next_id(self) -> str:
+        now_microseconds = round(datetime.utcnow().timestamp() * self.MICROSECONDS)
+        with self._lock:
+            if now_microseconds > self._last_microseconds:
+                self._last_microseconds = now_microseconds
+                self._sequence = 0
+            else:
+                self._sequence += 1
+                if self._sequence == self.SEQUENCE_MODULUS:
+                    self._last_microseconds += 1
+                    self._sequence = 0
+            microseconds, sequence = self._last_microseconds, self._sequence
+        seconds, fraction = divmod(microseconds, self.MICROSECONDS)
+        return f"{seconds}.{fraction:06d}{sequence:04d}{self._node:08d}"
+
+
+invocation_id_generator = InvocationIdGenerator()
+
+
 class StatementName(object):
     """
     We can use the SFN execution ARN as statement name if the invocation comes from a stepfunction.
@@ -34,7 +75,7 @@ class StatementName(object):
 
     @classmethod
     def generate_id(cls) -> str:
-        return str(datetime.utcnow().timestamp())
+        return invocation_id_generator.next_id()
 
     @classmethod
     def _invocation_id_to_datetime(cls, invocation_id):
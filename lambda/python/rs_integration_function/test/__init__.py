@@ -0,0 +1,15 @@
+import os
+
+
+def initialize_test_env():
+    os.environ['DDB_TABLE_NAME'] = 'Dummy'
+    os.environ['TTL'] = '1'
+    os.environ['CLUSTER_IDENTIFIER'] = 'DummyCluster'
+    os.environ['DATABASE'] = 'DummyDB'
+    os.environ['DB_USER'] = 'DummyUser'
+    os.environ.setdefault('AWS_REGION', 'eu-west-1')
+    os.environ.setdefault('AWS_DEFAULT_REGION', os.environ['AWS_REGION'])
+    return os.environ
+
+
+EXECUTION = "arn:aws:states:eu-west-1:012345678910:execution:machine:execution"
@@ -0,0 +1,35 @@
+import pytest
+from botocore.stub import Stubber
+
+from test import initialize_test_env
+
+
+@pytest.fixture()
+def index():
+    initialize_test_env()
+    import index
+    return index
+
+
+@pytest.fixture()
+def ddb_module():
+    initialize_test_env()
+    import ddb.ddb_state_table as ddb_module
+    return ddb_module
+
+
+@pytest.fixture()
+def ddb_stub(ddb_module, monkeypatch):
+    # The number of shards is recorded by the first registration of a container, stubbed calls start after that.
+    monkeypatch.setattr(ddb_module, 'recorded_state_table_shards', ddb_module.state_table_shards)
+    with Stubber(ddb_module.get_dynamodb().meta.client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+@pytest.fixture()
+def emulator(index):
+    from benchmark.emulator import Emulator
+    emulator = Emulator(statement_duration=0.0)
+    with emulator.installed():
+        yield emulator
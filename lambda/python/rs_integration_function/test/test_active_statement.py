@@ -0,0 +1,34 @@
+import pytest
+from botocore.stub import ANY
+
+from callback_sources.helper import NoCallback
+from test import EXECUTION
+
+
+def test_formatting_does_not_change_active_statement_key(ddb_module):
+    key = ddb_module.DDBStateTable.get_active_statement_key("call sp_my_proc(4);")
+    assert key == ddb_module.DDBStateTable.get_active_statement_key("  call   sp_my_proc(4)\n")
+    assert key != ddb_module.DDBStateTable.get_active_statement_key("call sp_my_proc(5);")
+
+
+def test_singleton_registration_claims_active_statement(ddb_module, ddb_stub):
+    ddb_stub.add_response('put_item', {}, {
+        'TableName': 'Dummy', 'Item': ANY, 'ConditionExpression': 'attribute_not_exists(#S) OR #T < :now',
+        'ExpressionAttributeNames': ANY, 'ExpressionAttributeValues': ANY, 'ReturnConsumedCapacity': 'NONE',
+    })
+    ddb_stub.add_response('put_item', {}, {
+        'TableName': 'Dummy', 'Item': ANY, 'ConditionExpression': ANY, 'ReturnConsumedCapacity': 'NONE',
+    })
+    ddb_module.DDBStateTable().register_execution_start(NoCallback({}), "call sp_my_proc(4);", run_as_singleton=True)
+
+
+def test_claimed_active_statement_reports_owner(ddb_module, ddb_stub):
+    owner = f"{EXECUTION}:{ddb_module.StatementName.generate_id()}"
+    ddb_stub.add_client_error('put_item', service_error_code='ConditionalCheckFailedException')
+    ddb_stub.add_response('get_item', {'Item': {'statement_name': {'S': owner}}}, {
+        'TableName': 'Dummy', 'Key': ANY, 'ConsistentRead': True, 'ReturnConsumedCapacity': 'NONE',
+    })
+    statement_name = ddb_module.StatementName.from_execution_arn(EXECUTION)
+    with pytest.raises(ddb_module.ActiveStatementExists) as exception_info:
+        ddb_module.DDBStateTable().claim_active_statement(statement_name, "call sp_my_proc(4);")
+    assert exception_info.value.statement_name == owner
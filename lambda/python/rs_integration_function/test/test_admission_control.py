@@ -0,0 +1,149 @@
+import time
+
+import pytest
+
+from event_labels import SQL_STATEMENT, TASK_TOKEN, EXECUTION_ARN, PRIORITY, ACTION, CANCEL_EXECUTION, \
+    EXECUTE_SINGLETON_STATEMENT, INLINE_WAIT, RESULT_CACHE_TTL, STATEMENT_ID, DESCRIBE_STATEMENT
+from test import EXECUTION
+
+
+@pytest.fixture()
+def index(index, monkeypatch):
+    import ddb.admission_control as admission_control
+    monkeypatch.setattr(admission_control, 'admission_limits', {'normal': 1, 'high': 2})
+    return index
+
+
+def get_slots(emulator):
+    return {item['id']: {name: value for name, value in item.items() if name not in ('id', 'invocationId')}
+            for item in emulator.dynamodb.items('Dummy') if item['id'].startswith('admission_slots:')}
+
+
+def execute(index, sql, token, priority='normal'):
+    return index.handler({SQL_STATEMENT: sql, TASK_TOKEN: token, EXECUTION_ARN: EXECUTION + token, PRIORITY: priority},
+                         None)
+
+
+def test_statements_wait_for_a_slot_of_their_priority(index, emulator):
+    assert 'Id' in execute(index, 'select 1', 'first')
+    second = execute(index, 'select 2', 'second')
+    assert second['AdmissionPending'] and second['Priority'] == 'normal'
+    assert 'Id' in execute(index, 'select 3', 'other', priority='high')
+    assert 'Id' in execute(index, 'select 4', 'unlimited', priority='low')
+    assert emulator.calls['redshift-data.ExecuteStatement'] == 3
+
+    # Handling the finished event of the first statement gives back its slot and submits the queued statement.
+    assert emulator.wait_for_finished_events(3)
+    emulator.deliver_finished_events(index.handler)
+    assert emulator.calls['redshift-data.ExecuteStatement'] == 4
+    assert emulator.wait_for_finished_events(1)
+    emulator.deliver_finished_events(index.handler)
+    results = emulator.stepfunctions.task_results
+    assert {token: results[token]['status'] for token in results} == {
+        'first': 'SUCCEEDED', 'second': 'SUCCEEDED', 'other': 'SUCCEEDED', 'unlimited': 'SUCCEEDED'
+    }
+    assert get_slots(emulator) == {'admission_slots:normal': {'in_flight': 0}, 'admission_slots:high': {'in_flight': 0}}
+
+
+def test_queued_statement_is_cancelled_without_submitting(index, emulator):
+    execute(index, 'select 1', 'first')
+    execute(index, 'select 2', 'second')
+    response = index.handler({ACTION: CANCEL_EXECUTION, EXECUTION_ARN: EXECUTION + 'second'}, None)
+    assert [outcome['status'] for outcome in response['statements']] == ['CANCELLED']
+
+    assert emulator.wait_for_finished_events(1)
+    emulator.deliver_finished_events(index.handler)
+    assert emulator.calls['redshift-data.ExecuteStatement'] == 1
+    assert set(emulator.stepfunctions.task_results) == {'first'}
+    assert get_slots(emulator) == {'admission_slots:normal': {'in_flight': 0}}
+
+
+def test_slot_is_given_back_when_statement_id_is_not_registered(index, emulator, monkeypatch):
+    def fail(*args):
+        raise RuntimeError('register failed')
+    monkeypatch.setattr(index.ddb_sfn_state_table, 'register_statement_id', fail)
+    assert 'Id' in execute(index, 'select 1', 'first')
+    assert emulator.wait_for_finished_events(1)
+    emulator.deliver_finished_events(index.handler)
+    assert get_slots(emulator) == {'admission_slots:normal': {'in_flight': 0}}
+
+
+def test_slot_is_given_back_once(index, emulator):
+    from statement_class import StatementName
+    execute(index, 'select 1', 'first')
+    item, = [item for item in emulator.dynamodb.items('Dummy') if item['id'] == EXECUTION + 'first']
+    statement_name = StatementName(item['id'], item['invocationId'])
+    assert index.release_slot('normal', statement_name)
+    assert not index.release_slot('normal', statement_name)
+    assert get_slots(emulator) == {'admission_slots:normal': {'in_flight': 0}}
+
+
+def test_expired_slot_of_statement_that_is_not_running_is_reclaimed(index, monkeypatch):
+    import ddb.admission_control as admission_control
+    from benchmark.emulator import Emulator
+    from statement_class import StatementName
+    emulator = Emulator(statement_duration=60.0)
+    with emulator.installed():
+        # An invocation took a slot and died before submitting its statement.
+        monkeypatch.setattr(admission_control, 'LEASE_SUBMISSION_SECONDS', -1)
+        admission_control.acquire_slot('normal', StatementName.from_execution_arn(EXECUTION + 'lost'))
+        assert 'Id' in execute(index, 'select 1', 'first')
+        assert emulator.calls['redshift-data.ExecuteStatement'] == 1
+        # The lease of a running statement is renewed rather than reclaimed.
+        assert execute(index, 'select 2', 'second')['AdmissionPending']
+        slots = get_slots(emulator)['admission_slots:normal']
+        leases = [name for name in slots if name.startswith('lease:')]
+        assert slots['in_flight'] == 1 and len(leases) == 1 and leases[0].startswith('lease:' + EXECUTION + 'first')
+        assert slots[leases[0]] > time.time()
+
+
+def test_queued_singleton_keeps_its_claim(index, emulator, monkeypatch):
+    from datetime import timedelta
+    from exceptions import ConcurrentExecution
+    # The owner is verified at once rather than after the time a statement usually needs to be submitted.
+    monkeypatch.setattr(index, 'ACTIVE_STATEMENT_SUBMISSION_GRACE', timedelta(0))
+    singleton = {SQL_STATEMENT: 'call sp_load()', ACTION: EXECUTE_SINGLETON_STATEMENT, PRIORITY: 'normal'}
+    execute(index, 'select 1', 'first')
+    assert index.handler({**singleton, TASK_TOKEN: 'second', EXECUTION_ARN: EXECUTION + 'second'},
+                         None)['AdmissionPending']
+    with pytest.raises(ConcurrentExecution):
+        index.handler({**singleton, TASK_TOKEN: 'third', EXECUTION_ARN: EXECUTION + 'third'}, None)
+
+    assert emulator.wait_for_finished_events(1)
+    emulator.deliver_finished_events(index.handler)
+    assert emulator.wait_for_finished_events(1)
+    emulator.deliver_finished_events(index.handler)
+    assert set(emulator.stepfunctions.task_results) == {'first', 'second'}
+    assert not [item for item in emulator.dynamodb.items('Dummy') if item['id'].startswith('active_statement:')]
+
+
+def test_queued_statement_is_waited_for_inline(index, emulator):
+    execute(index, 'select 1', 'first')
+    assert index.handler({SQL_STATEMENT: 'select 2', TASK_TOKEN: 'second', EXECUTION_ARN: EXECUTION + 'second',
+                          PRIORITY: 'normal', INLINE_WAIT: 5}, None)['AdmissionPending']
+    assert emulator.wait_for_finished_events(1)
+    emulator.deliver_finished_events(index.handler)
+    # The statement is completed when it is admitted, its finished event is ignored.
+    assert emulator.stepfunctions.task_results['second']['status'] == 'SUCCEEDED'
+    assert get_slots(emulator) == {'admission_slots:normal': {'in_flight': 0}}
+
+
+def test_queued_statement_is_completed_from_result_cache(index, monkeypatch):
+    from benchmark.emulator import Emulator
+    from redshift_data.result_cache import memory_result_cache
+    monkeypatch.setenv('RESULT_CACHE_ENABLED', 'true')
+    memory_result_cache.clear()
+    cached = {SQL_STATEMENT: 'select count(*) from t', PRIORITY: 'normal', RESULT_CACHE_TTL: 60}
+    # The cached statement still runs when the second one is invoked, so that one is queued.
+    emulator = Emulator(statement_duration=0.2)
+    with emulator.installed():
+        first = index.handler({**cached, TASK_TOKEN: 'first', EXECUTION_ARN: EXECUTION + 'first'}, None)
+        assert index.handler({**cached, TASK_TOKEN: 'second', EXECUTION_ARN: EXECUTION + 'second'},
+                             None)['AdmissionPending']
+        assert emulator.wait_for_finished_events(1)
+        emulator.deliver_finished_events(index.handler)
+        assert emulator.calls['redshift-data.ExecuteStatement'] == 1
+        assert emulator.stepfunctions.task_results['second']['status'] == 'SUCCEEDED'
+        latest = {STATEMENT_ID: 'LATEST', EXECUTION_ARN: EXECUTION + 'second', ACTION: DESCRIBE_STATEMENT}
+        assert index.handler(latest, None)['Id'] == first['Id']
+        assert get_slots(emulator) == {'admission_slots:normal': {'in_flight': 0}}
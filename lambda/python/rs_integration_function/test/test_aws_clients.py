@@ -0,0 +1,14 @@
+from test import initialize_test_env
+
+
+def test_clients_are_shared():
+    initialize_test_env()
+    from aws_clients import get_client
+    assert get_client('stepfunctions') is get_client('stepfunctions')
+    assert get_client('stepfunctions', max_pool_connections=20) is not get_client('stepfunctions')
+    assert get_client('stepfunctions', max_pool_connections=20).meta.config.max_pool_connections == 20
+
+
+def test_handler_import_creates_no_clients():
+    from benchmark.import_time import measure_import
+    assert measure_import('index')['clients'] == []
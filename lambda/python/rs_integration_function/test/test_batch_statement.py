@@ -0,0 +1,46 @@
+import pytest
+from botocore.stub import Stubber, ANY
+
+from event_labels import SQL_STATEMENTS, ACTION, EXECUTE_BATCH_STATEMENT, TASK_TOKEN, EXECUTION_ARN
+from test import EXECUTION
+
+
+def test_batch_is_submitted_as_one_statement(index, monkeypatch):
+    import ddb.ddb_state_table as ddb_module
+    monkeypatch.setattr(ddb_module, 'recorded_state_table_shards', ddb_module.state_table_shards)
+    from redshift_data import api
+    sql_statements = ["delete from t where id = 1", "insert into t values (1)"]
+    with Stubber(ddb_module.get_dynamodb().meta.client) as ddb_stub, \
+            Stubber(api.get_redshift_data_api()) as data_api_stub:
+        ddb_stub.add_response('put_item', {}, {
+            'TableName': 'Dummy', 'Item': ANY, 'ConditionExpression': ANY, 'ReturnConsumedCapacity': ANY,
+        })
+        data_api_stub.add_response('batch_execute_statement', {'Id': 'abc-123'}, {
+            'ClusterIdentifier': 'DummyCluster', 'Database': 'DummyDB', 'DbUser': 'DummyUser',
+            'Sqls': sql_statements, 'StatementName': ANY, 'WithEvent': True,
+        })
+        ddb_stub.add_response('update_item', {}, {
+            'TableName': 'Dummy', 'Key': ANY, 'UpdateExpression': ANY, 'ConditionExpression': ANY,
+            'ReturnConsumedCapacity': ANY, 'ExpressionAttributeNames': ANY,
+            'ExpressionAttributeValues': {':statement_id': 'abc-123'},
+        })
+        response = index.handler({
+            ACTION: EXECUTE_BATCH_STATEMENT,
+            SQL_STATEMENTS: sql_statements,
+            TASK_TOKEN: 'token',
+            EXECUTION_ARN: EXECUTION,
+        }, None)
+        ddb_stub.assert_no_pending_responses()
+        data_api_stub.assert_no_pending_responses()
+    assert response['Id'] == 'abc-123'
+
+
+@pytest.mark.parametrize("event", [
+    {SQL_STATEMENTS: []},
+    {SQL_STATEMENTS: "select 1"},
+    {SQL_STATEMENTS: ["select :id"], "parameters": [{"name": "id", "value": "1"}]},
+    {SQL_STATEMENTS: ["select 1"], ACTION: "executeSingletonStatement"},
+])
+def test_invalid_batch_is_rejected(index, event):
+    with pytest.raises(index.InvalidRequest):
+        index.handler(event, None)
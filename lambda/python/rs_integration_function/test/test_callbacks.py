@@ -1,20 +1,10 @@
-import os
-
-import pytest as pytest
+import pytest
 
 from callback_sources.cfn_callback import CfnCallback
 from callback_sources.helper import NoCallback
 from callback_sources.sfn_callback import SfnCallback
 from event_labels import TASK_TOKEN, EXECUTION_ARN, SQL_STATEMENT
-
-
-def initialize_test_env():
-    os.environ['DDB_TABLE_NAME'] = 'Dummy'
-    os.environ['TTL'] = '1'
-    os.environ['CLUSTER_IDENTIFIER'] = 'DummyCluster'
-    os.environ['DATABASE'] = 'DummyDB'
-    os.environ['DB_USER'] = 'DummyUser'
-    return os.environ
+from test import initialize_test_env
 
 
 @pytest.fixture()
@@ -0,0 +1,33 @@
+import pytest
+
+from event_labels import SQL_STATEMENT, TASK_TOKEN, EXECUTION_ARN, ACTION, CANCEL_EXECUTION
+from test import EXECUTION
+
+
+@pytest.mark.parametrize('shards', [1, 4])
+def test_unhandled_statements_of_execution_are_cancelled(index, monkeypatch, shards):
+    import ddb.ddb_state_table as ddb_module
+    from benchmark.emulator import Emulator
+    monkeypatch.setattr(ddb_module, 'state_table_shards', shards)
+    emulator = Emulator(statement_duration=lambda sql: 0.0 if sql == 'select 1' else 60.0)
+    with emulator.installed():
+        for i, sql in enumerate(['select 1', 'select 2', 'select 3']):
+            index.handler({SQL_STATEMENT: sql, TASK_TOKEN: f'token{i}', EXECUTION_ARN: EXECUTION}, None)
+        index.handler({SQL_STATEMENT: 'select 4', TASK_TOKEN: 'other', EXECUTION_ARN: EXECUTION + '2'}, None)
+
+        response = index.handler({ACTION: CANCEL_EXECUTION, EXECUTION_ARN: EXECUTION}, None)
+        statuses = sorted(outcome['status'] for outcome in response['statements'])
+        assert statuses == ['CANCELLED', 'CANCELLED', 'NOT_ACTIVE']
+        assert emulator.calls['redshift-data.CancelStatement'] == 3
+
+        assert emulator.wait_for_finished_events(3)
+        emulator.deliver_finished_events(index.handler)
+        # Only the statement that was no longer active completes, the finished events of the others are ignored.
+        assert set(emulator.stepfunctions.task_results) == {'token0'}
+        assert index.handler({ACTION: CANCEL_EXECUTION, EXECUTION_ARN: EXECUTION}, None)['statements'] == []
+
+
+def test_cancel_execution_needs_execution_arn(index):
+    from exceptions import InvalidRequest
+    with pytest.raises(InvalidRequest):
+        index.handler({ACTION: CANCEL_EXECUTION}, None)
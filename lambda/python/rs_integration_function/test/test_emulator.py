@@ -0,0 +1,56 @@
+import json
+from decimal import Decimal
+
+from event_labels import SQL_STATEMENT, TASK_TOKEN, EXECUTION_ARN
+from test import EXECUTION
+
+
+def run_statement(index, emulator, token, execution_arn=EXECUTION):
+    index.handler({SQL_STATEMENT: 'select 1', TASK_TOKEN: token, EXECUTION_ARN: execution_arn}, None)
+    assert emulator.wait_for_finished_events(1)
+    assert emulator.deliver_finished_events(index.handler) == 1
+
+
+def test_statement_callback_round_trip(index):
+    from benchmark.emulator import Emulator
+    emulator = Emulator(statement_duration=0.01)
+    with emulator.installed():
+        run_statement(index, emulator, 'token')
+    result = emulator.stepfunctions.task_results['token']
+    assert result['status'] == 'SUCCEEDED'
+    assert json.loads(result['output'])['detail']['state'] == 'FINISHED'
+    [item] = [item for item in emulator.dynamodb.items('Dummy') if item['id'] != 'configuration']
+    assert 'finished_event_details' in item
+    assert emulator.calls['redshift-data.ExecuteStatement'] == 1
+
+
+def test_failed_statement_fails_task(index):
+    from benchmark.emulator import Emulator
+    emulator = Emulator(statement_duration=0.01, statement_failure_rate=1.0)
+    with emulator.installed():
+        run_statement(index, emulator, 'token')
+    assert emulator.stepfunctions.task_results['token']['status'] == 'FAILED'
+
+
+def test_failed_callback_is_redelivered(index):
+    from benchmark.emulator import Emulator
+    emulator = Emulator(statement_duration=0.01, errors={'stepfunctions': (1.0, 'ThrottlingException')}, seed=1)
+    with emulator.installed():
+        run_statement(index, emulator, 'token')
+        assert emulator.pending_finished_events() == 1
+        emulator.errors.clear()
+        assert emulator.deliver_finished_events(index.handler) == 1
+    assert emulator.stepfunctions.task_results['token']['status'] == 'SUCCEEDED'
+    assert emulator.calls['stepfunctions.SendTaskSuccess'] == 2
+
+
+def test_expressions():
+    from benchmark.ddb_expressions import ExpressionParser
+    item = {'id': 'a', 'count': Decimal(1), 'tags': {'x'}}
+    condition = ExpressionParser('attribute_exists(#i) AND #c BETWEEN :low AND :high',
+                                 {'#i': 'id', '#c': 'count'}, {':low': 0, ':high': 2}).parse_condition()
+    assert condition(item)
+    update = ExpressionParser('SET #c = #c + :one, other = if_not_exists(other, :one) REMOVE tags',
+                              {'#c': 'count'}, {':one': 1}).parse_update()
+    assert update(item) == {'id': 'a', 'count': Decimal(2), 'other': 1}
+    assert item['count'] == Decimal(1)
@@ -0,0 +1,117 @@
+import json
+
+import pytest
+from botocore.stub import ANY
+
+from callback_sources.sfn_callback import SfnCallback
+from event_labels import TASK_TOKEN, EXECUTION_ARN
+from test import EXECUTION
+
+
+def make_statement_name(invocation_id):
+    from statement_class import StatementName
+    return StatementName(EXECUTION, invocation_id)
+
+
+def make_ddb_item(statement_name):
+    return {
+        "id": {"S": statement_name.execution_arn},
+        "invocationId": {"S": statement_name.invocation_id},
+        "sqlStatement": {"S": "select 1"},
+        "callback_details": {"S": json.dumps({TASK_TOKEN: "token", EXECUTION_ARN: statement_name.execution_arn})},
+    }
+
+
+def test_batch_fetches_all_state_with_one_call(ddb_module, ddb_stub):
+    tracked = make_statement_name(ddb_module.StatementName.generate_id())
+    untracked = make_statement_name(ddb_module.StatementName.generate_id())
+    ddb_stub.add_response(
+        'batch_get_item',
+        {'Responses': {'Dummy': [make_ddb_item(tracked)]}, 'UnprocessedKeys': {}},
+        {'RequestItems': ANY, 'ReturnConsumedCapacity': 'NONE'}
+    )
+    batch = ddb_module.DDBStateTable().batch([tracked, untracked, tracked])
+    assert isinstance(batch.get_callback_source_for_statement_name(tracked), SfnCallback)
+    with pytest.raises(ddb_module.NoTrackedState):
+        batch.get_callback_source_for_statement_name(untracked)
+
+
+def test_batch_flush_updates_handled_items(ddb_module, ddb_stub):
+    statement_name = make_statement_name(ddb_module.StatementName.generate_id())
+    ddb_stub.add_response(
+        'batch_get_item',
+        {'Responses': {'Dummy': [make_ddb_item(statement_name)]}},
+        {'RequestItems': ANY, 'ReturnConsumedCapacity': 'NONE'}
+    )
+    # Only the handled fields are set, attributes written since the batch was fetched are kept.
+    ddb_stub.add_response('update_item', {'Attributes': {**make_ddb_item(statement_name),
+                                                         'admission_priority': {'S': 'normal'}}}, {
+        'TableName': 'Dummy', 'Key': ANY, 'UpdateExpression': 'SET #T = :ttl, #D = :details',
+        'ConditionExpression': 'attribute_not_exists(#D)', 'ReturnValues': 'ALL_OLD',
+        'ReturnConsumedCapacity': 'NONE', 'ExpressionAttributeNames': ANY, 'ExpressionAttributeValues': ANY,
+    })
+    batch = ddb_module.DDBStateTable().batch([statement_name])
+    batch.mark_statement_name_as_handled(statement_name, {'detail': {'state': 'FINISHED', 'duration': 1.5}})
+    assert [item['admission_priority'] for item in batch.flush().values()] == ['normal']
+    assert batch.handled_items == {}
+
+
+def test_batch_flush_skips_statements_handled_concurrently(ddb_module, ddb_stub):
+    statement_name = make_statement_name(ddb_module.StatementName.generate_id())
+    ddb_stub.add_response(
+        'batch_get_item',
+        {'Responses': {'Dummy': [make_ddb_item(statement_name)]}},
+        {'RequestItems': ANY, 'ReturnConsumedCapacity': 'NONE'}
+    )
+    ddb_stub.add_client_error('update_item', 'ConditionalCheckFailedException')
+    batch = ddb_module.DDBStateTable().batch([statement_name])
+    batch.mark_statement_name_as_handled(statement_name, {'detail': {'state': 'FINISHED'}})
+    assert batch.flush() == {}
+
+
+def test_failed_updates_are_sent_again(ddb_module, ddb_stub, monkeypatch):
+    delays = []
+    monkeypatch.setattr(ddb_module.time, 'sleep', delays.append)
+    statement_name = make_statement_name(ddb_module.StatementName.generate_id())
+    ddb_stub.add_response(
+        'batch_get_item',
+        {'Responses': {'Dummy': [make_ddb_item(statement_name)]}},
+        {'RequestItems': ANY, 'ReturnConsumedCapacity': 'NONE'}
+    )
+    ddb_stub.add_client_error('update_item', 'ProvisionedThroughputExceededException')
+    ddb_stub.add_response('update_item', {'Attributes': make_ddb_item(statement_name)})
+    batch = ddb_module.DDBStateTable().batch([statement_name])
+    batch.mark_statement_name_as_handled(statement_name, {'detail': {'state': 'FINISHED'}})
+    assert list(batch.flush()) == [str(statement_name)]
+    assert batch.handled_items == {}
+    assert len(delays) == 1
+
+
+def test_records_stay_successful_when_marking_fails(index, monkeypatch):
+    from ddb.ddb_state_table import DDBStateTableBatch
+    from benchmark.emulator import Emulator
+
+    def fail(self):
+        raise RuntimeError('state table unavailable')
+    monkeypatch.setattr(DDBStateTableBatch, 'flush', fail)
+    emulator = Emulator(statement_duration=0.0)
+    with emulator.installed():
+        index.handler({'sqlStatement': 'select 1', TASK_TOKEN: 'token', EXECUTION_ARN: EXECUTION}, None)
+        emulator.wait_for_finished_events(1)
+        emulator.deliver_finished_events(index.handler)
+        # The callback was sent, so the record is not retried which would send it again.
+        assert emulator.pending_finished_events() == 0
+    assert emulator.calls['stepfunctions.SendTaskSuccess'] == 1
+
+
+def test_unprocessed_keys_are_retried_with_backoff(ddb_module, ddb_stub, monkeypatch):
+    delays = []
+    monkeypatch.setattr(ddb_module.time, 'sleep', delays.append)
+    statement_name = make_statement_name(ddb_module.StatementName.generate_id())
+    for _ in range(ddb_module.MAX_ATTEMPTS):
+        key = {'id': {'S': EXECUTION}, 'invocationId': {'S': statement_name.invocation_id}}
+        ddb_stub.add_response('batch_get_item', {'Responses': {}, 'UnprocessedKeys': {'Dummy': {'Keys': [key]}}},
+                              {'RequestItems': ANY, 'ReturnConsumedCapacity': 'NONE'})
+    with pytest.raises(ddb_module.UnprocessedItems):
+        ddb_module.DDBStateTable().batch([statement_name])
+    assert len(delays) == ddb_module.MAX_ATTEMPTS - 1
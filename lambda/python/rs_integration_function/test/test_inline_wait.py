@@ -0,0 +1,92 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+from botocore.stub import Stubber, ANY
+
+from event_labels import SQL_STATEMENT, TASK_TOKEN, EXECUTION_ARN, INLINE_WAIT
+from test import EXECUTION
+
+UPDATED_AT = datetime(2021, 6, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture()
+def data_api_stub(index):
+    from redshift_data import api
+    with Stubber(api.get_redshift_data_api()) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def make_description(status, **extra):
+    return {'Id': 'abc-123', 'Status': status, 'UpdatedAt': UPDATED_AT, **extra}
+
+
+def test_wait_returns_description_of_completed_statement(index, data_api_stub):
+    from redshift_data import api
+    data_api_stub.add_response('describe_statement', make_description('STARTED'), {'Id': 'abc-123'})
+    data_api_stub.add_response('describe_statement', make_description('FINISHED', ResultRows=1), {'Id': 'abc-123'})
+    description = api.wait_for_statement('abc-123', timeout_seconds=5)
+    assert description['Status'] == 'FINISHED'
+
+
+def test_wait_gives_up_after_timeout(index, data_api_stub):
+    from redshift_data import api
+    data_api_stub.add_response('describe_statement', make_description('STARTED'), {'Id': 'abc-123'})
+    assert api.wait_for_statement('abc-123', timeout_seconds=0) is None
+
+
+def test_finished_event_from_description(index):
+    statement_name = str(index.StatementName.from_execution_arn(EXECUTION))
+    description = make_description('FAILED', Error='boom')
+    finished_event = index.FinishedEvent.from_statement_description(statement_name, description)
+    assert finished_event.has_failed()
+    assert finished_event.get_statement_name() == statement_name
+    assert finished_event.get_statement_id() == 'abc-123'
+    assert finished_event['detail']['error'] == 'boom'
+    assert finished_event['time'] == '2021-06-01T12:00:00Z'
+
+
+def test_short_statement_is_completed_by_invocation(index, data_api_stub, monkeypatch):
+    import ddb.ddb_state_table as ddb_module
+    monkeypatch.setattr(ddb_module, 'recorded_state_table_shards', ddb_module.state_table_shards)
+    with Stubber(ddb_module.get_dynamodb().meta.client) as ddb_stub, \
+            Stubber(index.StepFunctionAPI.get_client()) as sfn_stub:
+        ddb_stub.add_response('put_item', {}, {
+            'TableName': 'Dummy', 'Item': ANY, 'ConditionExpression': ANY, 'ReturnConsumedCapacity': ANY,
+        })
+        data_api_stub.add_response('execute_statement', {'Id': 'abc-123'}, {
+            'ClusterIdentifier': 'DummyCluster', 'Database': 'DummyDB', 'DbUser': 'DummyUser',
+            'Sql': 'select 1', 'StatementName': ANY, 'WithEvent': True,
+        })
+        ddb_stub.add_response('update_item', {}, {
+            'TableName': 'Dummy', 'Key': ANY, 'UpdateExpression': 'SET #S = :statement_id',
+            'ConditionExpression': 'attribute_exists(sqlStatement)',
+            'ReturnConsumedCapacity': ANY, 'ExpressionAttributeNames': ANY, 'ExpressionAttributeValues': ANY,
+        })
+        data_api_stub.add_response('describe_statement', make_description('FINISHED', ResultRows=1), {'Id': 'abc-123'})
+        sfn_stub.add_response('send_task_success', {}, {'taskToken': 'token', 'output': ANY})
+        ddb_stub.add_response('update_item', {}, {
+            'TableName': 'Dummy', 'Key': ANY, 'UpdateExpression': 'SET #T = :ttl, #D = :details',
+            'ReturnValues': 'ALL_OLD', 'ReturnConsumedCapacity': ANY, 'ExpressionAttributeNames': ANY,
+            'ExpressionAttributeValues': ANY,
+        })
+        index.handler({SQL_STATEMENT: 'select 1', TASK_TOKEN: 'token', EXECUTION_ARN: EXECUTION, INLINE_WAIT: 1}, None)
+        ddb_stub.assert_no_pending_responses()
+        sfn_stub.assert_no_pending_responses()
+
+
+def test_finished_event_of_handled_statement_is_ignored(index):
+    from ddb.ddb_state_table import DDBStateTableBatch
+    statement_name = index.StatementName.from_execution_arn(EXECUTION)
+    batch = DDBStateTableBatch(index.ddb_sfn_state_table, {str(statement_name): {
+        'callback_details': json.dumps({TASK_TOKEN: 'token', EXECUTION_ARN: EXECUTION}),
+        'finished_event_details': {'detail': {'state': 'FINISHED'}},
+    }})
+    finished_event = index.FinishedEvent({'detail': {
+        'statementName': str(statement_name), 'statementId': 'abc-123', 'state': 'FINISHED'
+    }})
+    with Stubber(index.StepFunctionAPI.get_client()):
+        # The stub fails any callback that is sent.
+        index.handle_finished_event(finished_event, batch)
+    assert batch.handled_items == {}
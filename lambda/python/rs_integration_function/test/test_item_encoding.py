@@ -0,0 +1,59 @@
+import json
+
+import pytest
+from boto3.dynamodb.types import Binary
+
+from test import initialize_test_env
+
+
+@pytest.fixture()
+def item_encoding():
+    initialize_test_env()
+    from ddb import item_encoding
+    return item_encoding
+
+
+def test_callback_details_round_trip(item_encoding):
+    callback_details = {"taskToken": "token" * 100, "executionArn": "arn:aws:states:eu-west-1:1:execution:m:e"}
+    encoded = item_encoding.encode_callback_details(json.dumps(callback_details))
+    assert len(encoded) < len(json.dumps(callback_details))
+    # Reading from DynamoDB returns binary attributes wrapped as Binary.
+    assert item_encoding.decode_callback_details(Binary(encoded)) == callback_details
+
+
+def test_callback_details_of_previous_format_are_decoded(item_encoding):
+    callback_details = {"taskToken": "token", "executionArn": "arn"}
+    assert item_encoding.decode_callback_details(json.dumps(callback_details)) == callback_details
+
+
+def test_long_sql_statement_is_tracked_by_hash_and_preview(item_encoding, monkeypatch):
+    monkeypatch.delenv('RESULT_BUCKET', raising=False)
+    sql_statement = "insert into t values " + ",".join(["(1, 'value')"] * 10000)
+    attributes = item_encoding.encode_sql_statement(sql_statement)
+    assert len(attributes['sqlStatement']) == item_encoding.SQL_PREVIEW_LENGTH
+    assert attributes['sql_hash'] == item_encoding.hash_sql_statement(sql_statement)
+    assert 'sql_location' not in attributes
+
+
+def test_offloaded_sql_texts_are_stored_by_exact_text(item_encoding, monkeypatch):
+    stored = {}
+    monkeypatch.setattr(item_encoding, 'is_sql_offload_enabled', lambda: True)
+    monkeypatch.setattr(item_encoding, 'store_result', lambda key, value: stored.setdefault(key, value) and key)
+    values = "'x'," * 500
+    statements = [f"select {values} 'a  b'", f"select {values} 'a b'", f"select  {values} 'a b'"]
+    locations = [item_encoding.encode_sql_statement(sql_statement)['sql_location'] for sql_statement in statements]
+    assert len(set(locations)) == 3
+    assert [stored[location]['sqlStatement'] for location in locations] == statements
+
+
+def test_finished_event_details_are_compacted(item_encoding):
+    finished_event = {
+        "version": "0", "id": "x", "detail-type": "Redshift Data Statement Status Change", "source": "aws.redshift-data",
+        "time": "2021-09-17T12:00:00Z", "resources": ["arn:aws:redshift:eu-west-1:1:cluster:c"],
+        "detail": {"principal": "arn", "statementName": "name", "statementId": "abc-123", "redshiftQueryId": 1,
+                   "state": "FAILED", "rows": -1, "expireAt": 1631966400, "error": "syntax error"},
+    }
+    assert item_encoding.encode_finished_event_details(finished_event) == {
+        "time": "2021-09-17T12:00:00Z",
+        "detail": {"statementId": "abc-123", "state": "FAILED", "rows": -1, "error": "syntax error"},
+    }
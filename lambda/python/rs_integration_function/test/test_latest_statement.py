@@ -0,0 +1,95 @@
+import pytest
+from botocore.stub import Stubber, ANY
+
+from event_labels import STATEMENT_ID, EXECUTION_ARN
+from test import EXECUTION
+
+
+def add_latest_item_response(ddb_stub, item, partition_key=EXECUTION):
+    ddb_stub.add_response('query', {'Items': [item]}, {
+        'TableName': 'Dummy', 'KeyConditionExpression': ANY, 'ProjectionExpression': ANY,
+        'ExpressionAttributeNames': ANY, 'ExpressionAttributeValues': {':partition_key': partition_key},
+        'ScanIndexForward': False, 'Limit': 1, 'ConsistentRead': True, 'ReturnConsumedCapacity': 'NONE',
+    })
+
+
+def test_latest_resolves_from_state_table(index, ddb_stub):
+    invocation_id = index.StatementName.generate_id()
+    add_latest_item_response(ddb_stub, {'invocationId': {'S': invocation_id}, 'statement_id': {'S': 'abc-123'}})
+    assert index.get_statement_id({STATEMENT_ID: 'LATEST', EXECUTION_ARN: EXECUTION}) == 'abc-123'
+
+
+def test_latest_without_recorded_id_falls_back_on_data_api(index, ddb_stub):
+    invocation_id = index.StatementName.generate_id()
+    statement_name = f"{EXECUTION}:{invocation_id}"
+    add_latest_item_response(ddb_stub, {'invocationId': {'S': invocation_id}})
+    from redshift_data import api
+    with Stubber(api.get_redshift_data_api()) as data_api_stub:
+        data_api_stub.add_response('list_statements', {'Statements': [
+            {'Id': 'other', 'StatementName': statement_name + '1', 'QueryString': 'x'},
+            {'Id': 'abc-123', 'StatementName': statement_name, 'QueryString': 'x'},
+        ]}, {'Status': 'ALL', 'StatementName': statement_name})
+        assert index.get_statement_id({STATEMENT_ID: 'LATEST', EXECUTION_ARN: EXECUTION}) == 'abc-123'
+
+
+def test_explicit_statement_id_is_used_as_is(index):
+    assert index.get_statement_id({STATEMENT_ID: 'abc-123'}) == 'abc-123'
+
+
+@pytest.fixture()
+def sharded(index, monkeypatch):
+    import ddb.ddb_state_table as ddb_module
+    monkeypatch.setattr(ddb_module, 'state_table_shards', 2)
+
+
+def test_statements_are_spread_over_shards(index, sharded):
+    partition_keys = {
+        index.ddb_sfn_state_table.get_partition_key(index.StatementName.from_execution_arn(EXECUTION))
+        for _ in range(100)
+    }
+    assert partition_keys == {f"{EXECUTION}#0", f"{EXECUTION}#1"}
+    assert index.ddb_sfn_state_table.get_execution_arn_for_partition_key(f"{EXECUTION}#1") == EXECUTION
+
+
+def test_latest_is_gathered_from_all_shards(index, sharded, monkeypatch):
+    # Shards are queried from multiple threads so the queries are replaced rather than stubbed in order.
+    older_id, latest_id = index.StatementName.generate_id(), index.StatementName.generate_id()
+    items = {
+        f"{EXECUTION}#0": {'invocationId': older_id, 'statement_id': 'older'},
+        f"{EXECUTION}#1": {'invocationId': latest_id, 'statement_id': 'latest'},
+    }
+    import ddb.ddb_state_table as ddb_module
+    queried = []
+
+    def query(partition_key, return_consumed_capacity):
+        queried.append(partition_key)
+        return {'Items': [items[partition_key]]}
+
+    monkeypatch.setattr(ddb_module.DDBStateTable, 'query_latest_item', staticmethod(query))
+    assert index.get_statement_id({STATEMENT_ID: 'LATEST', EXECUTION_ARN: EXECUTION}) == 'latest'
+    assert sorted(queried) == sorted(items)
+
+
+def test_statement_id_is_not_registered_without_statement(index):
+    from benchmark.emulator import Emulator
+    from ddb.ddb_state_table import get_conditional_check_failed_exception
+    statement_name = index.StatementName.from_execution_arn(EXECUTION)
+    emulator = Emulator()
+    with emulator.installed():
+        with pytest.raises(get_conditional_check_failed_exception()):
+            index.ddb_sfn_state_table.register_statement_id(statement_name, 'abc-123')
+        with pytest.raises(get_conditional_check_failed_exception()):
+            index.ddb_sfn_state_table.register_admission_queued(statement_name, 'normal')
+        assert emulator.dynamodb.items('Dummy') == []
+
+
+def test_shard_count_change_is_rejected(index, emulator, monkeypatch):
+    import ddb.ddb_state_table as ddb_module
+    from exceptions import ConfigurationError
+    from event_labels import SQL_STATEMENT, TASK_TOKEN
+    monkeypatch.setattr(ddb_module, 'recorded_state_table_shards', None)
+    index.handler({SQL_STATEMENT: 'select 1', TASK_TOKEN: 'first', EXECUTION_ARN: EXECUTION}, None)
+    monkeypatch.setattr(ddb_module, 'state_table_shards', 2)
+    with pytest.raises(ConfigurationError):
+        index.handler({SQL_STATEMENT: 'select 1', TASK_TOKEN: 'second', EXECUTION_ARN: EXECUTION}, None)
+    assert emulator.calls['redshift-data.ExecuteStatement'] == 1
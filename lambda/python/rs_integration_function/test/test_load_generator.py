@@ -0,0 +1,22 @@
+import pytest
+
+
+def test_load_is_reported_per_action(index):
+    from benchmark.emulator import Emulator
+    from benchmark.load_generator import LoadGenerator, summarize, EXECUTE_SFN, DESCRIBE, FINISHED_EVENTS
+    emulator = Emulator(statement_duration=0.0, seed=1)
+    with emulator.installed():
+        generator = LoadGenerator(index.handler, {EXECUTE_SFN: 2, DESCRIBE: 1, FINISHED_EVENTS: 1}, rate=200,
+                                  duration=0.5, workers=4, emulator=emulator, seed=1)
+        report = summarize(generator.run())
+    assert set(report['actions']) <= {EXECUTE_SFN, DESCRIBE, FINISHED_EVENTS}
+    execute = report['actions'][EXECUTE_SFN]
+    assert execute['requests'] > 0 and execute['errors'] == {}
+    assert execute['p50_ms'] <= execute['p95_ms'] <= execute['p99_ms'] <= execute['max_ms']
+    assert report['total']['requests'] + sum(report.get('skipped', {}).values()) == 100
+
+
+def test_finished_events_need_the_emulator(index):
+    from benchmark.load_generator import LoadGenerator, FINISHED_EVENTS
+    with pytest.raises(ValueError):
+        LoadGenerator(index.handler, {FINISHED_EVENTS: 1}, rate=1, duration=1, workers=1)
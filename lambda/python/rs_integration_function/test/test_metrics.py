@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from test import initialize_test_env
+
+
+@pytest.fixture()
+def metrics():
+    initialize_test_env()
+    import metrics
+    lines = []
+    metrics.set_metrics_sink(lines.append)
+    metrics.emitted = lines
+    yield metrics
+    metrics.set_metrics_sink(metrics.write_to_stdout)
+
+
+def test_unit_of_work_is_emitted_as_single_emf_line(metrics):
+    with metrics.record_metrics(action='execute_statement'):
+        metrics.set_dimensions(callback_type='SfnCallback')
+        with metrics.stage(metrics.STAGE_DDB_REGISTER):
+            pass
+        with metrics.stage(metrics.STAGE_DDB_REGISTER):
+            pass
+        metrics.add_consumed_capacity(metrics.STAGE_DDB_REGISTER, {'ConsumedCapacity': {'CapacityUnits': 1.0}})
+        metrics.add_consumed_capacity(metrics.STAGE_DDB_REGISTER, {'ConsumedCapacity': [{'CapacityUnits': 2.0}]})
+    assert len(metrics.emitted) == 1
+    emf = json.loads(metrics.emitted[0])
+    definition = emf['_aws']['CloudWatchMetrics'][0]
+    assert definition['Dimensions'] == [['action', 'callback_type']]
+    assert {m['Name'] for m in definition['Metrics']} == {'ddb_register', 'duration', 'ddb_register_capacity'}
+    assert emf['action'] == 'execute_statement' and emf['callback_type'] == 'SfnCallback'
+    assert emf['ddb_register_capacity'] == 3.0
+    assert emf['duration'] >= emf['ddb_register']
+
+
+def test_nested_unit_of_work_is_emitted_separately(metrics):
+    with metrics.record_metrics(action='complete_statement', callback_type='batch'):
+        with metrics.record_metrics(action='complete_statement'):
+            with metrics.stage(metrics.STAGE_CALLBACK):
+                pass
+        with metrics.stage(metrics.STAGE_DDB_MARK):
+            pass
+    record, batch = [json.loads(line) for line in metrics.emitted]
+    assert metrics.STAGE_CALLBACK in record and metrics.STAGE_DDB_MARK not in record
+    assert metrics.STAGE_DDB_MARK in batch and metrics.STAGE_CALLBACK not in batch
+
+
+def test_capacity_is_only_requested_while_recording(metrics):
+    assert metrics.consumed_capacity_mode() == 'NONE'
+    with metrics.stage(metrics.STAGE_DDB_GET):
+        metrics.add_consumed_capacity(metrics.STAGE_DDB_GET, {'ConsumedCapacity': {'CapacityUnits': 1.0}})
+    with metrics.record_metrics(action='describe_statement'):
+        assert metrics.consumed_capacity_mode() == 'TOTAL'
+    assert len(metrics.emitted) == 1
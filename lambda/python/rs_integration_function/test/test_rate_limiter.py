@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from event_labels import SQL_STATEMENT, TASK_TOKEN, EXECUTION_ARN
+from test import initialize_test_env, EXECUTION
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_rate_is_decreased_on_throttle_and_increased_on_success():
+    initialize_test_env()
+    from rate_limiter import AdaptiveRateLimiter
+    clock = Clock()
+    rate_limiter = AdaptiveRateLimiter(clock)
+    for _ in range(40):
+        clock.now += 0.025
+        assert rate_limiter.reserve() == 0.0
+    rate_limiter.on_throttle()
+    assert rate_limiter.rate == pytest.approx(28.0)
+    # Throttles of calls that were sent together only decrease the rate once.
+    rate_limiter.on_throttle()
+    assert rate_limiter.rate == pytest.approx(28.0)
+    waits = [rate_limiter.reserve() for _ in range(3)]
+    assert waits == pytest.approx([1 / 28, 2 / 28, 3 / 28])
+    for _ in range(28):
+        rate_limiter.on_success()
+    # About ADDITIVE_INCREASE more per second of successful calls.
+    assert 36.0 < rate_limiter.rate < 37.0
+
+
+def test_throttled_callbacks_are_retried(monkeypatch):
+    initialize_test_env()
+    monkeypatch.setenv('ADAPTIVE_RATE_LIMITING', 'true')
+    import index
+    import metrics
+    import rate_limiter
+    from benchmark.emulator import Emulator
+    monkeypatch.setattr(rate_limiter, 'RETRY_BASE_SECONDS', 0.001)
+    monkeypatch.setattr(rate_limiter, 'MIN_RATE', 100.0)
+    rate_limiter.reset_rate_limiters()
+    lines = []
+    metrics.set_metrics_sink(lines.append)
+    emulator = Emulator(statement_duration=0.0, errors={'stepfunctions': (0.3, 'ThrottlingException')}, seed=1)
+    try:
+        with emulator.installed():
+            for i in range(10):
+                index.handler({SQL_STATEMENT: 'select 1', TASK_TOKEN: f'token{i}', EXECUTION_ARN: EXECUTION}, None)
+            assert emulator.wait_for_finished_events(10)
+            emulator.deliver_finished_events(index.handler)
+    finally:
+        metrics.set_metrics_sink(metrics.write_to_stdout)
+        rate_limiter.reset_rate_limiters()
+    assert len(emulator.stepfunctions.task_results) == 10
+    throttles = sum(json.loads(line).get('throttles_stepfunctions', 0) for line in lines)
+    assert throttles == emulator.calls['stepfunctions.SendTaskSuccess'] - 10 > 0
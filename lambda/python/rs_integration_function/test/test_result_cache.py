@@ -0,0 +1,80 @@
+import pytest
+
+from event_labels import SQL_STATEMENT, TASK_TOKEN, EXECUTION_ARN, RESULT_CACHE_TTL, STATEMENT_ID, ACTION, \
+    GET_STATEMENT_RESULT
+from test import initialize_test_env, EXECUTION
+
+SQL = "select count(*) from exp_data where executionid = 'abc'"
+
+
+@pytest.fixture()
+def index(monkeypatch):
+    initialize_test_env()
+    monkeypatch.setenv('RESULT_CACHE_ENABLED', 'true')
+    import index
+    from redshift_data.result_cache import memory_result_cache
+    memory_result_cache.clear()
+    return index
+
+
+def execute(index, token, execution=EXECUTION):
+    return index.handler({SQL_STATEMENT: SQL, TASK_TOKEN: token, EXECUTION_ARN: execution, RESULT_CACHE_TTL: 60}, None)
+
+
+def test_repeated_statement_is_served_from_cache(index, emulator):
+    first = execute(index, 'first')
+    assert emulator.wait_for_finished_events(1)
+    emulator.deliver_finished_events(index.handler)
+    result = index.handler({STATEMENT_ID: first['Id'], ACTION: GET_STATEMENT_RESULT}, None)
+    assert emulator.stepfunctions.task_results['first']['status'] == 'SUCCEEDED'
+
+    second = execute(index, 'second', execution=EXECUTION + '2')
+    assert second['ResultCacheHit'] and second['Id'] == first['Id']
+    assert emulator.stepfunctions.task_results['second']['status'] == 'SUCCEEDED'
+    assert emulator.calls['redshift-data.ExecuteStatement'] == 1
+
+    from redshift_data.result_cache import memory_result_cache
+    memory_result_cache.clear()
+    latest = {STATEMENT_ID: 'LATEST', EXECUTION_ARN: EXECUTION + '2', ACTION: GET_STATEMENT_RESULT}
+    assert index.handler(latest, None)['Records'] == result['Records']
+    assert emulator.calls['redshift-data.GetStatementResult'] == 1
+
+
+def test_cache_ttl_needs_read_only_statement(index, emulator):
+    from exceptions import InvalidRequest
+    with pytest.raises(InvalidRequest):
+        index.handler({SQL_STATEMENT: 'delete from exp_data', RESULT_CACHE_TTL: 60}, None)
+
+
+def test_memory_cache_evicts_least_recently_used(index):
+    from redshift_data.result_cache import MemoryResultCache
+    cache = MemoryResultCache(max_bytes=10)
+    cache.put('a', 2 ** 40, 4, {'a': 1})
+    cache.put('b', 2 ** 40, 4, {'b': 1})
+    assert cache.get('a') == {'a': 1}
+    cache.put('c', 2 ** 40, 4, {'c': 1})
+    assert cache.get('b') is None and cache.get('a') == {'a': 1} and cache.size == 8
+    cache.put('expired', 0, 1, {})
+    assert cache.get('expired') is None
+
+
+def test_statements_differing_in_literals_have_different_keys(index):
+    from redshift_data.result_cache import get_result_cache_key
+    assert get_result_cache_key("select * from t where name = 'a  b'") != \
+        get_result_cache_key("select * from t where name = 'a b'")
+    assert get_result_cache_key("select  *  from t") == get_result_cache_key("select * from t;")
+
+
+def test_failure_to_cache_does_not_fail_fetching_the_result(index, emulator, monkeypatch):
+    import redshift_data.api as api
+    calls = []
+
+    def fail_to_cache(*_args):
+        calls.append(1)
+        raise RuntimeError('The conditional request failed')
+    monkeypatch.setattr(api, 'cache_result', fail_to_cache)
+    first = execute(index, 'first')
+    assert emulator.wait_for_finished_events(1)
+    emulator.deliver_finished_events(index.handler)
+    assert 'Records' in index.handler({STATEMENT_ID: first['Id'], ACTION: GET_STATEMENT_RESULT}, None)
+    assert calls == [1]
@@ -0,0 +1,99 @@
+import pytest
+from botocore.stub import Stubber, ANY
+
+from test import initialize_test_env
+
+
+@pytest.fixture()
+def sql_text():
+    initialize_test_env()
+    import sql_text
+    return sql_text
+
+
+def test_parameter_that_is_prefix_of_other_parameter(sql_text):
+    template = sql_text.parse_sql_template("select * from t where id = :id and other_id = :id2")
+    assert template.bind({"id": "1", "id2": "2"}) == "select * from t where id = '1' and other_id = '2'"
+
+
+def test_placeholders_are_not_detected_in_literals_comments_and_casts(sql_text):
+    sql_statement = """select id::varchar, ':a', "b:c", $$ :d $$ -- :e
+        from t /* :f */ where id = :id"""
+    template = sql_text.parse_sql_template(sql_statement)
+    assert template.parameter_names == {"id"}
+    assert template.bind({"id": "1"}) == sql_statement.replace(":id", "'1'")
+
+
+def test_bound_values_are_escaped(sql_text):
+    template = sql_text.parse_sql_template("select :name")
+    assert template.bind({"name": "O'Neil"}) == "select 'O''Neil'"
+    # Unescaped, the backslash would escape the first of the doubled quotes and the second would end the literal.
+    bound = template.bind({"name": "\\'; drop table t; --"})
+    assert bound == "select '\\\\''; drop table t; --'"
+    assert [match.group() for match in sql_text.SQL_TOKEN.finditer(bound)] == [bound[len("select "):]]
+
+
+def test_missing_parameter_value(sql_text):
+    with pytest.raises(sql_text.InvalidRequest):
+        sql_text.parse_sql_template("select :a, :b").bind({"a": "1"})
+
+
+def test_parameters_are_passed_to_data_api(sql_text):
+    from redshift_data import api
+    sql_statement = "select * from t where id = :id"
+    with Stubber(api.get_redshift_data_api()) as data_api_stub:
+        data_api_stub.add_response('execute_statement', {'Id': 'abc-123'}, {
+            'ClusterIdentifier': ANY, 'Database': ANY, 'DbUser': ANY, 'StatementName': 'name', 'WithEvent': False,
+            'Sql': sql_statement, 'Parameters': [{'name': 'id', 'value': '1'}],
+        })
+        api.execute_statement(sql_statement, 'name', False, params=[{'name': 'id', 'value': 1},
+                                                                    {'name': 'unused', 'value': 'x'}],
+                              inline_parameters=False)
+        data_api_stub.assert_no_pending_responses()
+
+
+def test_parameters_are_inlined_by_default(sql_text):
+    import index
+    from benchmark.emulator import Emulator
+    from event_labels import SQL_STATEMENT, PARAMETERS
+    sql_statement = "select * from exp_data where executionid = :execution_id and molid = :mol_id"
+    params = [{'name': 'execution_id', 'value': 'run-1'}, {'name': 'mol_id', 'value': '42'}]
+    # The SQL text of earlier versions, which replaced every placeholder by its quoted value.
+    previous_sql_statement = sql_statement
+    for param in params:
+        previous_sql_statement = previous_sql_statement.replace(':' + param['name'], "'" + param['value'] + "'")
+    emulator = Emulator(statement_duration=0.0)
+    with emulator.installed():
+        statement_id = index.handler({SQL_STATEMENT: sql_statement, PARAMETERS: params}, None)['Id']
+    assert emulator.redshift_data.statements[statement_id].query_string == previous_sql_statement
+
+
+def test_read_only_statements(sql_text):
+    assert sql_text.is_read_only_statement("  -- count\n SELECT count(*) FROM exp_data WHERE executionid = 'x'")
+    assert sql_text.is_read_only_statement("with ids as (select id from t) select * from ids where note = 'insert'")
+    assert not sql_text.is_read_only_statement("select * into new_table from t")
+    assert not sql_text.is_read_only_statement("with ids as (select id from t) delete from u using ids")
+    assert not sql_text.is_read_only_statement("call sp_my_proc(4)")
+
+
+def test_read_only_statements_only_call_allowed_functions(sql_text):
+    assert sql_text.is_read_only_statement(
+        "with ids as (select id from t where id in (1, 2)) select count(*), max(v::varchar(10)) over (partition by k) "
+        "from ids where exists (select 1 from u where lower(u.name) = 'f_write()')"
+    )
+    assert not sql_text.is_read_only_statement("select pg_terminate_backend(123)")
+    assert not sql_text.is_read_only_statement("SELECT f_write()")
+    assert not sql_text.is_read_only_statement("select public.lower(name) from t")
+    assert not sql_text.is_read_only_statement('select "f_write" (1)')
+    assert not sql_text.is_read_only_statement("select random()")
+
+
+def test_normalization_keeps_literals(sql_text):
+    assert sql_text.normalize_sql_statement(" select  *\n from t\twhere name = 'a  b' ; ") == \
+        "select * from t where name = 'a  b'"
+    assert sql_text.hash_sql_statement("select * from t where name = 'a  b'") != \
+        sql_text.hash_sql_statement("select * from t where name = 'a b'")
+    assert sql_text.normalize_sql_statement('select "a  b", $$ x  y $$ /* c  d */') == \
+        'select "a  b", $$ x  y $$ /* c  d */'
+    # A line comment ends at the line break, which is kept.
+    assert sql_text.normalize_sql_statement("-- count\n  select 1") == "-- count\nselect 1"
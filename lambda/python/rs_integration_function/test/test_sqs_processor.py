@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+from test import initialize_test_env
+
+
+@pytest.fixture()
+def processor_class():
+    initialize_test_env()
+    from sqs_processor import ConcurrentSQSProcessor
+    return ConcurrentSQSProcessor
+
+
+def make_records(amount):
+    return [{"messageId": str(i), "receiptHandle": str(i), "body": str(i)} for i in range(amount)]
+
+
+def test_records_are_handled_in_parallel(processor_class):
+    records = make_records(4)
+    all_records_started = threading.Barrier(len(records), timeout=5)
+
+    def record_handler(record):
+        # Only passes if all records are handled at the same time.
+        all_records_started.wait()
+        if record["body"] == "2":
+            raise ValueError("Failed callback")
+
+    processor = processor_class(max_workers=len(records))
+    processor(records, record_handler)
+    processor.process()
+    assert [r["messageId"] for r in processor.fail_messages] == ["2"]
+    assert sorted(r["messageId"] for r in processor.success_messages) == ["0", "1", "3"]
+
+
+def test_single_worker_handles_records_in_order(processor_class):
+    handled = []
+    processor = processor_class(max_workers=1)
+    processor(make_records(3), lambda record: handled.append(record["body"]))
+    processor.process()
+    assert handled == ["0", "1", "2"]
+
+
+def test_successful_records_are_deleted_when_others_fail(processor_class):
+    from aws_lambda_powertools.utilities.batch.exceptions import SQSBatchProcessingError
+    from benchmark.emulator import Emulator
+    emulator = Emulator()
+    records = [dict(record, eventSourceARN="arn:aws:sqs:eu-west-1:012345678910:finished")
+               for record in make_records(12)]
+
+    def record_handler(record):
+        if record["body"] == "2":
+            raise ValueError("Failed callback")
+
+    with emulator.installed():
+        processor = processor_class(max_workers=4)
+        with pytest.raises(SQSBatchProcessingError):
+            with processor(records, record_handler):
+                processor.process()
+    assert emulator.sqs.deleted_receipt_handles == {str(i) for i in range(12) if i != 2}
+    assert emulator.calls['sqs.DeleteMessageBatch'] == 2
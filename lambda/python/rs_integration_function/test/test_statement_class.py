@@ -0,0 +1,45 @@
+import pytest
+
+from test import initialize_test_env, EXECUTION
+
+
+@pytest.fixture()
+def statement_class():
+    initialize_test_env()
+    import statement_class
+    return statement_class
+
+
+def test_generated_ids_are_unique_and_sorted(statement_class):
+    ids = [statement_class.StatementName.generate_id() for _ in range(10000)]
+    assert len(set(ids)) == len(ids)
+    assert sorted(ids) == ids
+
+
+def test_ids_of_separate_processes_do_not_collide(statement_class):
+    generators = [statement_class.InvocationIdGenerator() for _ in range(2)]
+    for generator in generators:
+        generator._last_microseconds = 1792341823322703
+    assert generators[0].next_id() != generators[1].next_id()
+
+
+def test_ids_do_not_go_back_in_time(statement_class):
+    generator = statement_class.InvocationIdGenerator()
+    generator._last_microseconds = 10 ** 20
+    first, second = generator.next_id(), generator.next_id()
+    assert first < second
+
+
+def test_generated_id_is_parsed_by_statement_name(statement_class):
+    statement_name = statement_class.StatementName.from_execution_arn(EXECUTION)
+    parsed = statement_class.StatementName.from_str(str(statement_name))
+    assert parsed.execution_arn == EXECUTION and parsed.invocation_id == statement_name.invocation_id
+    assert statement_name.is_sfn_invocation()
+
+
+def test_ids_sort_after_ids_in_previous_format(statement_class):
+    previous_format_id = "1792341823.3227"
+    assert statement_class.StatementName.is_id(previous_format_id)
+    generator = statement_class.InvocationIdGenerator()
+    generator._last_microseconds = 1792341823322703
+    assert previous_format_id < generator.next_id()
@@ -0,0 +1,81 @@
+import pytest
+
+from event_labels import SQL_STATEMENT, STATEMENT_ID, ACTION, DESCRIBE_STATEMENT, CANCEL_STATEMENT, EXECUTION_ARN
+from test import EXECUTION
+
+
+@pytest.fixture()
+def index(index):
+    from redshift_data.statement_descriptions import memory_description_cache
+    memory_description_cache.clear()
+    return index
+
+
+def describe(index, statement_id: str) -> dict:
+    return index.handler({STATEMENT_ID: statement_id, ACTION: DESCRIBE_STATEMENT}, None)
+
+
+def test_completed_statement_is_described_from_memory(index):
+    from benchmark.emulator import Emulator
+    emulator = Emulator(statement_duration=0.0)
+    with emulator.installed():
+        statement_id = index.handler({SQL_STATEMENT: 'select 1'}, None)['Id']
+        description = describe(index, statement_id)
+        assert description['Status'] == 'FINISHED'
+        assert describe(index, statement_id) == description
+    assert emulator.calls['redshift-data.DescribeStatement'] == 1
+    # Describing a statement doesn't read the state table.
+    assert emulator.calls['dynamodb.GetItem'] == 0
+
+
+def test_running_statement_is_not_cached_by_default(index):
+    from benchmark.emulator import Emulator
+    emulator = Emulator(statement_duration=60.0)
+    with emulator.installed():
+        statement_id = index.handler({SQL_STATEMENT: 'select 1'}, None)['Id']
+        assert describe(index, statement_id)['Status'] == 'STARTED'
+        assert describe(index, statement_id)['Status'] == 'STARTED'
+    assert emulator.calls['redshift-data.DescribeStatement'] == 2
+
+
+def test_running_statement_is_described_from_memory_briefly(index, monkeypatch):
+    import redshift_data.api as api
+    from benchmark.emulator import Emulator
+    monkeypatch.setattr(api, 'describe_cache_seconds', 60.0)
+    emulator = Emulator(statement_duration=60.0)
+    with emulator.installed():
+        statement_id = index.handler({SQL_STATEMENT: 'select 1'}, None)['Id']
+        assert describe(index, statement_id)['Status'] == 'STARTED'
+        assert describe(index, statement_id)['Status'] == 'STARTED'
+        assert emulator.calls['redshift-data.DescribeStatement'] == 1
+        index.handler({ACTION: CANCEL_STATEMENT, STATEMENT_ID: statement_id}, None)
+        # The description of the running statement expired.
+        api.memory_description_cache.clear()
+        assert describe(index, statement_id)['Status'] == 'ABORTED'
+        assert describe(index, statement_id)['Status'] == 'ABORTED'
+    assert emulator.calls['redshift-data.DescribeStatement'] == 2
+
+
+def test_response_metadata_is_not_kept(index, monkeypatch):
+    import redshift_data.api as api
+    monkeypatch.setattr(api, 'describe_statement', lambda statement_id: {
+        'Id': statement_id, 'Status': 'FINISHED', 'ResponseMetadata': {'RequestId': 'first-request'},
+    })
+    describe(index, 'abc-123')
+    assert describe(index, 'abc-123') == {'Id': 'abc-123', 'Status': 'FINISHED'}
+
+
+def test_latest_statement_is_described_from_finished_event_details(index, ddb_stub):
+    from test.test_latest_statement import add_latest_item_response
+    add_latest_item_response(ddb_stub, {
+        'invocationId': {'S': index.StatementName.generate_id()},
+        'statement_id': {'S': 'abc-123'},
+        'finished_event_details': {'M': {
+            'time': {'S': '2021-06-01T12:00:00Z'},
+            'detail': {'M': {'statementId': {'S': 'abc-123'}, 'state': {'S': 'ABORTED'}, 'rows': {'N': '-1'}}},
+        }},
+    })
+    event = {STATEMENT_ID: 'LATEST', ACTION: DESCRIBE_STATEMENT, EXECUTION_ARN: EXECUTION}
+    assert index.describe_statement_for_event(event) == {
+        'Id': 'abc-123', 'Status': 'ABORTED', 'ResultRows': -1, 'UpdatedAt': '2021-06-01T12:00:00Z',
+    }
@@ -0,0 +1,67 @@
+import pytest
+from botocore.stub import Stubber
+
+from test import initialize_test_env
+
+COLUMN_METADATA = [{'name': 'id', 'typeName': 'int4'}]
+
+
+@pytest.fixture()
+def api():
+    initialize_test_env()
+    from redshift_data import api
+    return api
+
+
+@pytest.fixture()
+def data_api_stub(api):
+    with Stubber(api.get_redshift_data_api()) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def add_page(data_api_stub, records, next_token=None, expected_token=None):
+    response = {'Records': records, 'ColumnMetadata': COLUMN_METADATA, 'TotalNumRows': 3}
+    if next_token is not None:
+        response['NextToken'] = next_token
+    expected = {'Id': 'abc-123'}
+    if expected_token is not None:
+        expected['NextToken'] = expected_token
+    data_api_stub.add_response('get_statement_result', response, expected)
+
+
+def test_next_token_is_passed(api, data_api_stub):
+    add_page(data_api_stub, [[{'longValue': 1}]], expected_token='token')
+    api.get_statement_result('abc-123', next_token='token')
+
+
+def test_all_pages_are_returned_inline(api, data_api_stub):
+    add_page(data_api_stub, [[{'longValue': 1}], [{'longValue': 2}]], next_token='page2')
+    add_page(data_api_stub, [[{'longValue': 3}]], expected_token='page2')
+    result = api.get_full_statement_result('abc-123')
+    assert result['Records'] == [[{'longValue': 1}], [{'longValue': 2}], [{'longValue': 3}]]
+    assert 'NextToken' not in result
+
+
+def test_large_result_without_bucket_raises(api, data_api_stub, monkeypatch):
+    monkeypatch.setattr(api, 'MAX_INLINE_RESULT_SIZE', 10)
+    monkeypatch.delenv('RESULT_BUCKET', raising=False)
+    add_page(data_api_stub, [[{'longValue': 1}]])
+    with pytest.raises(api.ResultTooLarge):
+        api.get_full_statement_result('abc-123')
+
+
+def test_large_result_is_stored(api, data_api_stub, monkeypatch):
+    monkeypatch.setattr(api, 'MAX_INLINE_RESULT_SIZE', 10)
+    monkeypatch.setenv('RESULT_BUCKET', 'results')
+    add_page(data_api_stub, [[{'longValue': 1}]])
+    from aws_clients import get_client
+    with Stubber(get_client('s3')) as s3_stub:
+        s3_stub.add_response('put_object', {}, {
+            'Bucket': 'results', 'Key': 'statement_results/abc-123.json', 'Body': b'{"ColumnMetadata": [{"name": "id",'
+            b' "typeName": "int4"}], "TotalNumRows": 3, "Records": [[{"longValue": 1}]]}',
+            'ContentType': 'application/json'
+        })
+        result = api.get_full_statement_result('abc-123')
+    assert result['ResultLocation'] == {'Bucket': 'results', 'Key': 'statement_results/abc-123.json'}
+    assert 'Records' not in result
@@ -1,18 +1,24 @@
 import json
 import boto3
+import hashlib
 import os
+import shutil
 import subprocess
-import zlib
-import binascii
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 
-import psycopg2
-
+import ligand_format
+import redshift_connection
 from logger import logger
 
 s3 = boto3.resource('s3')
 
 SELECT_DATA_SQL = 'SELECT id, file_data::varchar FROM public.molecular_data where id='
+SELECT_LIGANDS_SQL = 'select id, file_data from public.molecular_data where id in '
+MAX_LIGANDS_PER_QUERY = 128
+# Memory a vina process of a small ligand needs, bounds the number of concurrent processes with the function memory.
+MEMORY_PER_VINA_MB = 1024
 INSERT_RESULT_SQL = "INSERT into exp_data(molid,executionid,score,result_data) VALUES "
 
 LIGAND_FILE_NAME = 'ligand.pdbqt'
@@ -21,119 +27,200 @@ OUT_FILE_NAME = 'vina_out.pdbqt'
 RECERVER_FILE_NAME = '4EK3_rec.pdbqt'
 
 projectPath = os.getenv("LAMBDA_TASK_ROOT")
+
+# vina is copied to /tmp once per container, the marker holds the checksum of the copied binary.
+VINA_PATH = '/tmp/vina'
+VINA_MARKER_PATH = '/tmp/vina.sha256'
+SCRATCH_DIR_PREFIX = 'dock-'
+vina_ready = False
 # Create SQS client
 sqs = boto3.client('sqs')
 
-global conn
-
 def handler(event, context):
+    '''
+        Dock the ligands of a batch of records. A record whose ligand could not be docked or reported is returned as
+        batch item failure, so only the failed records are retried.
+    '''
     
     init()
     
+    failures = []
+    jobs = []
     for record in event['Records']:
+        #logger.info(json.dumps(record))
         try:
-            #logger.info(json.dumps(record))
-            
             msg = json.loads(record['body'])
             # msg = msg[0]
             
-            mol_id = msg["molId"]
+            # Parsed here so that a malformed id only fails its own record.
+            mol_id = int(msg["molId"])
             execution_id = msg["executionId"]
-            
-            logger.info("mol id : " + str(mol_id) + ", execution_id" + execution_id)
-            
-            query_data_and_dock(mol_id,execution_id)
-            
-            
-        except Exception as e:
-            print(e)
-            raise(e)
+        except (ValueError, KeyError, TypeError):
+            logger.exception("invalid record " + record['messageId'])
+            failures.append(record['messageId'])
+            continue
         
-        finally:
-            clean_tmp_file()
-            
-    # return {
-    #     'statusCode': 200,
-    #     'body': json.dumps('Hello from Lambda!')
-    # }
+        logger.info("mol id : " + str(mol_id) + ", execution_id" + str(execution_id))
+        jobs.append((record['messageId'], mol_id, execution_id))
+    
+    # One query for the ligands of all records of the batch.
+    ligands = fetch_ligands([mol_id for _, mol_id, _ in jobs])
+    
+    dockings = []
+    for message_id, mol_id, execution_id in jobs:
+        file_data = ligands.get(mol_id)
+        if file_data is None:
+            logger.warning("no ligand for mol id : " + str(mol_id))
+            continue
+        dockings.append((message_id, mol_id, execution_id, file_data))
+    
+    if dockings:
+        workers, cpus = docking_concurrency(len(dockings))
+        logger.info("dock " + str(len(dockings)) + " ligands with " + str(workers) + " vina processes of "
+                    + str(cpus) + " cpus")
+        # The threads only wait for their vina processes, the docking itself runs in parallel processes.
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(dock_job, mol_id, execution_id, file_data, cpus): (message_id, mol_id)
+                       for message_id, mol_id, execution_id, file_data in dockings}
+            for future in as_completed(futures):
+                message_id, mol_id = futures[future]
+                try:
+                    future.result()
+                except Exception:
+                    # The other ligands of the batch are still docked, only this record is retried.
+                    logger.exception("docking failed for mol id : " + str(mol_id))
+                    failures.append(message_id)
+    
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failures]}
 
 def init():
-    command = 'rm -rf /tmp/*; cp ' + projectPath + '/vina /tmp/vina; chmod 755 /tmp/vina; '  
-                # + projectPath + '/test.conf /tmp/test.conf; chmod 644 /tmp/test.conf; cp ' \
-                # + projectPath + '/4EK3_rec.pdbqt /tmp/4EK3_rec.pdbqt; chmod 644 /tmp/4EK3_rec.pdbqt; ' 
-                # + projectPath + '/ligand.pdbqt /tmp/ligand.pdbqt; chmod 644 /tmp/ligand.pdbqt; ' 
-                
-    subprocess.check_output(command, shell=True, stderr=subprocess.STDOUT)
-    
+    '''
+        Prepare the container for docking once, warm invocations only check a flag. /tmp outlives the module when the
+        runtime is restarted in the same container, so an existing copy of vina is reused if its marker matches the
+        checksum of the packaged binary.
+    '''
     global queue_url
     queue_url = os.environ['docking_result_queue']
-
-def query_data_and_dock(mol_id,execution_id) :
     
+    global vina_ready
+    if vina_ready:
+        return
     
-    conn_string = "dbname='dev' port='5439' user='rsadmin' password='ABCDefg1234!!' host='10.0.0.41'"
-    global conn
-    conn = psycopg2.connect(conn_string)
-    conn.autocommit = True
-    #r = os.system('chmod +x ' + projectPath + '/vina')
+    checksum = file_checksum(projectPath + '/vina')
+    if read_marker() != checksum or not os.access(VINA_PATH, os.X_OK):
+        logger.info("copy vina to " + VINA_PATH)
+        # Copy next to the target and rename so a partial copy is never executed.
+        tmp_path = VINA_PATH + '.' + str(os.getpid())
+        shutil.copyfile(projectPath + '/vina', tmp_path)
+        os.chmod(tmp_path, 0o755)
+        os.replace(tmp_path, VINA_PATH)
+        with open(VINA_MARKER_PATH, 'w') as marker_file:
+            marker_file.write(checksum)
+    
+    # Scratch directories of jobs that did not complete, e.g. when the previous invocation timed out.
+    for name in os.listdir('/tmp'):
+        if name.startswith(SCRATCH_DIR_PREFIX):
+            clean_scratch_dir(os.path.join('/tmp', name))
+    
+    vina_ready = True
+
+def file_checksum(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as checked_file:
+        for chunk in iter(lambda: checked_file.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def read_marker():
+    try:
+        with open(VINA_MARKER_PATH) as marker_file:
+            return marker_file.read().strip()
+    except FileNotFoundError:
+        return None
+
+def fetch_ligands(mol_ids):
+    '''
+        The file_data of the molecules by integer id, molecules that do not exist are missing. The ids are looked up in
+        chunks of at most MAX_LIGANDS_PER_QUERY, each padded with its last id to a power of two so that only a few
+        statements are prepared per connection.
+    '''
+    ligands = {}
+    mol_ids = sorted(set(mol_ids))
+    with redshift_connection.connection() as conn:
+        with conn.cursor() as cursor:
+            for start in range(0, len(mol_ids), MAX_LIGANDS_PER_QUERY):
+                chunk = mol_ids[start:start + MAX_LIGANDS_PER_QUERY]
+                size = 1
+                while size < len(chunk):
+                    size *= 2
+                chunk += chunk[-1:] * (size - len(chunk))
+                statement = SELECT_LIGANDS_SQL + '(' + ', '.join('$' + str(i + 1) for i in range(size)) + ')'
+                redshift_connection.execute_prepared(cursor, 'select_ligands_' + str(size), statement,
+                                                     ['bigint'] * size, chunk)
+                for mol_id, file_data in cursor.fetchall():
+                    ligands[mol_id] = file_data
+    return ligands
+
+def docking_concurrency(job_count):
+    '''
+        The number of concurrent vina processes and the --cpu of each. Every process needs about MEMORY_PER_VINA_MB, the
+        vCPUs of the function are divided between the processes. DOCKING_CONCURRENCY overrides the number of processes.
+    '''
+    vcpus = os.cpu_count() or 1
+    memory_mb = int(os.getenv('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', str(MEMORY_PER_VINA_MB)))
+    workers = int(os.getenv('DOCKING_CONCURRENCY', '0')) or min(vcpus, max(1, memory_mb // MEMORY_PER_VINA_MB))
+    workers = max(1, min(workers, job_count))
+    return workers, max(1, vcpus // workers)
+
+def dock_job(mol_id,execution_id,file_data,cpus):
+    # Every job has its own scratch directory so that concurrent vina processes do not share files.
+    scratch_dir = tempfile.mkdtemp(prefix=SCRATCH_DIR_PREFIX, dir='/tmp')
+    try:
+        dock_ligand(mol_id,execution_id,file_data,scratch_dir,cpus)
+    finally:
+        clean_scratch_dir(scratch_dir)
+
+def dock_ligand(mol_id,execution_id,file_data,scratch_dir,cpus=1) :
     
-    # conn_string = "dbname='dev' port='5439' user='rsadmin' password='ABCDefg1234!!' host='10.0.0.41'"
-    # conn = psycopg2.connect(conn_string)
-    cursor = conn.cursor()
-    cursor.execute("select id, file_data from public.molecular_data where id = '" + str(mol_id) + "'")
-    #for record in cursor:
-    record = cursor.fetchone()
+    try:
+        file_data = ligand_format.decode_file_data(file_data)
+        
+        file_data = file_data.replace("'"," ")
+        #logger.info('decompress: ' + str(file_data))
+        
+        ligand_file = open(os.path.join(scratch_dir, LIGAND_FILE_NAME), "w")
+        ligand_file.write(file_data)
+        
+        ligand_file.close()
+        
+        #start to dock
+        dock_mol(mol_id,execution_id,scratch_dir,cpus)
+    except Exception as ve:
+        fail_reason = f"Encountered issue in docking:   {ve}"
+        logger.error(ve)
+        msg = {
+            "molId":mol_id,
+            "executionId": execution_id,
+            "score": 0,
+            "data": ""
+        }
+        report_result(msg)
     
-    cursor.close()
-    conn.close()
     
+def dock_mol(mol_id,execution_id,scratch_dir,cpus=1):
     
-    if record is not None:
-        try:
-            #logger.info(record)
-            file_data = record[1]
-            
-            file_data = binascii.unhexlify(file_data)
-            file_data = binascii.unhexlify(file_data)
-            
-            #logger.info('unhexlify: ' + file_data)
-            file_data = zlib.decompress(file_data)
-            file_data = file_data.decode('utf-8')
-            
-            file_data = file_data.replace("'"," ")
-            #logger.info('decompress: ' + str(file_data))
-            
-            ligand_file = open("/tmp/ligand.pdbqt", "w")
-            ligand_file.write(file_data)
-            
-            ligand_file.close()
-            
-            #start to dock
-            dock_mol(mol_id,execution_id)
-        except Exception as ve:
-            fail_reason = f"Encountered issue in docking:   {ve}"
-            logger.error(ve)
-            msg = {
-                "molId":mol_id,
-                "executionId": execution_id,
-                "score": 0,
-                "data": ""
-            }
-            report_result(msg)
-    
-    
-def dock_mol(mol_id,execution_id):
-    
-    vina = [ "/tmp/vina","--config",  projectPath + "/test.conf","--receptor",\
-            projectPath + "/4EK3_rec.pdbqt", "--ligand", "/tmp/ligand.pdbqt", \
-            "--out", "/tmp/vina_out.pdbqt"]
+    ligand_path = os.path.join(scratch_dir, LIGAND_FILE_NAME)
+    out_path = os.path.join(scratch_dir, OUT_FILE_NAME)
+    vina = [ VINA_PATH,"--config",  projectPath + "/test.conf","--receptor",\
+            projectPath + "/" + RECERVER_FILE_NAME, "--ligand", ligand_path, \
+            "--out", out_path, "--cpu", str(cpus)]
     subprocess.call(vina,timeout=800)
     # vina = "/tmp/vina --config /tmp/test.conf --receptor /tmp/4EK3_rec.pdbqt --ligand /tmp/1iep_ligand.pdbqt --out /tmp/vina_out.pdbqt"
     # output = subprocess.check_output(vina, shell=True)
     # logger.info(output)
     
     #open text file in read mode
-    text_file = open("/tmp/vina_out.pdbqt", "r")
+    text_file = open(out_path, "r")
     #read whole file to a string
     lines = text_file.readlines()
     
@@ -167,13 +254,8 @@ def report_result(msg):
     )
     logger.info('sent msg: '  +  msg_str[0:100] )
         
-def clean_tmp_file():
-    
-    # with open(LIGAND_FILE_NAME,'w') as ligand_file:
-    #     ligand_file.remove()
-    
-    # with open(OUT_FILE_NAME,'w') as out_file:
-    #     out_file.remove()
-    
-    return  
+def clean_scratch_dir(scratch_dir):
+    # Only the files of the job are removed, vina and anything else cached in /tmp stay for the next invocation.
+    shutil.rmtree(scratch_dir, ignore_errors=True)
+
         
\ No newline at end of file
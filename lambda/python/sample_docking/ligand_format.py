@@ -0,0 +1,47 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Storage format of molecular_data.file_data, the compressed pdbqt of a ligand.
+#
+#  - Legacy rows hold the hex text of the zlib compressed ligand, they are decoded from hex twice: once because
+#    Redshift returns VARBYTE as hex and once more for the stored text.
+#  - Versioned rows start with a format byte followed by the zlib compressed ligand. The first byte of a legacy row is
+#    always a hex digit, so both can be read side by side while migrate_ligand_format.py rewrites the legacy rows.
+
+import binascii
+import string
+import zlib
+
+FORMAT_ZLIB = 0x01
+LEGACY_FIRST_BYTES = string.hexdigits.encode('ascii')
+
+
+def encode(ligand):
+    '''
+        The stored bytes of a ligand in the current format.
+    '''
+    return bytes([FORMAT_ZLIB]) + zlib.compress(ligand.encode('utf-8'))
+
+
+def decode(stored):
+    '''
+        The ligand of stored bytes of any format.
+    '''
+    if not stored:
+        raise ValueError("empty ligand file_data")
+    if stored[0] == FORMAT_ZLIB:
+        compressed = stored[1:]
+    elif stored[0] in LEGACY_FIRST_BYTES:
+        compressed = binascii.unhexlify(stored)
+    else:
+        raise ValueError(f"unknown ligand file_data format {stored[0]}")
+    return zlib.decompress(compressed).decode('utf-8')
+
+
+def decode_file_data(file_data):
+    '''
+        The ligand of a file_data value as it is fetched, Redshift returns VARBYTE as hex text.
+    '''
+    if isinstance(file_data, str):
+        file_data = binascii.unhexlify(file_data)
+    return decode(bytes(file_data))
@@ -0,0 +1,59 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Rewrites the legacy rows of molecular_data.file_data to the versioned format of ligand_format.py, in batches of ids so
+# that every update is a short transaction. Rows that are already migrated are skipped, so the tool can be stopped and
+# run again. The conversion runs on the cluster, the ligands are not fetched:
+#
+#   legacy:    VARBYTE of the hex text of the compressed ligand
+#   versioned: FORMAT_ZLIB byte || the compressed ligand
+#
+# It connects like the docking function, with the clusterIdentifier, dbUser, dbName, endpoint_hostname and
+# endpoint_port environment variables, and the redshift_connection module of the layer:
+#
+#   PYTHONPATH=../redshift_connection_layer/python python migrate_ligand_format.py --batch-size 10000
+
+import argparse
+import time
+
+import redshift_connection
+from ligand_format import FORMAT_ZLIB
+from logger import logger
+
+FORMAT_HEX = '%02x' % FORMAT_ZLIB
+
+SELECT_ID_RANGE_SQL = 'select min(id), max(id) from public.molecular_data'
+LEGACY_ROWS_CONDITION = f"len(file_data) > 0 and substring(file_data, 1, 1) <> from_hex('{FORMAT_HEX}')"
+COUNT_LEGACY_SQL = f'select count(*) from public.molecular_data where {LEGACY_ROWS_CONDITION}'
+MIGRATE_BATCH_SQL = f'''update public.molecular_data
+    set file_data = from_hex('{FORMAT_HEX}') || from_hex(from_varbyte(file_data, 'utf8'))
+    where id >= %s and id < %s and {LEGACY_ROWS_CONDITION}'''
+
+
+def migrate(batch_size, dry_run=False):
+    with redshift_connection.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(COUNT_LEGACY_SQL)
+            legacy_rows = cursor.fetchone()[0]
+            logger.info(f"{legacy_rows} legacy rows")
+            if dry_run or legacy_rows == 0:
+                return 0
+
+            cursor.execute(SELECT_ID_RANGE_SQL)
+            min_id, max_id = cursor.fetchone()
+            migrated = 0
+            for start in range(min_id, max_id + 1, batch_size):
+                started = time.time()
+                cursor.execute(MIGRATE_BATCH_SQL, (start, start + batch_size))
+                migrated += cursor.rowcount
+                logger.info(f"ids {start} - {start + batch_size - 1}: {cursor.rowcount} rows migrated in "
+                            f"{time.time() - started:.1f}s, {migrated} of {legacy_rows}")
+            return migrated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rewrite ligand file_data to the versioned storage format.')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Ids per update statement.')
+    parser.add_argument('--dry-run', action='store_true', help='Only count the legacy rows.')
+    args = parser.parse_args()
+    migrate(args.batch_size, args.dry_run)
@@ -173,6 +173,21 @@ export interface SfnRedshiftTaskerProps {
    * multiple SfnRedshiftTaskers then you can reuse the powertoolsArn from the first instance.
    */
   readonly powertoolsArn?: string;
+
+  /**
+   * The name of an S3 bucket in which the Lambda functions store statement results that are too large to return inline
+   * (getStatementResult with fetchAll). The functions get read and write access to the objects under resultPrefix.
+   *
+   * @default - None, results that are too large to return inline fail the getStatementResult request.
+   */
+  readonly resultBucketName?: string;
+
+  /**
+   * The key prefix of the objects that the Lambda functions store in the bucket of resultBucketName.
+   *
+   * @default - statement_results/
+   */
+  readonly resultPrefix?: string;
 }
 
 /**
@@ -229,6 +244,8 @@ export class SfnRedshiftTasker extends cdk.Construct {
     let CLUSTER_IDENTIFIER = getRsProcedureStarterEnvProp('CLUSTER_IDENTIFIER');
     let DATABASE = getRsProcedureStarterEnvProp('DATABASE');
     let DB_USER = getRsProcedureStarterEnvProp('DB_USER');
+    let RESULT_BUCKET = getRsProcedureStarterEnvProp('RESULT_BUCKET');
+    let RESULT_PREFIX = getRsProcedureStarterEnvProp('RESULT_PREFIX');
 
     if (props.powertoolsArn === undefined) {
       let powertools = new sam.CfnApplication(this, 'Powertools', {
@@ -268,6 +285,7 @@ export class SfnRedshiftTasker extends cdk.Construct {
     };
     const existingTableErr = 'Must pass existing helper table via "existingTableObj" if createCallBackInfra is set to false';
     assert(props.createCallbackInfra || props.createCallbackInfra === undefined || props.existingTableObj !== undefined, existingTableErr);
+    assert(props.resultBucketName !== undefined || props.resultPrefix === undefined, 'resultPrefix requires resultBucketName');
 
     // When an existing lambda function is provided re-use it otherwise create one using the provided properties
     let lambdaDetails;
@@ -294,7 +312,7 @@ export class SfnRedshiftTasker extends cdk.Construct {
     this.trackingTable = lambda_ddb.dynamoTable;
 
     let allowRedshiftDataApiExecuteStatement = new iam.PolicyStatement({
-      actions: ['redshift-data:ExecuteStatement', 'redshift-data:DescribeStatement',
+      actions: ['redshift-data:ExecuteStatement', 'redshift-data:BatchExecuteStatement', 'redshift-data:DescribeStatement',
         'redshift-data:GetStatementResult', 'redshift-data:CancelStatement', 'redshift-data:ListStatements'],
       effect: iam.Effect.ALLOW,
       resources: ['*'],
@@ -324,6 +342,27 @@ export class SfnRedshiftTasker extends cdk.Construct {
     this.lambdaFunction.addToRolePolicy(allowRedshiftDataApiExecuteStatement);
     this.lambdaFunction.addToRolePolicy(allowRedshiftGetCredentials);
 
+    // Without a result bucket the functions don't store results in S3, results too large to return inline fail.
+    const configureResultBucket = (lambdaFunction: lambda.Function) => {
+      if (props.resultBucketName === undefined) {
+        return;
+      }
+      let resultPrefix = props.resultPrefix || 'statement_results/';
+      lambdaFunction.addEnvironment(RESULT_BUCKET, props.resultBucketName);
+      lambdaFunction.addEnvironment(RESULT_PREFIX, resultPrefix);
+      lambdaFunction.addToRolePolicy(new iam.PolicyStatement({
+        actions: ['s3:PutObject', 's3:GetObject'],
+        effect: iam.Effect.ALLOW,
+        resources: [
+          cdk.Fn.sub('arn:${AWS::Partition}:s3:::${BUCKET}/${PREFIX}*', {
+            BUCKET: props.resultBucketName,
+            PREFIX: resultPrefix,
+          }),
+        ],
+      }));
+    };
+    configureResultBucket(this.lambdaFunction);
+
     if (props.createCallbackInfra === undefined || props.createCallbackInfra) {
       let allowReportTaskOutcome = new iam.PolicyStatement({
         actions: ['states:SendTaskSuccess', 'states:SendTaskFailure'],
@@ -376,6 +415,9 @@ export class SfnRedshiftTasker extends cdk.Construct {
         existingQueueObj: eventQueue.sqsQueue,
       });
       completerIntegration.lambdaFunction.addToRolePolicy(allowReportTaskOutcome);
+      if (completerIntegration.lambdaFunction !== this.lambdaFunction) {
+        configureResultBucket(completerIntegration.lambdaFunction);
+      }
     } else {
       // No callback infrastructure needed
       let no_queue_err = 'Queue is part of SFN callback infra so cannot be provided if sfnCallbackSupport == false';
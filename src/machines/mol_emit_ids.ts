@@ -70,6 +70,7 @@ export class MolEmitIdsWorkflow {
             'taskToken': sfn.JsonPath.taskToken,
             'executionArn.$': '$$.Execution.Id',
             'sqlStatement.$': '$.idSqlStatement' , 
+            'inlineWaitSeconds': 5, // Complete short ID queries without waiting for the finished event
           }),
           heartbeat: Duration.seconds(300),
           resultPath: '$.executionDetails',
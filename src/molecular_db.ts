@@ -196,6 +196,14 @@ export class MolecularDb {
             visibilityTimeout:Duration.minutes(15),
     });
     
+    /**
+     * Pooled Redshift connections of the docking and docking result functions
+     */
+    const redshiftConnectionLayer = new lambda.LayerVersion(stack, 'redshift_connection_layer', {
+      code: Code.fromAsset(path.join(__dirname, '../lambda/python/redshift_connection_layer')),
+      compatibleRuntimes: [Runtime.PYTHON_3_8],
+    });
+    
     let resultDockingFunctionCode = Code.fromAsset(path.join(__dirname, '../lambda/python/molecule_object'));
     /**
      * Docking Result Lambda
@@ -204,9 +212,12 @@ export class MolecularDb {
       runtime: Runtime.PYTHON_3_8,
       handler: 'docking_result.handler',
       code: resultDockingFunctionCode,
+      layers: [redshiftConnectionLayer],
       environment: {...props},
     });
     
+    addFunctionRSPolicy(docking_result_func,props);
+    
     
     /**
      * Source SQS to docking Result Lambda  
@@ -238,7 +249,12 @@ export class MolecularDb {
       runtime: Runtime.PYTHON_3_8,
       handler: 'docking_lambda.handler',
       code: dockingFunctionCode,
+      layers: [redshiftConnectionLayer],
       environment: { "docking_result_queue": docking_result_queue.queueUrl, ...props},
+      // The ligands of a batch are docked by parallel vina processes of about 1 GB each, see docking_concurrency.
+      memorySize: 4096,
+      // Not longer than the visibility timeout of the data queue.
+      timeout: Duration.minutes(15),
     });
     
     new LambdaToSqs(this, 'LambdaToSqsForDockingResult', {
@@ -256,10 +272,16 @@ export class MolecularDb {
         existingLambdaObj: docking_mol_func,
         existingQueueObj: data_queue,
         sqsEventSourceProps:{
-          batchSize: 1, // default
+          // One ligand query and a parallel docking per batch, about as many records as vina processes run at once.
+          batchSize: 4,
           maxBatchingWindow: Duration.minutes(1)
         }
       });
+    // The handler returns the records that failed as batchItemFailures so only those are retried. The event source
+    // of this CDK version has no reportBatchItemFailures property yet.
+    docking_mol_func.node.findAll()
+      .filter((child): child is lambda.CfnEventSourceMapping => child instanceof lambda.CfnEventSourceMapping)
+      .forEach(mapping => mapping.addPropertyOverride('FunctionResponseTypes', ['ReportBatchItemFailures']));
     
     
 
@@ -2,7 +2,7 @@
 // SPDX-License-Identifier: MIT-0
 
 
-import { expect as expectCDK, countResources, haveResource } from '@aws-cdk/assert';
+import { expect as expectCDK, countResources, haveResource, haveResourceLike, arrayWith, objectLike } from '@aws-cdk/assert';
 import * as lambda from '@aws-cdk/aws-lambda';
 import * as cdk from '@aws-cdk/core';
 import { Duration } from '@aws-cdk/core';
@@ -113,3 +113,57 @@ test('Infrastructure completer with custom Lambda props', () => {
   expectCDK(stack).to(countResources('AWS::SQS::Queue', 2));
   expectCDK(stack).to(haveResource('AWS::Lambda::Function', { MemorySize: 2048 }));
 });
+
+test('Infrastructure with result bucket', () => {
+  const app = new cdk.App();
+  const stack = new cdk.Stack(app, 'TestStack');
+  new SfnRedshiftTasker(stack, 'MyTestConstruct',
+    {
+      redshiftTargetProps: {
+        dbUser: 'admin',
+        dbName: 'dev',
+        clusterIdentifier: 'my-fake-cluster-identifier',
+      },
+      resultBucketName: 'my-result-bucket',
+    });
+  // The function is configured to store large results in the bucket and may read and write under the result prefix.
+  expectCDK(stack).to(haveResourceLike('AWS::Lambda::Function', {
+    Environment: {
+      Variables: {
+        RESULT_BUCKET: 'my-result-bucket',
+        RESULT_PREFIX: 'statement_results/',
+      },
+    },
+  }));
+  expectCDK(stack).to(haveResourceLike('AWS::IAM::Policy', {
+    PolicyDocument: {
+      Statement: arrayWith(objectLike({
+        Action: ['s3:PutObject', 's3:GetObject'],
+        Effect: 'Allow',
+        Resource: {
+          'Fn::Sub': [
+            'arn:${AWS::Partition}:s3:::${BUCKET}/${PREFIX}*',
+            { BUCKET: 'my-result-bucket', PREFIX: 'statement_results/' },
+          ],
+        },
+      })),
+    },
+  }));
+});
+
+test('Infrastructure without result bucket', () => {
+  const app = new cdk.App();
+  const stack = new cdk.Stack(app, 'TestStack');
+  new SfnRedshiftTasker(stack, 'MyTestConstruct',
+    {
+      redshiftTargetProps: {
+        dbUser: 'admin',
+        dbName: 'dev',
+        clusterIdentifier: 'my-fake-cluster-identifier',
+      },
+    });
+  // Results are not spilled to S3 by default.
+  expectCDK(stack).notTo(haveResourceLike('AWS::Lambda::Function', {
+    Environment: { Variables: { RESULT_BUCKET: 'my-result-bucket' } },
+  }));
+});